@@ -12,7 +12,13 @@ import json
 
 # Import database connection management
 from database.connection import initialize_database, get_pool, close_pool
-from database.cache import close_redis, set_cache, get_redis_client
+from database.cache import (
+    close_redis,
+    set_cache,
+    get_redis_client,
+    config_invalidation_listener,
+    register_invalidation_handler,
+)
 from cachetools import TTLCache
 from lists import config
 
@@ -103,6 +109,14 @@ async def prefix_update_listener():
             print(f"Error in prefix_update_listener: {e}")
 
 
+def evict_prefix_cache(payload: dict):
+    """Drop a guild's cached prefix when its guild settings are invalidated."""
+    if payload.get("scope") == "guild_settings" and payload.get("key") in (None, "prefix"):
+        prefix_cache.pop(payload.get("guild_id"), None)
+
+
+register_invalidation_handler(evict_prefix_cache)
+
 bot = MyBot(command_prefix=get_prefix, intents=intents, help_command=None)
 bot.launch_time = discord.utils.utcnow()
 
@@ -421,6 +435,7 @@ async def on_ready():
     await update_launch_time_cache()
     await update_all_guild_member_caches()
     bot.loop.create_task(prefix_update_listener())
+    bot.loop.create_task(config_invalidation_listener())
 
 
 async def update_bot_guilds_cache():
@@ -0,0 +1,100 @@
+"""
+Micro-batching for AI moderation requests.
+
+Items submitted under the same key are collected for a short window (or until
+the batch is full) and handed to a flush callback as a single list. The
+callback returns one result per item, which is fanned back out to the callers
+awaiting ``submit``.
+"""
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+BATCHING_ENABLED = os.getenv("AI_BATCH_ENABLED", "false").lower() in ("1", "true", "yes")
+DEFAULT_BATCH_WINDOW_MS = int(os.getenv("AI_BATCH_WINDOW_MS", "250"))
+DEFAULT_BATCH_MAX_SIZE = int(os.getenv("AI_BATCH_MAX_SIZE", "8"))
+
+FlushCallback = Callable[[Hashable, List[Any]], Awaitable[List[Any]]]
+
+
+class MicroBatcher:
+    """Collects items per key and flushes them together.
+
+    Args:
+        flush: Coroutine called with ``(key, items)`` that returns a list of results
+            in the same order as ``items``.
+        window: Seconds to wait for more items after the first one arrives.
+        max_size: Flush immediately once a batch reaches this many items.
+    """
+
+    def __init__(self, flush: FlushCallback, window: Optional[float] = None, max_size: Optional[int] = None):
+        self.flush = flush
+        self.window = window if window is not None else DEFAULT_BATCH_WINDOW_MS / 1000
+        self.max_size = max(1, max_size if max_size is not None else DEFAULT_BATCH_MAX_SIZE)
+        self._batches: Dict[Hashable, List[Tuple[Any, asyncio.Future]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self._flush_tasks: set[asyncio.Task] = set()
+
+        self.batches_sent = 0
+        self.items_sent = 0
+
+    async def submit(self, key: Hashable, item: Any) -> Any:
+        """Add an item to the batch for ``key`` and wait for its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._batches.setdefault(key, [])
+        batch.append((item, future))
+
+        if len(batch) >= self.max_size:
+            self._flush_now(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.window, self._flush_now, key)
+        return await future
+
+    def pending(self) -> int:
+        """Number of items waiting for their batch to be flushed."""
+        return sum(len(batch) for batch in self._batches.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches_sent,
+            "items": self.items_sent,
+            "avg_batch_size": self.items_sent / self.batches_sent if self.batches_sent else 0.0,
+            "pending": self.pending(),
+        }
+
+    def _flush_now(self, key: Hashable) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._batches.pop(key, None)
+        if not batch:
+            return
+        task = asyncio.create_task(self._run_flush(key, batch))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _run_flush(self, key: Hashable, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        items = [item for item, _ in batch]
+        self.batches_sent += 1
+        self.items_sent += len(items)
+        try:
+            results = await self.flush(key, items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            future.set_result(results[index] if index < len(results) else None)
+
+    async def close(self) -> None:
+        """Flush everything still waiting and wait for in-flight flushes."""
+        for key in list(self._batches):
+            self._flush_now(key)
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
@@ -8,6 +8,8 @@ from database.operations import (
     set_guild_config as db_set_guild_config,
 )
 
+from .keyword_matcher import invalidate_guild_matcher
+
 # OpenRouter/LiteLLM configuration
 DEFAULT_AI_MODEL = "github_copilot/gpt-4.1"
 
@@ -255,7 +257,9 @@ async def get_message_rules(guild_id: int) -> list:
 
 async def set_message_rules(guild_id: int, rules: list) -> bool:
     """Set keyword/regex-based message rules."""
-    return await set_guild_config(guild_id, MESSAGE_RULES_KEY, rules)
+    success = await set_guild_config(guild_id, MESSAGE_RULES_KEY, rules)
+    invalidate_guild_matcher(guild_id)
+    return success
 
 
 async def get_vanity_lock(guild_id: int) -> Optional[str]:
@@ -0,0 +1,130 @@
+"""
+Content-hash cache for AI moderation decisions.
+
+Spam waves repeat the same text across channels and guilds. Decisions are keyed
+on the normalized message content, a hash of the rules text, the model and a
+short context tag describing the parts of the prompt that can change the
+verdict (author role, NSFW channel, reply), so an identical message judged
+under identical rules and context can reuse the earlier decision instead of
+paying for another LLM call. Entries live in a bounded in-process LRU with an
+optional Redis tier shared between processes.
+"""
+
+import copy
+import hashlib
+import os
+import re
+import unicodedata
+from typing import Any, Dict, Optional
+
+from cachetools import TTLCache
+
+from database.cache import get_cache, set_cache
+
+REDIS_KEY_PREFIX = "ai_decision_cache"
+
+_ZERO_WIDTH_RE = re.compile("[\u200b\u200c\u200d\u2060\ufeff]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_content(content: str) -> str:
+    """Normalize message text so trivially different copies hash the same."""
+    text = unicodedata.normalize("NFKC", content or "")
+    text = _ZERO_WIDTH_RE.sub("", text)
+    text = _WHITESPACE_RE.sub(" ", text)
+    return text.strip().casefold()
+
+
+def make_cache_key(content: str, rules_text: str, model: str, context: str = "") -> str:
+    """Build the cache key for a message judged under ``rules_text`` by ``model`` in ``context``."""
+    rules_hash = hashlib.sha256((rules_text or "").encode()).hexdigest()[:16]
+    digest = hashlib.sha256(normalize_content(content).encode()).hexdigest()
+    return f"{model}:{rules_hash}:{context}:{digest}"
+
+
+class DecisionCache:
+    """Two-tier (in-process LRU, optional Redis) cache of moderation decisions.
+
+    Args:
+        maxsize: Maximum number of decisions held in process.
+        ttl: Seconds a decision stays valid in either tier.
+        use_redis: Whether to read and write the shared Redis tier.
+        min_length: Messages shorter than this (after normalization) are never cached.
+    """
+
+    def __init__(
+        self,
+        maxsize: Optional[int] = None,
+        ttl: Optional[int] = None,
+        use_redis: Optional[bool] = None,
+        min_length: Optional[int] = None,
+    ):
+        self.maxsize = maxsize if maxsize is not None else int(os.getenv("AI_DECISION_CACHE_SIZE", "10000"))
+        self.ttl = ttl if ttl is not None else int(os.getenv("AI_DECISION_CACHE_TTL", "3600"))
+        if use_redis is None:
+            use_redis = os.getenv("AI_DECISION_CACHE_REDIS", "true").lower() in ("1", "true", "yes")
+        self.use_redis = use_redis
+        self.min_length = min_length if min_length is not None else int(os.getenv("AI_DECISION_CACHE_MIN_LENGTH", "8"))
+        self._local: TTLCache = TTLCache(maxsize=max(1, self.maxsize), ttl=self.ttl)
+
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def is_cacheable(self, content: str) -> bool:
+        return self.maxsize > 0 and len(normalize_content(content)) >= self.min_length
+
+    async def get(self, content: str, rules_text: str, model: str, context: str = "") -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached decision, or None on a miss."""
+        if not self.is_cacheable(content):
+            return None
+        key = make_cache_key(content, rules_text, model, context)
+
+        decision = self._local.get(key)
+        if decision is not None:
+            self.local_hits += 1
+            return copy.deepcopy(decision)
+
+        if self.use_redis:
+            try:
+                decision = await get_cache(f"{REDIS_KEY_PREFIX}:{key}")
+            except Exception as e:
+                print(f"DecisionCache: Redis lookup failed: {e}")
+                decision = None
+            if isinstance(decision, dict):
+                self.redis_hits += 1
+                self._local[key] = decision
+                return copy.deepcopy(decision)
+
+        self.misses += 1
+        return None
+
+    async def set(self, content: str, rules_text: str, model: str, decision: Dict[str, Any], context: str = "") -> None:
+        """Store a decision for later identical messages."""
+        if not decision or not self.is_cacheable(content):
+            return
+        key = make_cache_key(content, rules_text, model, context)
+        stored = copy.deepcopy(decision)
+        self._local[key] = stored
+        self.stores += 1
+        if self.use_redis:
+            try:
+                await set_cache(f"{REDIS_KEY_PREFIX}:{key}", stored, expire=self.ttl)
+            except Exception as e:
+                print(f"DecisionCache: Redis store failed: {e}")
+
+    def clear(self) -> None:
+        self._local.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.local_hits + self.redis_hits
+        lookups = hits + self.misses
+        return {
+            "size": len(self._local),
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
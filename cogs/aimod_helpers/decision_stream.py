@@ -0,0 +1,139 @@
+"""
+Incremental parsing of a streamed moderation decision.
+
+The model is asked to emit ``violation``, ``rule_violated`` and ``action``
+before ``reasoning``. ``StreamingDecisionParser`` scans the response as it
+arrives and exposes those verdict fields as soon as they are complete, so an
+action can start while the reasoning is still streaming. Text before the
+opening brace (code fences, chatter) is skipped, and nested values are
+tolerated but not reported.
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+STREAMING_ENABLED = os.getenv("AI_STREAMING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+VERDICT_FIELDS = ("violation", "rule_violated", "action")
+
+_EXPECT_KEY = "key"
+_EXPECT_COLON = "colon"
+_EXPECT_VALUE = "value"
+_AFTER_VALUE = "after"
+
+
+class StreamingDecisionParser:
+    """Feed response text chunk by chunk and read top-level decision fields as they complete."""
+
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.complete = False
+        self._chunks: List[str] = []
+        self._object_chars: List[str] = []
+        self._depth = 0
+        self._state = _EXPECT_KEY
+        self._key: Optional[str] = None
+        self._in_string = False
+        self._escape = False
+        self._token: List[str] = []
+        self._literal: List[str] = []
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far."""
+        return "".join(self._chunks)
+
+    @property
+    def verdict(self) -> Optional[Dict[str, Any]]:
+        """The verdict fields once all of them are known, otherwise None."""
+        if all(name in self.fields for name in VERDICT_FIELDS):
+            return {name: self.fields[name] for name in VERDICT_FIELDS}
+        return None
+
+    def decision(self) -> Optional[Dict[str, Any]]:
+        """The fully parsed decision object, or None if it has not closed or is not valid JSON."""
+        if not self.complete:
+            return None
+        try:
+            return json.loads("".join(self._object_chars))
+        except json.JSONDecodeError:
+            return None
+
+    def feed(self, chunk: str) -> None:
+        self._chunks.append(chunk)
+        for char in chunk:
+            if self.complete:
+                return
+            self._consume(char)
+
+    def _consume(self, char: str) -> None:
+        if self._depth == 0:
+            if char == "{":
+                self._depth = 1
+                self._object_chars.append(char)
+            return
+        self._object_chars.append(char)
+
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                self._end_string()
+                return
+            self._token.append(char)
+            return
+
+        if char == '"':
+            self._in_string = True
+            self._token = []
+        elif char in "{[":
+            self._depth += 1
+        elif char in "}]":
+            if self._depth == 1:
+                self._end_literal()
+            self._depth -= 1
+            if self._depth == 1:
+                # A nested value just closed.
+                self._state = _AFTER_VALUE
+            elif self._depth == 0:
+                self.complete = True
+        elif self._depth > 1:
+            return
+        elif char == ":":
+            self._state = _EXPECT_VALUE
+        elif char == ",":
+            self._end_literal()
+            self._state = _EXPECT_KEY
+        elif char.isspace():
+            self._end_literal()
+        elif self._state == _EXPECT_VALUE:
+            self._literal.append(char)
+
+    def _end_string(self) -> None:
+        if self._depth != 1:
+            return
+        try:
+            value = json.loads('"' + "".join(self._token) + '"')
+        except json.JSONDecodeError:
+            value = "".join(self._token)
+        if self._state == _EXPECT_KEY:
+            self._key = value
+            self._state = _EXPECT_COLON
+        elif self._state == _EXPECT_VALUE:
+            self.fields[self._key] = value
+            self._state = _AFTER_VALUE
+
+    def _end_literal(self) -> None:
+        if not self._literal:
+            return
+        raw = "".join(self._literal)
+        self._literal = []
+        try:
+            self.fields[self._key] = json.loads(raw)
+        except json.JSONDecodeError:
+            self.fields[self._key] = raw
+        self._state = _AFTER_VALUE
@@ -0,0 +1,221 @@
+"""
+Rate limiting for guild-supplied (bring-your-own) API keys.
+
+Each credential gets a token bucket sized to its provider's request rate and a
+semaphore capping concurrent requests. Work beyond the budget waits briefly and
+is shed once the wait would exceed ``max_wait`` or too many requests are
+already queued, instead of hammering the provider into 429s. When enabled, a
+per-minute Redis counter makes several bot processes share one budget per key.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Optional
+
+from database.cache import get_redis
+
+REDIS_KEY_PREFIX = "byok_rate"
+
+# Requests per minute and concurrent requests allowed per credential, by provider.
+DEFAULT_PROVIDER_LIMITS: Dict[str, Dict[str, int]] = {
+    "openai": {"rpm": 500, "concurrency": 16},
+    "anthropic": {"rpm": 50, "concurrency": 5},
+    "openrouter": {"rpm": 60, "concurrency": 8},
+    "gemini": {"rpm": 60, "concurrency": 8},
+    "github_copilot": {"rpm": 30, "concurrency": 4},
+    "default": {"rpm": 60, "concurrency": 8},
+}
+
+
+def _load_provider_limits() -> Dict[str, Dict[str, int]]:
+    limits = {provider: dict(values) for provider, values in DEFAULT_PROVIDER_LIMITS.items()}
+    raw = os.getenv("BYOK_RATE_LIMITS")
+    if raw:
+        try:
+            for provider, values in json.loads(raw).items():
+                limits.setdefault(provider, dict(limits["default"])).update(values)
+        except (ValueError, AttributeError) as e:
+            print(f"KeyRateLimiter: Ignoring invalid BYOK_RATE_LIMITS: {e}")
+    return limits
+
+
+class KeyRateLimitExceeded(Exception):
+    """Raised when a request is shed because its API key is over budget."""
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at ``rate`` tokens per second."""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._clock = clock
+        self._updated = clock()
+        self._blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self) -> float:
+        """Take a token; return 0 on success or the seconds until one is available."""
+        now = self._clock()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def give_back(self) -> None:
+        """Return a token taken for a request that was not sent."""
+        self._refill(self._clock())
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def block(self, seconds: float) -> None:
+        """Refuse tokens for ``seconds``, e.g. after the provider answered 429."""
+        now = self._clock()
+        self._refill(now)
+        self.tokens = 0.0
+        self._blocked_until = max(self._blocked_until, now + seconds)
+
+
+class _KeyState:
+    def __init__(self, provider: str, rpm: int, concurrency: int):
+        self.provider = provider
+        self.rpm = rpm
+        self.bucket = TokenBucket(rate=rpm / 60, capacity=max(1, min(rpm, concurrency * 2)))
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.concurrency = concurrency
+        self.waiting = 0
+
+
+class KeyRateLimiter:
+    """Per-credential token bucket and concurrency limit.
+
+    Args:
+        max_wait: Longest a request may wait for budget before it is shed.
+        max_queue: Requests allowed to wait per key before new ones are shed.
+        use_redis: Whether to share the per-minute budget across processes via Redis.
+    """
+
+    def __init__(
+        self,
+        max_wait: Optional[float] = None,
+        max_queue: Optional[int] = None,
+        use_redis: Optional[bool] = None,
+    ):
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv("BYOK_MAX_WAIT", "10"))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("BYOK_MAX_QUEUE", "50"))
+        if use_redis is None:
+            use_redis = os.getenv("BYOK_RATE_LIMIT_REDIS", "false").lower() in ("1", "true", "yes")
+        self.use_redis = use_redis
+        self.provider_limits = _load_provider_limits()
+        self._keys: Dict[str, _KeyState] = {}
+
+        self.admitted = 0
+        self.delayed = 0
+        self.shed = 0
+        self.provider_throttles = 0
+
+    @staticmethod
+    def credential_id(provider: str, credential: str) -> str:
+        """Stable identifier for a credential that never exposes the secret itself."""
+        digest = hashlib.sha256(credential.encode()).hexdigest()[:16]
+        return f"{provider}:{digest}"
+
+    def _state(self, provider: str, credential: str) -> tuple[str, _KeyState]:
+        key_id = self.credential_id(provider, credential)
+        state = self._keys.get(key_id)
+        if state is None:
+            limits = self.provider_limits.get(provider, self.provider_limits["default"])
+            state = self._keys[key_id] = _KeyState(provider, limits["rpm"], limits["concurrency"])
+        return key_id, state
+
+    async def _redis_wait(self, key_id: str, rpm: int) -> float:
+        """Count this request in the shared per-minute window; return seconds to wait if over."""
+        redis = await get_redis()
+        if redis is None:
+            return 0.0
+        now = time.time()
+        window = int(now // 60)
+        redis_key = f"{REDIS_KEY_PREFIX}:{key_id}:{window}"
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.incr(redis_key)
+                pipe.expire(redis_key, 120)
+                count, _ = await pipe.execute()
+        except Exception as e:
+            print(f"KeyRateLimiter: Redis budget check failed: {e}")
+            return 0.0
+        return 0.0 if count <= rpm else (window + 1) * 60 - now
+
+    @asynccontextmanager
+    async def limit(self, provider: str, credential: str):
+        """Hold a slot for one request made with ``credential``, waiting or shedding as needed."""
+        key_id, state = self._state(provider, credential)
+        if state.waiting >= self.max_queue:
+            self.shed += 1
+            raise KeyRateLimitExceeded(f"Too many queued requests for {provider} key {key_id}")
+
+        deadline = time.monotonic() + self.max_wait
+        state.waiting += 1
+        waited = False
+        try:
+            while True:
+                wait = state.bucket.try_take()
+                if wait == 0 and self.use_redis:
+                    wait = await self._redis_wait(key_id, state.rpm)
+                    if wait:
+                        # The shared budget is spent, so the local token goes unused
+                        state.bucket.give_back()
+                if wait == 0:
+                    break
+                if time.monotonic() + wait > deadline:
+                    self.shed += 1
+                    raise KeyRateLimitExceeded(f"Rate budget exhausted for {provider} key {key_id}")
+                waited = True
+                await asyncio.sleep(wait)
+
+            remaining = max(0.0, deadline - time.monotonic())
+            try:
+                await asyncio.wait_for(state.semaphore.acquire(), timeout=remaining)
+            except asyncio.TimeoutError:
+                state.bucket.give_back()
+                self.shed += 1
+                raise KeyRateLimitExceeded(f"Concurrency limit reached for {provider} key {key_id}") from None
+            except asyncio.CancelledError:
+                state.bucket.give_back()
+                raise
+        finally:
+            state.waiting -= 1
+
+        self.admitted += 1
+        if waited:
+            self.delayed += 1
+        try:
+            yield
+        finally:
+            state.semaphore.release()
+
+    def throttled(self, provider: str, credential: str, retry_after: Optional[float] = None) -> None:
+        """Record that the provider rate limited ``credential`` and pause its bucket."""
+        _, state = self._state(provider, credential)
+        self.provider_throttles += 1
+        state.bucket.block(retry_after if retry_after else 60 / max(1, state.rpm) * 5)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "keys": len(self._keys),
+            "admitted": self.admitted,
+            "delayed": self.delayed,
+            "shed": self.shed,
+            "provider_throttles": self.provider_throttles,
+            "waiting": sum(state.waiting for state in self._keys.values()),
+        }
@@ -0,0 +1,181 @@
+"""
+Compiled keyword/regex matcher for AI keyword rules.
+
+``AI_KEYWORD_RULES`` is a list of rules, each with optional ``keywords``
+(case-insensitive substrings) and ``regex`` patterns. The first rule in list
+order that matches a message wins. Rules are compiled once per rules version
+into an Aho-Corasick automaton for keywords and precompiled regexes, with a
+combined alternation for a fast "nothing matches" path, so matching cost stays
+flat as guilds add rules.
+"""
+
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from cachetools import LRUCache
+
+from database.cache import register_invalidation_handler
+
+MESSAGE_RULES_KEY = "AI_KEYWORD_RULES"
+MATCHER_CACHE_SIZE = int(os.getenv("AI_KEYWORD_MATCHER_CACHE_SIZE", "5000"))
+
+NO_MATCH = float("inf")
+
+
+class AhoCorasick:
+    """Multi-pattern substring automaton returning the lowest payload that matches."""
+
+    def __init__(self, patterns: List[Tuple[str, int]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._best: List[float] = [NO_MATCH]
+
+        for pattern, payload in patterns:
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(NO_MATCH)
+                node = next_node
+            self._best[node] = min(self._best[node], payload)
+
+        # Breadth-first pass to build failure links and fold outputs along them.
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._best[child] = min(self._best[child], self._best[self._fail[child]])
+                queue.append(child)
+
+    def search(self, text: str, stop_at: float = 0) -> float:
+        """Return the lowest payload found in ``text`` (``NO_MATCH`` if none).
+
+        Scanning stops early once a payload ``<= stop_at`` is found.
+        """
+        goto, fail, best_at = self._goto, self._fail, self._best
+        best = best_at[0]
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if best_at[node] < best:
+                best = best_at[node]
+                if best <= stop_at:
+                    break
+        return best
+
+
+class KeywordRuleMatcher:
+    """Matcher compiled from a list of keyword rules, preserving first-rule-wins order."""
+
+    def __init__(self, rules: List[Dict[str, Any]]):
+        self.rules = list(rules or [])
+        keyword_patterns: List[Tuple[str, int]] = []
+        self._regexes: List[Tuple[int, "re.Pattern[str]"]] = []
+        combinable: List[str] = []
+
+        for index, rule in enumerate(self.rules):
+            if not isinstance(rule, dict):
+                continue
+            for keyword in rule.get("keywords", []) or []:
+                if isinstance(keyword, str):
+                    keyword_patterns.append((keyword.lower(), index))
+            for pattern in rule.get("regex", []) or []:
+                try:
+                    compiled = re.compile(pattern, re.IGNORECASE)
+                except (re.error, TypeError):
+                    continue
+                self._regexes.append((index, compiled))
+                # Patterns with groups could clash with each other's backreferences once combined.
+                if compiled.groups == 0:
+                    combinable.append(f"(?:{pattern})")
+
+        self._keywords = AhoCorasick(keyword_patterns) if keyword_patterns else None
+        self._first_keyword_rule = min((payload for _, payload in keyword_patterns), default=NO_MATCH)
+        self._combined = None
+        if self._regexes and len(combinable) == len(self._regexes):
+            try:
+                self._combined = re.compile("|".join(combinable), re.IGNORECASE)
+            except re.error:
+                self._combined = None
+
+    def match_index(self, content: str) -> Optional[int]:
+        """Return the index of the first matching rule, or None."""
+        content = content or ""
+        best = NO_MATCH
+        if self._keywords is not None:
+            best = self._keywords.search(content.lower(), stop_at=self._first_keyword_rule)
+
+        if self._regexes and (self._combined is None or self._combined.search(content)):
+            for index, compiled in self._regexes:
+                if index >= best:
+                    break
+                if compiled.search(content):
+                    best = index
+                    break
+
+        return None if best == NO_MATCH else int(best)
+
+    def match(self, content: str) -> Optional[Dict[str, Any]]:
+        """Return the first matching rule, or None."""
+        index = self.match_index(content)
+        return self.rules[index] if index is not None else None
+
+
+def rules_fingerprint(rules: List[Dict[str, Any]]) -> str:
+    """Stable hash of a rules list, used as its version."""
+    encoded = json.dumps(rules or [], sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+_compiled_by_fingerprint: LRUCache = LRUCache(maxsize=MATCHER_CACHE_SIZE)
+# guild_id -> (rules object last seen, matcher); lets warm lookups skip fingerprinting.
+_guild_matchers: LRUCache = LRUCache(maxsize=MATCHER_CACHE_SIZE)
+
+
+def compile_rules(rules: List[Dict[str, Any]]) -> KeywordRuleMatcher:
+    """Return a compiled matcher for ``rules``, reusing one built for an identical version."""
+    fingerprint = rules_fingerprint(rules)
+    matcher = _compiled_by_fingerprint.get(fingerprint)
+    if matcher is None:
+        matcher = KeywordRuleMatcher(rules)
+        _compiled_by_fingerprint[fingerprint] = matcher
+    return matcher
+
+
+def get_guild_matcher(guild_id: int, rules: List[Dict[str, Any]]) -> KeywordRuleMatcher:
+    """Return the compiled matcher for a guild's current rules."""
+    cached = _guild_matchers.get(guild_id)
+    if cached is not None and cached[0] is rules:
+        return cached[1]
+    matcher = compile_rules(rules)
+    _guild_matchers[guild_id] = (rules, matcher)
+    return matcher
+
+
+def invalidate_guild_matcher(guild_id: Optional[int] = None) -> None:
+    """Forget the compiled matcher for a guild, or for every guild."""
+    if guild_id is None:
+        _guild_matchers.clear()
+        return
+    _guild_matchers.pop(guild_id, None)
+
+
+def _on_config_invalidation(payload: Dict[str, Any]) -> None:
+    if payload.get("scope") == "guild_config" and payload.get("key") in (None, MESSAGE_RULES_KEY):
+        invalidate_guild_matcher(payload.get("guild_id"))
+
+
+register_invalidation_handler(_on_config_invalidation)
@@ -3,11 +3,21 @@ LiteLLM configuration module for OpenRouter integration.
 This module handles the setup and configuration of LiteLLM with OpenRouter as the backend provider.
 """
 
+import asyncio
+import functools
+import json
+import math
 import os
-from typing import Dict, Any, Optional, List
+import time
+from collections import deque
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Dict, Any, Optional, List, Tuple
+import httpx
 import litellm
 from litellm import acompletion
 
+from .key_rate_limiter import KeyRateLimiter, KeyRateLimitExceeded
+
 # Configure LiteLLM settings
 litellm.set_verbose = False  # Set to True for debugging
 litellm.drop_params = True  # Drop unsupported parameters instead of erroring
@@ -41,6 +51,250 @@ DEFAULT_GENERATION_CONFIG = {
     "presence_penalty": 0.0,
 }
 
+# Headers required by the GitHub Copilot backend and ignored by other providers
+COPILOT_EXTRA_HEADERS = {
+    "editor-version": "vscode/1.85.1",
+    "Copilot-Integration-Id": "vscode-chat",
+}
+
+# Shared HTTP connection pool settings
+HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "120"))
+HTTP2_ENABLED = os.getenv("LLM_HTTP2", "true").lower() in ("1", "true", "yes")
+
+# Per-model circuit breaker settings
+BREAKER_WINDOW_SECONDS = float(os.getenv("LLM_BREAKER_WINDOW", "60"))
+BREAKER_MIN_REQUESTS = int(os.getenv("LLM_BREAKER_MIN_REQUESTS", "5"))
+BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+# Route to the fallback first while the primary's p95 latency exceeds this (0 disables)
+SLOW_P95_SECONDS = float(os.getenv("LLM_SLOW_P95_SECONDS", "0"))
+
+# Opt-in request hedging: if a call outlives the model's latency percentile, race a second one
+HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+# Delay used until a model has enough samples for a meaningful percentile
+HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "5"))
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# "same" re-sends to the same model, "fallback" sends the hedge to FALLBACK_MODEL
+HEDGE_TARGET = os.getenv("LLM_HEDGE_TARGET", "same")
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+# Errors caused by the request or the caller's key say nothing about the model's health
+CLIENT_ERRORS = (
+    litellm.AuthenticationError,
+    litellm.BadRequestError,
+    litellm.NotFoundError,
+    litellm.UnprocessableEntityError,
+)
+
+
+# Models known to accept image parts that LiteLLM's model map does not flag as vision-capable
+VISION_MODELS = {
+    name.strip()
+    for name in os.getenv("AI_VISION_MODELS", "github_copilot/gpt-4.1,github_copilot/gpt-4o").split(",")
+    if name.strip()
+}
+
+
+@functools.lru_cache(maxsize=256)
+def model_supports_vision(model_name: str) -> bool:
+    """Whether image parts can be sent to ``model_name``."""
+    if model_name in VISION_MODELS:
+        return True
+    try:
+        return bool(litellm.supports_vision(model=model_name))
+    except Exception:
+        return False
+
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional ``h2`` package."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def build_http_client(http2: bool = False) -> httpx.AsyncClient:
+    """
+    Create the pooled async HTTP client shared by every LLM request.
+
+    Args:
+        http2: Whether to negotiate HTTP/2 (requires the ``h2`` package)
+
+    Returns:
+        httpx.AsyncClient with keep-alive, connection limits and HTTP/2 when available
+    """
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=10.0),
+        follow_redirects=True,
+    )
+
+
+def provider_for_model(model_name: str) -> str:
+    """Best-effort LiteLLM provider name for a model, used to pick rate limits."""
+    try:
+        return litellm.get_llm_provider(model_name)[1]
+    except Exception:
+        return model_name.split("/", 1)[0] if "/" in model_name else "default"
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds from a provider's Retry-After header, if it sent one."""
+    try:
+        return float(error.response.headers["retry-after"])
+    except Exception:
+        return None
+
+
+class ModelUnavailableError(Exception):
+    """Raised when every candidate model has an open circuit."""
+
+
+class ModelHealth:
+    """
+    Rolling error rate and latency for one model, with an open/half-open circuit breaker.
+
+    The circuit opens when the error rate over the window reaches the threshold.
+    After the cooldown a single probe request is let through (half-open); its
+    success closes the circuit and its failure opens it again.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        window: float = BREAKER_WINDOW_SECONDS,
+        min_requests: int = BREAKER_MIN_REQUESTS,
+        error_rate: float = BREAKER_ERROR_RATE,
+        cooldown: float = BREAKER_COOLDOWN_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the health tracker.
+
+        Args:
+            model: Model name being tracked
+            window: Seconds of history used for the error rate and p95
+            min_requests: Samples required before the circuit may open
+            error_rate: Failure ratio that opens the circuit
+            cooldown: Seconds the circuit stays open before a probe is allowed
+            clock: Monotonic time source
+        """
+        self.model = model
+        self.window = window
+        self.min_requests = min_requests
+        self.error_rate_threshold = error_rate
+        self.cooldown = cooldown
+        self._clock = clock
+        self._samples: deque = deque(maxlen=1000)  # (timestamp, ok, latency)
+        self.state = CIRCUIT_CLOSED
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self.times_opened = 0
+        self.short_circuited = 0
+
+    def _prune(self):
+        cutoff = self._clock() - self.window
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+
+    def error_rate(self) -> float:
+        self._prune()
+        if not self._samples:
+            return 0.0
+        return sum(1 for _, ok, _ in self._samples if not ok) / len(self._samples)
+
+    def sample_count(self) -> int:
+        self._prune()
+        return len(self._samples)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Latency (seconds) at ``percent`` over the window, or None without samples."""
+        self._prune()
+        if not self._samples:
+            return None
+        latencies = sorted(latency for _, _, latency in self._samples)
+        return latencies[max(0, math.ceil(percent / 100 * len(latencies)) - 1)]
+
+    def p95(self) -> Optional[float]:
+        return self.percentile(95)
+
+    def available(self) -> bool:
+        """Whether a request could currently be sent, without claiming the probe slot."""
+        if self.state == CIRCUIT_CLOSED:
+            return True
+        if self.state == CIRCUIT_OPEN:
+            return self._clock() - self.opened_at >= self.cooldown
+        return not self._probe_in_flight
+
+    def try_acquire(self) -> bool:
+        """Claim permission to send a request, moving an expired open circuit to half-open."""
+        if self.state == CIRCUIT_OPEN and self._clock() - self.opened_at >= self.cooldown:
+            self.state = CIRCUIT_HALF_OPEN
+        if self.state == CIRCUIT_CLOSED:
+            return True
+        if self.state == CIRCUIT_HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.short_circuited += 1
+        return False
+
+    def _open(self):
+        self.state = CIRCUIT_OPEN
+        self.opened_at = self._clock()
+        self.times_opened += 1
+
+    def record_success(self, latency: float):
+        if self.state == CIRCUIT_HALF_OPEN:
+            # Start the recovered model with a clean window.
+            self._samples.clear()
+            self.state = CIRCUIT_CLOSED
+        self._samples.append((self._clock(), True, latency))
+        self._probe_in_flight = False
+
+    def record_failure(self, latency: float):
+        self._samples.append((self._clock(), False, latency))
+        if self.state == CIRCUIT_HALF_OPEN:
+            self._open()
+        elif self.state == CIRCUIT_CLOSED:
+            self._prune()
+            if len(self._samples) >= self.min_requests and self.error_rate() >= self.error_rate_threshold:
+                self._open()
+        self._probe_in_flight = False
+
+    def abandon(self):
+        """Release a claimed request that finished without a health signal."""
+        self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        retry_in = None
+        if self.state == CIRCUIT_OPEN:
+            retry_in = max(0.0, self.opened_at + self.cooldown - self._clock())
+        return {
+            "model": self.model,
+            "state": self.state,
+            "retry_in": retry_in,
+            "requests": len(self._samples),
+            "error_rate": self.error_rate(),
+            "p95": self.p95(),
+            "times_opened": self.times_opened,
+            "short_circuited": self.short_circuited,
+        }
+
 
 class LiteLLMClient:
     """
@@ -62,8 +316,313 @@ class LiteLLMClient:
         # Configure LiteLLM for OpenRouter
         os.environ["OPENROUTER_API_KEY"] = self.api_key
 
+        # Share one pooled HTTP client so TLS handshakes are not paid per request
+        self.http2 = HTTP2_ENABLED and http2_available()
+        self.http_client = build_http_client(http2=self.http2)
+        self.max_connections = HTTP_MAX_CONNECTIONS
+        litellm.aclient_session = self.http_client
+
+        # Pool usage counters
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_requests = 0
+        self.saturated_requests = 0
+
+        # Per-model health and circuit breakers
+        self.model_health: Dict[str, ModelHealth] = {}
+
+        # Budgets for guild-supplied keys so one guild cannot flood its provider
+        self.key_limiter = KeyRateLimiter()
+
+        # Hedging
+        self.hedge_enabled = HEDGE_ENABLED
+        self.hedge_eligible = 0
+        self.hedges_sent = 0
+        self.hedge_wins = 0
+
         print("LiteLLM client initialized with OpenRouter backend.")
 
+    @contextmanager
+    def _track_request(self):
+        """Count a request against the connection pool for the saturation metric."""
+        if self.in_flight >= self.max_connections:
+            self.saturated_requests += 1
+        self.in_flight += 1
+        self.total_requests += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """
+        Report how busy the shared HTTP connection pool is.
+
+        Returns:
+            Dictionary with in-flight, peak and saturation figures
+        """
+        return {
+            "max_connections": self.max_connections,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "utilization": self.in_flight / self.max_connections if self.max_connections else 0.0,
+            "total_requests": self.total_requests,
+            "saturated_requests": self.saturated_requests,
+            "http2": self.http2,
+        }
+
+    async def aclose(self):
+        """Close the shared HTTP client and its pooled connections."""
+        if litellm.aclient_session is self.http_client:
+            litellm.aclient_session = None
+        await self.http_client.aclose()
+
+    def health(self, model_name: str) -> ModelHealth:
+        """Return the health tracker for a model, creating it on first use."""
+        health = self.model_health.get(model_name)
+        if health is None:
+            health = self.model_health[model_name] = ModelHealth(model_name)
+        return health
+
+    def health_snapshot(self) -> List[Dict[str, Any]]:
+        """Circuit breaker state for every model that has been called."""
+        return [health.snapshot() for health in self.model_health.values()]
+
+    def route_models(self, primary: str) -> List[str]:
+        """
+        Order the models to try for a request.
+
+        The fallback goes first while the primary's circuit is open, or while the
+        primary is slower than ``SLOW_P95_SECONDS`` and the fallback is measurably faster.
+
+        Args:
+            primary: The requested model
+
+        Returns:
+            Candidate models in the order they should be tried
+        """
+        if primary == FALLBACK_MODEL:
+            return [primary]
+        primary_health = self.health(primary)
+        fallback_health = self.health(FALLBACK_MODEL)
+        if not primary_health.available():
+            return [FALLBACK_MODEL, primary]
+        if SLOW_P95_SECONDS > 0 and fallback_health.state == CIRCUIT_CLOSED:
+            primary_p95 = primary_health.p95()
+            fallback_p95 = fallback_health.p95()
+            if (
+                primary_p95 is not None
+                and fallback_p95 is not None
+                and primary_p95 > SLOW_P95_SECONDS
+                and fallback_p95 < primary_p95
+            ):
+                return [FALLBACK_MODEL, primary]
+        return [primary, FALLBACK_MODEL]
+
+    def guild_credential(
+        self, model_name: str, api_key: Optional[str], auth_info: Optional[Dict[str, Any]]
+    ) -> Optional[tuple[str, str]]:
+        """
+        Identify the guild-supplied credential a call would use.
+
+        Args:
+            model_name: Model the call is for
+            api_key: API key for the call
+            auth_info: GitHub Copilot auth info for the call
+
+        Returns:
+            (provider, credential) for a guild's own key, or None for the shared key
+        """
+        if auth_info:
+            token = auth_info.get("access_token") if isinstance(auth_info, dict) else None
+            return "github_copilot", token or json.dumps(auth_info, sort_keys=True, default=str)
+        if api_key and api_key != self.api_key:
+            return provider_for_model(model_name), api_key
+        return None
+
+    @asynccontextmanager
+    async def _guarded_call(self, model_name: str, api_key: Optional[str], auth_info: Optional[Dict[str, Any]]):
+        """Hold the guild key budget and a pool slot around one call, recording its outcome in the model health."""
+        health = self.health(model_name)
+        credential = self.guild_credential(model_name, api_key, auth_info)
+        start = time.monotonic()
+        try:
+            async with AsyncExitStack() as stack:
+                if credential is not None:
+                    await stack.enter_async_context(self.key_limiter.limit(*credential))
+                    start = time.monotonic()
+                stack.enter_context(self._track_request())
+                yield
+        except (asyncio.CancelledError, GeneratorExit):
+            # Cancelled, or a stream whose reader stopped early
+            health.abandon()
+            raise
+        except (*CLIENT_ERRORS, KeyRateLimitExceeded):
+            health.abandon()
+            raise
+        except litellm.RateLimitError as e:
+            if credential is None:
+                health.record_failure(time.monotonic() - start)
+            else:
+                # The guild's own quota ran out; that says nothing about the model.
+                health.abandon()
+                self.key_limiter.throttled(*credential, retry_after=_retry_after(e))
+            raise
+        except Exception:
+            health.record_failure(time.monotonic() - start)
+            raise
+        health.record_success(time.monotonic() - start)
+
+    async def _complete(
+        self,
+        model_name: str,
+        messages: List[Dict[str, Any]],
+        api_key: Optional[str],
+        auth_info: Optional[Dict[str, Any]],
+        generation_config: Dict[str, Any],
+    ) -> Any:
+        """Make one LiteLLM call and record its outcome against the model's health."""
+        async with self._guarded_call(model_name, api_key, auth_info):
+            return await self._acompletion(model_name, messages, api_key, auth_info, generation_config)
+
+    async def _acompletion(
+        self,
+        model_name: str,
+        messages: List[Dict[str, Any]],
+        api_key: Optional[str],
+        auth_info: Optional[Dict[str, Any]],
+        generation_config: Dict[str, Any],
+    ) -> Any:
+        # LiteLLM merges into the headers dict it is given, so hand it a
+        # shallow copy of the shared constant.
+        return await acompletion(
+            model=model_name,
+            messages=messages,
+            api_key=api_key,
+            extra_headers=dict(COPILOT_EXTRA_HEADERS),
+            auth=auth_info,  # Pass auth_info directly
+            **generation_config,
+        )
+
+    def _call_credentials(
+        self, model_name: str, requested_model: str, api_key: Optional[str], auth_info: Optional[Dict[str, Any]]
+    ) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Pick the credentials for a call to ``model_name``.
+
+        The requested model uses the caller's key and auth info; any other
+        model uses the shared key alone, so a guild's own credentials are never
+        paired with the bot's key.
+
+        Args:
+            model_name: Model the call goes to
+            requested_model: Model the caller asked for
+            api_key: Caller's API key (optional)
+            auth_info: Caller's additional authentication info (optional)
+
+        Returns:
+            Tuple of (api_key, auth_info) for the call
+        """
+        if model_name == requested_model:
+            return api_key or self.api_key, auth_info
+        return self.api_key, None
+
+    def _over_guild_budget(
+        self, error: Exception, model_name: str, api_key: Optional[str], auth_info: Optional[Dict[str, Any]]
+    ) -> bool:
+        """Whether ``error`` means the guild's own key is out of budget."""
+        return isinstance(error, KeyRateLimitExceeded) or (
+            isinstance(error, litellm.RateLimitError) and self.guild_credential(model_name, api_key, auth_info)
+        )
+
+    def hedge_delay(self, model_name: str) -> float:
+        """Seconds to wait for a response before sending a hedge request."""
+        health = self.health(model_name)
+        if health.sample_count() < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY_SECONDS
+        return max(HEDGE_MIN_DELAY_SECONDS, health.percentile(HEDGE_PERCENTILE))
+
+    def _hedge_model(self, model_name: str) -> Optional[str]:
+        """Pick and claim the model for a hedge request, or None if none may be sent."""
+        hedge_model = model_name
+        if HEDGE_TARGET == "fallback" and model_name != FALLBACK_MODEL:
+            hedge_model = FALLBACK_MODEL
+        # A half-open model already has its single probe in flight, so this refuses.
+        return hedge_model if self.health(hedge_model).try_acquire() else None
+
+    async def _complete_hedged(
+        self,
+        model_name: str,
+        messages: List[Dict[str, Any]],
+        api_key: Optional[str],
+        auth_info: Optional[Dict[str, Any]],
+        generation_config: Dict[str, Any],
+    ) -> Any:
+        """
+        Race a hedge request against a slow one; the first success wins and the other is cancelled.
+
+        Args:
+            model_name: Model for the original request
+            messages: List of message dictionaries
+            api_key: API key for the original request
+            auth_info: Additional authentication info
+            generation_config: Generation parameters
+
+        Returns:
+            The raw LiteLLM response of whichever request succeeded first
+        """
+        self.hedge_eligible += 1
+        original = asyncio.ensure_future(self._complete(model_name, messages, api_key, auth_info, generation_config))
+        pending = {original}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_delay(model_name))
+            if done:
+                return original.result()
+
+            hedge_model = self._hedge_model(model_name)
+            if hedge_model is None:
+                return await original
+            self.hedges_sent += 1
+            hedge_api_key, hedge_auth_info = self._call_credentials(hedge_model, model_name, api_key, auth_info)
+            print(f"No response from {model_name} yet; sending hedge request to {hedge_model}.")
+            hedge = asyncio.ensure_future(
+                self._complete(hedge_model, messages, hedge_api_key, hedge_auth_info, generation_config)
+            )
+            pending.add(hedge)
+
+            first_error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Check the original first so its error is the one reported if both fail
+                for task in sorted(done, key=lambda task: task is not original):
+                    error = task.exception()
+                    if error is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+                    first_error = first_error or error
+            raise first_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def hedge_stats(self) -> Dict[str, Any]:
+        """
+        Report how often requests were hedged and how often the hedge answered first.
+
+        Returns:
+            Dictionary of hedging counters and rates
+        """
+        return {
+            "enabled": self.hedge_enabled,
+            "eligible": self.hedge_eligible,
+            "hedges_sent": self.hedges_sent,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": self.hedges_sent / self.hedge_eligible if self.hedge_eligible else 0.0,
+            "win_rate": self.hedge_wins / self.hedges_sent if self.hedges_sent else 0.0,
+        }
+
     def map_model_name(self, model_name: str) -> str:
         """
         Returns the model name to be used with LiteLLM.
@@ -107,56 +666,129 @@ class LiteLLMClient:
         # Get the final model name, using the provided name as-is if not mapped.
         final_model_name = self.map_model_name(model)
 
-        # Prepare generation config
-        generation_config = DEFAULT_GENERATION_CONFIG.copy()
-        generation_config.update(kwargs)
-
-        # Determine the API key to use
-        final_api_key = api_key or self.api_key
+        # Only merge when overrides were given; the defaults are unpacked read-only
+        generation_config = {**DEFAULT_GENERATION_CONFIG, **kwargs} if kwargs else DEFAULT_GENERATION_CONFIG
+
+        first_error: Optional[Exception] = None
+        attempted = False
+        for model_name in self.route_models(final_model_name):
+            # Skip models whose circuit is open instead of waiting out another timeout
+            if not self.health(model_name).try_acquire():
+                print(f"Circuit open for model {model_name}; skipping.")
+                continue
+            if attempted:
+                print(f"Retrying with fallback model: {model_name}")
+            attempted = True
+
+            # The requested model uses the guild's credentials; the fallback uses the default key
+            call_api_key, call_auth_info = self._call_credentials(model_name, final_model_name, api_key, auth_info)
+            complete = self._complete_hedged if self.hedge_enabled else self._complete
+            try:
+                response = await complete(model_name, messages, call_api_key, call_auth_info, generation_config)
+                # Wrap response to match expected interface
+                return LiteLLMResponse(response)
+            except Exception as e:
+                print(f"Error calling API with model {model_name}: {e}")
+                first_error = first_error or e
+                if self._over_guild_budget(e, model_name, call_api_key, call_auth_info):
+                    # Over the guild's own budget: shed rather than spill onto the shared key.
+                    break
+
+        if first_error is not None:
+            raise first_error
+        raise ModelUnavailableError(f"No healthy model available for {final_model_name}; all circuits are open.")
+
+    async def stream_content(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        api_key: Optional[str] = None,
+        auth_info: Optional[Dict[str, Any]] = None,
+        on_usage: Optional[Callable[[Dict[str, Any]], None]] = None,
+        **kwargs,
+    ) -> AsyncIterator[str]:
+        """
+        Stream generated text, yielding content deltas as they arrive.
 
-        # Prepare extra headers
-        extra_headers = {
-            "editor-version": "vscode/1.85.1",
-            "Copilot-Integration-Id": "vscode-chat",
-        }
+        Routing, circuit breakers and guild key budgets work as in
+        generate_content, but a fallback model is only tried before the first
+        delta; an error after that is raised to the caller. Streams are not
+        hedged.
 
-        try:
-            # Make the API call using LiteLLM
-            response = await acompletion(
-                model=final_model_name,
-                messages=messages,
-                api_key=final_api_key,
-                extra_headers=extra_headers,
-                auth=auth_info,  # Pass auth_info directly
-                **generation_config,
-            )
+        Args:
+            model: Model name to use
+            messages: List of message dictionaries
+            api_key: User-provided API key (optional)
+            auth_info: Additional authentication info (e.g., for GitHub Copilot)
+            on_usage: Called with the token usage if the provider reports it at the end of the stream
+            **kwargs: Additional generation parameters
 
-            # Wrap response to match expected interface
-            return LiteLLMResponse(response)
+        Yields:
+            Text deltas of the response
+        """
+        final_model_name = self.map_model_name(model)
+        generation_config = {
+            **DEFAULT_GENERATION_CONFIG,
+            **kwargs,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
 
-        except Exception as e:
-            print(f"Error calling API with model {final_model_name}: {e}")
-
-            # Try fallback model if the primary model fails
-            if final_model_name != FALLBACK_MODEL:
-                print(f"Retrying with fallback model: {FALLBACK_MODEL}")
-                try:
-                    response = await acompletion(
-                        model=FALLBACK_MODEL,
-                        messages=messages,
-                        api_key=self.api_key,  # Use default key for fallback
-                        extra_headers={
-                            "editor-version": "vscode/1.85.1",
-                            "Copilot-Integration-Id": "vscode-chat",
-                        },
-                        auth=auth_info,
-                        **generation_config,
+        first_error: Optional[Exception] = None
+        for model_name in self.route_models(final_model_name):
+            if not self.health(model_name).try_acquire():
+                print(f"Circuit open for model {model_name}; skipping.")
+                continue
+
+            call_api_key, call_auth_info = self._call_credentials(model_name, final_model_name, api_key, auth_info)
+            streamed = False
+            try:
+                # The pool slot and key budget are held until the stream ends.
+                async with self._guarded_call(model_name, call_api_key, call_auth_info):
+                    stream = await self._acompletion(
+                        model_name, messages, call_api_key, call_auth_info, generation_config
                     )
-                    return LiteLLMResponse(response)
-                except Exception as fallback_error:
-                    print(f"Fallback model also failed: {fallback_error}")
-
-            raise e
+                    async for chunk in stream:
+                        usage = getattr(chunk, "usage", None)
+                        if usage and on_usage is not None:
+                            on_usage(_usage_dict(usage))
+                        delta = _chunk_text(chunk)
+                        if delta:
+                            streamed = True
+                            yield delta
+                return
+            except Exception as e:
+                if streamed:
+                    raise
+                print(f"Error streaming from model {model_name}: {e}")
+                first_error = first_error or e
+                if self._over_guild_budget(e, model_name, call_api_key, call_auth_info):
+                    break
+
+        if first_error is not None:
+            raise first_error
+        raise ModelUnavailableError(f"No healthy model available for {final_model_name}; all circuits are open.")
+
+
+def _usage_dict(usage: Any) -> Dict[str, Any]:
+    """Token counts from a LiteLLM usage object, including prompt tokens served from the provider's cache."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", None) or getattr(usage, "cache_read_input_tokens", None) or 0
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0),
+        "completion_tokens": getattr(usage, "completion_tokens", 0),
+        "total_tokens": getattr(usage, "total_tokens", 0),
+        "cached_tokens": cached_tokens,
+    }
+
+
+def _chunk_text(chunk: Any) -> str:
+    """Content delta of one streamed LiteLLM chunk."""
+    choices = getattr(chunk, "choices", None)
+    if not choices:
+        return ""
+    delta = getattr(choices[0], "delta", None)
+    return getattr(delta, "content", None) or ""
 
 
 class LiteLLMResponse:
@@ -202,11 +834,7 @@ class LiteLLMResponse:
         """
         try:
             if hasattr(self._response, "usage"):
-                return {
-                    "prompt_tokens": getattr(self._response.usage, "prompt_tokens", 0),
-                    "completion_tokens": getattr(self._response.usage, "completion_tokens", 0),
-                    "total_tokens": getattr(self._response.usage, "total_tokens", 0),
-                }
+                return _usage_dict(self._response.usage)
         except Exception:
             pass
         return None
@@ -0,0 +1,249 @@
+"""
+Perceptual-hash index of media that was judged a violation.
+
+The same scam images and NSFW GIFs get reposted across guilds, usually
+re-encoded or resized, so exact hashes miss them. Each image or sampled video
+frame gets a 64-bit dHash, and a repost lands within a few bits of the
+original. Verdicts are indexed by hash in a bounded in-process LRU, with an
+optional Redis tier shared between processes, and looked up by Hamming
+distance.
+
+Lookups are multi-index: the hash is split into eight 8-bit bands. Two hashes
+within distance 7 must agree exactly on at least one band, so only the
+entries sharing a band are compared.
+
+Near-uniform frames (black, white, fades) hash to almost all zeros or ones and
+would match unrelated media, so such hashes are neither stored nor looked up.
+A message only matches when most of its remaining frames do.
+"""
+
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from database.cache import get_redis
+
+REDIS_KEY_PREFIX = "media_hash"
+
+HASH_BITS = 64
+BANDS = 8
+BAND_BITS = HASH_BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+# Distances above this are not guaranteed to share a band
+MAX_THRESHOLD = BANDS - 1
+# Hashes with fewer set (or unset) bits than this come from near-uniform frames
+MIN_HASH_DETAIL = 8
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def is_distinctive(media_hash: int) -> bool:
+    """Whether a hash has enough detail to identify media, unlike a blank or faded frame."""
+    return MIN_HASH_DETAIL <= media_hash.bit_count() <= HASH_BITS - MIN_HASH_DETAIL
+
+
+def _bands(media_hash: int) -> List[int]:
+    return [(media_hash >> (band * BAND_BITS)) & BAND_MASK for band in range(BANDS)]
+
+
+@dataclass
+class MediaMatch:
+    """A looked-up hash and the stored entry it matched."""
+
+    media_hash: int
+    matched_hash: int
+    distance: int
+    verdict: Dict[str, Any]
+    guild_id: int
+
+
+class MediaHashIndex:
+    """Bounded LRU (plus optional Redis) of flagged media hashes with Hamming-distance lookup.
+
+    Args:
+        maxsize: Hashes held in process.
+        ttl: Seconds an entry stays valid in either tier.
+        threshold: Largest Hamming distance counted as the same media (at most 7).
+        use_redis: Whether to read and write the shared Redis tier.
+        share: Whether verdicts from one guild may be applied in another.
+    """
+
+    def __init__(
+        self,
+        maxsize: Optional[int] = None,
+        ttl: Optional[int] = None,
+        threshold: Optional[int] = None,
+        use_redis: Optional[bool] = None,
+        share: Optional[bool] = None,
+    ):
+        self.maxsize = maxsize if maxsize is not None else int(os.getenv("AI_MEDIA_HASH_CACHE_SIZE", "20000"))
+        self.ttl = ttl if ttl is not None else int(os.getenv("AI_MEDIA_HASH_TTL", str(7 * 24 * 3600)))
+        if threshold is None:
+            threshold = int(os.getenv("AI_MEDIA_HASH_THRESHOLD", "6"))
+        self.threshold = max(0, min(threshold, MAX_THRESHOLD))
+        if use_redis is None:
+            use_redis = os.getenv("AI_MEDIA_HASH_REDIS", "true").lower() in ("1", "true", "yes")
+        self.use_redis = use_redis
+        if share is None:
+            share = os.getenv("AI_MEDIA_HASH_SHARE", "true").lower() in ("1", "true", "yes")
+        self.share = share
+
+        # hash -> (expires_at, guild_id, verdict), oldest first
+        self._entries: "OrderedDict[int, tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._bands: List[Dict[int, Set[int]]] = [{} for _ in range(BANDS)]
+
+        self.lookups = 0
+        self.local_hits = 0
+        self.redis_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, media_hash: int) -> None:
+        self._entries.pop(media_hash, None)
+        for band, value in enumerate(_bands(media_hash)):
+            members = self._bands[band].get(value)
+            if members is not None:
+                members.discard(media_hash)
+                if not members:
+                    del self._bands[band][value]
+
+    def _store_local(self, media_hash: int, guild_id: int, verdict: Dict[str, Any]) -> None:
+        if self.maxsize <= 0 or not is_distinctive(media_hash):
+            return
+        if media_hash in self._entries:
+            self._entries.move_to_end(media_hash)
+        else:
+            for band, value in enumerate(_bands(media_hash)):
+                self._bands[band].setdefault(value, set()).add(media_hash)
+        self._entries[media_hash] = (time.monotonic() + self.ttl, guild_id, verdict)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+
+    def _lookup_local(self, media_hash: int) -> Optional[MediaMatch]:
+        candidates = set()
+        for band, value in enumerate(_bands(media_hash)):
+            candidates |= self._bands[band].get(value, set())
+        best = None
+        now = time.monotonic()
+        for candidate in candidates:
+            distance = hamming_distance(media_hash, candidate)
+            if distance > self.threshold or (best is not None and distance >= best.distance):
+                continue
+            expires_at, guild_id, verdict = self._entries[candidate]
+            if expires_at < now:
+                self._remove(candidate)
+                continue
+            best = MediaMatch(media_hash, candidate, distance, verdict, guild_id)
+        if best is not None:
+            self._entries.move_to_end(best.matched_hash)
+        return best
+
+    async def _lookup_redis(self, hashes: List[int]) -> Dict[int, MediaMatch]:
+        """Closest entry with a verdict in Redis for each of ``hashes`` that has one."""
+        redis = await get_redis()
+        if redis is None:
+            return {}
+        async with redis.pipeline(transaction=False) as pipe:
+            for media_hash in hashes:
+                for band, value in enumerate(_bands(media_hash)):
+                    pipe.smembers(f"{REDIS_KEY_PREFIX}:band:{band}:{value:02x}")
+            band_members = await pipe.execute()
+
+        near = []
+        for index, media_hash in enumerate(hashes):
+            members = set().union(*band_members[index * BANDS : (index + 1) * BANDS])
+            for member in members:
+                candidate = int(member, 16)
+                distance = hamming_distance(media_hash, candidate)
+                if distance <= self.threshold:
+                    near.append((distance, media_hash, candidate))
+        if not near:
+            return {}
+        near.sort()
+        # Band sets can outlive their verdicts, so each hash takes its closest candidate that still has one
+        candidates = list(dict.fromkeys(candidate for _, _, candidate in near))
+        async with redis.pipeline(transaction=False) as pipe:
+            for candidate in candidates:
+                pipe.get(f"{REDIS_KEY_PREFIX}:verdict:{candidate:016x}")
+            raw_verdicts = await pipe.execute()
+        entries = {candidate: json.loads(raw) for candidate, raw in zip(candidates, raw_verdicts) if raw is not None}
+
+        matches: Dict[int, MediaMatch] = {}
+        for distance, media_hash, candidate in near:
+            entry = entries.get(candidate)
+            if entry is None or media_hash in matches:
+                continue
+            self._store_local(candidate, entry["guild_id"], entry["verdict"])
+            matches[media_hash] = MediaMatch(media_hash, candidate, distance, entry["verdict"], entry["guild_id"])
+        return matches
+
+    async def lookup(self, hashes: Iterable[int]) -> Optional[MediaMatch]:
+        """Return the closest stored entry when most of ``hashes`` are within the threshold of one.
+
+        Hashes of near-uniform frames are left out, and a message with no other frames never matches.
+        """
+        hashes = [media_hash for media_hash in hashes if media_hash is not None and is_distinctive(media_hash)]
+        if not hashes:
+            return None
+        self.lookups += 1
+        needed = len(hashes) // 2 + 1
+        matches: Dict[int, MediaMatch] = {}
+        for media_hash in hashes:
+            match = self._lookup_local(media_hash)
+            if match is not None:
+                matches[media_hash] = match
+        local_matches = sum(media_hash in matches for media_hash in hashes)
+        if local_matches < needed and self.use_redis:
+            try:
+                matches.update(await self._lookup_redis([h for h in dict.fromkeys(hashes) if h not in matches]))
+            except Exception as e:
+                print(f"MediaHashIndex: Redis lookup failed: {e}")
+        if sum(media_hash in matches for media_hash in hashes) < needed:
+            return None
+        if local_matches >= needed:
+            self.local_hits += 1
+        else:
+            self.redis_hits += 1
+        return min(matches.values(), key=lambda match: match.distance)
+
+    async def add(self, media_hash: int, guild_id: int, verdict: Dict[str, Any]) -> None:
+        """Remember the verdict for a piece of media; near-uniform frames are skipped."""
+        if not is_distinctive(media_hash):
+            return
+        self._store_local(media_hash, guild_id, verdict)
+        if not self.use_redis:
+            return
+        try:
+            redis = await get_redis()
+            if redis is None:
+                return
+            member = f"{media_hash:016x}"
+            async with redis.pipeline(transaction=False) as pipe:
+                for band, value in enumerate(_bands(media_hash)):
+                    band_key = f"{REDIS_KEY_PREFIX}:band:{band}:{value:02x}"
+                    pipe.sadd(band_key, member)
+                    pipe.expire(band_key, self.ttl)
+                pipe.set(
+                    f"{REDIS_KEY_PREFIX}:verdict:{member}",
+                    json.dumps({"guild_id": guild_id, "verdict": verdict}),
+                    ex=self.ttl,
+                )
+                await pipe.execute()
+        except Exception as e:
+            print(f"MediaHashIndex: Redis store failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.local_hits + self.redis_hits
+        return {
+            "size": len(self._entries),
+            "lookups": self.lookups,
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "hit_rate": hits / self.lookups if self.lookups else 0.0,
+        }
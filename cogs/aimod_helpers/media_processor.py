@@ -1,9 +1,140 @@
-import discord
+"""
+Attachment stage of the moderation pipeline.
+
+An attachment's size from Discord's metadata is checked before anything is
+downloaded, and the download itself streams with a hard byte cap. Decoding,
+downscaling and frame sampling run in a process pool so large images and
+videos never block the event loop. What comes out is a handful of bounded
+JPEG parts that can be sent to vision-capable models, each with a 64-bit
+difference hash (dHash) for matching reposts of known media. Video frames need
+OpenCV; without it, videos are described to the model by filename only.
+"""
+
+import asyncio
+import io
 import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import aiohttp
+import discord
+from PIL import Image, ImageOps
+
+from .stage_timer import StageTimings
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+MEDIA_MAX_BYTES = int(os.getenv("AI_MEDIA_MAX_BYTES", str(20 * 1024 * 1024)))
+MEDIA_MAX_DIMENSION = int(os.getenv("AI_MEDIA_MAX_DIMENSION", "1024"))
+MEDIA_MAX_FRAMES = int(os.getenv("AI_MEDIA_MAX_FRAMES", "4"))
+# Image parts attached to one request, across all of a message's attachments
+MEDIA_MAX_PARTS = int(os.getenv("AI_MEDIA_MAX_PARTS", "8"))
+MEDIA_WORKERS = int(os.getenv("AI_MEDIA_WORKERS", "2"))
+MEDIA_DOWNLOAD_TIMEOUT = float(os.getenv("AI_MEDIA_DOWNLOAD_TIMEOUT", "15"))
+MEDIA_JPEG_QUALITY = 85
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DHASH_SIZE = 8
+
+
+class MediaTooLarge(Exception):
+    """Raised when a download goes over the byte cap."""
+
+
+class MediaPart(NamedTuple):
+    """One image handed to the model; ``data`` is None when the attachment could not be used."""
+
+    mime_type: Optional[str]
+    data: Optional[bytes]
+    kind: str
+    filename: str
+    media_hash: Optional[int] = None
+
+
+def _sample_indices(total: int, count: int) -> List[int]:
+    """Evenly spaced frame indices, taken from the middle of each segment."""
+    if total <= count:
+        return list(range(total))
+    return [int((i + 0.5) * total / count) for i in range(count)]
+
+
+def dhash(image: Image.Image) -> int:
+    """64-bit difference hash: one bit per horizontally adjacent pixel pair of a 9x8 grayscale thumbnail."""
+    pixels = image.convert("L").resize((DHASH_SIZE + 1, DHASH_SIZE), Image.Resampling.LANCZOS).tobytes()
+    value = 0
+    for row in range(DHASH_SIZE):
+        offset = row * (DHASH_SIZE + 1)
+        for col in range(DHASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def _encode_frame(image: Image.Image, max_dimension: int, quality: int) -> Tuple[bytes, int]:
+    image = image.convert("RGB")
+    image.thumbnail((max_dimension, max_dimension))
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=quality)
+    return out.getvalue(), dhash(image)
+
+
+def prepare_image(data: bytes, max_dimension: int, max_frames: int, quality: int) -> List[Tuple[bytes, int]]:
+    """Downscale a still image, or sample frames of an animated one, to hashed JPEGs. Runs in a worker process."""
+    with Image.open(io.BytesIO(data)) as image:
+        frame_count = getattr(image, "n_frames", 1)
+        if frame_count <= 1:
+            # JPEGs can be decoded straight at a reduced scale
+            image.draft("RGB", (max_dimension, max_dimension))
+            return [_encode_frame(ImageOps.exif_transpose(image), max_dimension, quality)]
+        frames = []
+        for index in _sample_indices(frame_count, max_frames):
+            image.seek(index)
+            frames.append(_encode_frame(image, max_dimension, quality))
+        return frames
+
+
+def prepare_video(data: bytes, max_dimension: int, max_frames: int, quality: int) -> List[Tuple[bytes, int]]:
+    """Sample frames of a video to hashed JPEGs. Runs in a worker process; needs OpenCV."""
+    if cv2 is None:
+        return []
+    # OpenCV only reads videos from a path
+    with tempfile.NamedTemporaryFile(suffix=".video") as f:
+        f.write(data)
+        f.flush()
+        capture = cv2.VideoCapture(f.name)
+        try:
+            frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+            frames = []
+            for index in _sample_indices(frame_count, max_frames):
+                capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+                ok, frame = capture.read()
+                if ok:
+                    image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                    frames.append(_encode_frame(image, max_dimension, quality))
+            return frames
+        finally:
+            capture.release()
 
 
 class MediaProcessor:
-    def __init__(self):
+    """Turns attachments into bounded image parts for the moderation prompt.
+
+    Args:
+        max_bytes: Largest attachment that is downloaded.
+        max_dimension: Longest side, in pixels, of every image part.
+        max_frames: Frames sampled from an animation or video.
+        workers: Processes used for decoding.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = MEDIA_MAX_BYTES,
+        max_dimension: int = MEDIA_MAX_DIMENSION,
+        max_frames: int = MEDIA_MAX_FRAMES,
+        workers: int = MEDIA_WORKERS,
+    ):
         self.image_extensions = [
             ".jpg",
             ".jpeg",
@@ -15,52 +146,122 @@ class MediaProcessor:
         ]
         self.gif_extensions = [".gif"]
         self.video_extensions = [".mp4", ".webm", ".mov", ".avi", ".mkv", ".flv"]
+        self.max_bytes = max_bytes
+        self.max_dimension = max_dimension
+        self.max_frames = max(1, max_frames)
+        self.workers = max(1, workers)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
 
-    async def process_image(self, attachment: discord.Attachment) -> tuple[str, bytes]:
-        """Process an image attachment and return its raw bytes."""
-        try:
-            image_bytes = await attachment.read()
-            mime_type = attachment.content_type or "image/jpeg"
-            return mime_type, image_bytes
-        except Exception as e:
-            print(f"Error processing image: {e}")
-            return None, None
+        self.processed = 0
+        self.skipped_too_large = 0
+        self.failed = 0
+        self.bytes_downloaded = 0
+
+    def attachment_kind(self, filename: str) -> Optional[str]:
+        _, ext = os.path.splitext(filename.lower())
+        if ext in self.image_extensions:
+            return "image"
+        if ext in self.gif_extensions:
+            return "gif"
+        if ext in self.video_extensions:
+            return "video"
+        return None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
 
-    async def process_gif(self, attachment: discord.Attachment) -> tuple[str, bytes]:
-        """Process a GIF attachment and return its raw bytes."""
+    async def _download(self, attachment: discord.Attachment) -> bytes:
+        """Stream an attachment into memory, giving up as soon as it passes the byte cap."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=MEDIA_DOWNLOAD_TIMEOUT))
+        async with self._session.get(attachment.url) as response:
+            response.raise_for_status()
+            if response.content_length and response.content_length > self.max_bytes:
+                raise MediaTooLarge(f"{response.content_length} bytes")
+            chunks = []
+            received = 0
+            async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                received += len(chunk)
+                if received > self.max_bytes:
+                    raise MediaTooLarge(f"more than {self.max_bytes} bytes")
+                chunks.append(chunk)
+        self.bytes_downloaded += received
+        return b"".join(chunks)
+
+    async def process_attachment(
+        self, attachment: discord.Attachment, timings: Optional[StageTimings] = None
+    ) -> List[MediaPart]:
+        """Download and downscale an attachment into image parts.
+
+        Unsupported files yield no parts. Attachments that are too large or
+        cannot be decoded yield one part without data, so the model still
+        learns the filename.
+        """
+        if not attachment:
+            return []
+        filename = attachment.filename
+        kind = self.attachment_kind(filename)
+        if kind is None:
+            print(f"Unsupported file type: {os.path.splitext(filename.lower())[1]}")
+            return []
+        placeholder = [MediaPart(None, None, kind, filename)]
+
+        # Discord reports the size up front, so oversized files are never fetched
+        if attachment.size and attachment.size > self.max_bytes:
+            self.skipped_too_large += 1
+            print(f"Skipping download of {filename}: {attachment.size} bytes is over the {self.max_bytes} byte cap.")
+            return placeholder
+
+        timings = timings or StageTimings()
         try:
-            gif_bytes = await attachment.read()
-            mime_type = attachment.content_type or "image/gif"
-            return mime_type, gif_bytes
+            with timings.stage("media_download"):
+                data = await self._download(attachment)
+        except MediaTooLarge as e:
+            self.skipped_too_large += 1
+            print(f"Stopped downloading {filename}: {e} is over the byte cap.")
+            return placeholder
         except Exception as e:
-            print(f"Error processing GIF: {e}")
-            return None, None
+            self.failed += 1
+            print(f"Error downloading attachment {filename}: {e}")
+            return placeholder
 
-    async def process_video(self, attachment: discord.Attachment) -> tuple[str, bytes]:
-        """Process a video attachment and return its raw bytes."""
+        prepare = prepare_video if kind == "video" else prepare_image
         try:
-            video_bytes = await attachment.read()
-            mime_type = attachment.content_type or "video/mp4"
-            return mime_type, video_bytes
+            with timings.stage("media_decode"):
+                frames = await asyncio.get_running_loop().run_in_executor(
+                    self._get_executor(), prepare, data, self.max_dimension, self.max_frames, MEDIA_JPEG_QUALITY
+                )
         except Exception as e:
-            print(f"Error processing video: {e}")
-            return None, None
+            self.failed += 1
+            print(f"Error processing attachment {filename}: {e}")
+            return placeholder
+        if not frames:
+            return placeholder
 
-    async def process_attachment(self, attachment: discord.Attachment) -> tuple[str, bytes, str]:
-        """Process any attachment and return the appropriate image data."""
-        if not attachment:
-            return None, None, None
-        filename = attachment.filename.lower()
-        _, ext = os.path.splitext(filename)
-        if ext in self.image_extensions:
-            mime_type, image_bytes = await self.process_image(attachment)
-            return mime_type, image_bytes, "image"
-        elif ext in self.gif_extensions:
-            mime_type, image_bytes = await self.process_gif(attachment)
-            return mime_type, image_bytes, "gif"
-        elif ext in self.video_extensions:
-            mime_type, image_bytes = await self.process_video(attachment)
-            return mime_type, image_bytes, "video"
-        else:
-            print(f"Unsupported file type: {ext}")
-            return None, None, None
+        self.processed += 1
+        if len(frames) == 1:
+            return [MediaPart("image/jpeg", frames[0][0], kind, filename, frames[0][1])]
+        return [
+            MediaPart("image/jpeg", frame, kind, f"{filename} (frame {index + 1} of {len(frames)})", media_hash)
+            for index, (frame, media_hash) in enumerate(frames)
+        ]
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "processed": self.processed,
+            "skipped_too_large": self.skipped_too_large,
+            "failed": self.failed,
+            "bytes_downloaded": self.bytes_downloaded,
+            "video_frames": cv2 is not None,
+        }
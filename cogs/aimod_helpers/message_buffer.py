@@ -0,0 +1,153 @@
+"""
+Per-channel ring buffer of recent messages.
+
+The bot already sees every message through ``on_message``, so the context the
+moderation prompt needs (recent channel history and the replied-to message) can
+usually be served from memory instead of Discord REST calls. Each channel keeps
+a small deque of snippets, and channels themselves are evicted least recently
+used so memory stays capped.
+"""
+
+import os
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Deque, Iterable, List, Optional
+
+
+@dataclass
+class BufferedMessage:
+    """Compact snapshot of a message used for prompt context."""
+
+    id: int
+    author_name: str
+    author_bot: bool
+    content: str
+
+
+class RecentMessageBuffer:
+    """Bounded recent-message store keyed by channel.
+
+    Args:
+        per_channel: Messages kept per channel.
+        max_channels: Channels tracked before the least recently active is evicted.
+        snippet_length: Characters of content kept per message.
+    """
+
+    def __init__(
+        self,
+        per_channel: Optional[int] = None,
+        max_channels: Optional[int] = None,
+        snippet_length: int = 200,
+    ):
+        self.per_channel = per_channel if per_channel is not None else int(os.getenv("AI_MESSAGE_BUFFER_SIZE", "10"))
+        self.max_channels = (
+            max_channels if max_channels is not None else int(os.getenv("AI_MESSAGE_BUFFER_CHANNELS", "5000"))
+        )
+        self.snippet_length = snippet_length
+        self._channels: "OrderedDict[int, Deque[BufferedMessage]]" = OrderedDict()
+        # Channels whose entire history is known to be in the buffer.
+        self._complete: set[int] = set()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _channel(self, channel_id: int) -> Deque[BufferedMessage]:
+        buffer = self._channels.get(channel_id)
+        if buffer is None:
+            buffer = self._channels[channel_id] = deque(maxlen=self.per_channel)
+            while len(self._channels) > self.max_channels:
+                evicted, _ = self._channels.popitem(last=False)
+                self._complete.discard(evicted)
+        else:
+            self._channels.move_to_end(channel_id)
+        return buffer
+
+    def _snapshot(self, message) -> BufferedMessage:
+        return BufferedMessage(
+            id=message.id,
+            author_name=message.author.display_name,
+            author_bot=bool(message.author.bot),
+            content=(message.content or "")[: self.snippet_length],
+        )
+
+    def record(self, message) -> None:
+        """Append a newly received message to its channel's buffer."""
+        buffer = self._channel(message.channel.id)
+        if buffer and buffer[-1].id >= message.id:
+            # Out-of-order delivery; keep the buffer sorted by message ID.
+            if any(entry.id == message.id for entry in buffer):
+                return
+            entries = sorted([*buffer, self._snapshot(message)], key=lambda entry: entry.id)
+            buffer.clear()
+            buffer.extend(entries[-self.per_channel :])
+            return
+        buffer.append(self._snapshot(message))
+
+    def seed(self, channel_id: int, messages: Iterable, complete: bool = False) -> None:
+        """Fill a channel's buffer from messages fetched over REST (any order).
+
+        ``complete`` marks that the fetch reached the start of the channel.
+        """
+        buffer = self._channel(channel_id)
+        if complete:
+            self._complete.add(channel_id)
+        known = {entry.id for entry in buffer}
+        entries = list(buffer) + [self._snapshot(m) for m in messages if m.id not in known]
+        entries.sort(key=lambda entry: entry.id)
+        buffer.clear()
+        buffer.extend(entries[-self.per_channel :])
+
+    def update(self, message) -> None:
+        """Refresh the stored content of an edited message."""
+        buffer = self._channels.get(message.channel.id)
+        if not buffer:
+            return
+        for entry in buffer:
+            if entry.id == message.id:
+                entry.content = (message.content or "")[: self.snippet_length]
+                return
+
+    def remove(self, channel_id: int, message_id: int) -> None:
+        """Forget a deleted message."""
+        buffer = self._channels.get(channel_id)
+        if not buffer:
+            return
+        for entry in list(buffer):
+            if entry.id == message_id:
+                buffer.remove(entry)
+                return
+
+    def get(self, channel_id: int, message_id: int) -> Optional[BufferedMessage]:
+        """Return a buffered message by ID, counting the lookup as a hit or miss."""
+        buffer = self._channels.get(channel_id)
+        if buffer:
+            for entry in buffer:
+                if entry.id == message_id:
+                    self.hits += 1
+                    return entry
+        self.misses += 1
+        return None
+
+    def recent(self, channel_id: int, before_id: int, limit: int) -> Optional[List[BufferedMessage]]:
+        """Return up to ``limit`` messages before ``before_id``, newest first.
+
+        Returns None (a miss) when the buffer holds fewer than ``limit`` older
+        messages and the channel may have more history than it has seen.
+        """
+        buffer = self._channels.get(channel_id)
+        older = [entry for entry in buffer if entry.id < before_id] if buffer else []
+        if len(older) < limit and channel_id not in self._complete:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return list(reversed(older[-limit:]))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "channels": len(self._channels),
+            "messages": sum(len(buffer) for buffer in self._channels.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
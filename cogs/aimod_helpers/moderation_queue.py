@@ -0,0 +1,314 @@
+"""
+Bounded work queue for AI moderation.
+
+Messages that need an LLM round-trip are queued here instead of being analysed
+inline in the discord.py event dispatch. A fixed pool of workers drains the
+queue, visiting guilds round-robin and never running more than a configured
+number of analyses per guild at once, so one busy server cannot starve the
+others. When a guild (or the whole queue) is over budget, the configured
+load-shedding policy decides what happens to new work.
+
+A running job can park while it waits on something other than its own work,
+such as a micro-batch filling up. A parked job gives back its worker and its
+guild slot, so waiting for a batch window does not hold back other guilds.
+"""
+
+import asyncio
+import contextvars
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+
+# Load-shedding policies
+SHED_SKIP = "skip"  # Drop the message without analysis
+SHED_KEYWORD_ONLY = "keyword_only"  # Only admit messages that matched a keyword rule
+SHED_DEFER = "defer"  # Retry admission after a delay
+SHED_POLICIES = (SHED_SKIP, SHED_KEYWORD_ONLY, SHED_DEFER)
+
+# Submission outcomes
+QUEUED = "queued"
+SHED = "shed"
+DEFERRED = "deferred"
+
+
+@dataclass
+class ModerationJob:
+    """A unit of moderation work for a single message."""
+
+    guild_id: int
+    run: Callable[[], Awaitable[Any]]
+    keyword_match: bool = False
+    enqueued_at: float = field(default_factory=time.monotonic)
+    deferrals: int = 0
+    parked: bool = False
+    # Set when the job parks, releasing the worker that started it
+    _released: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+
+# The job whose ``run`` is executing in the current task
+_current_job: contextvars.ContextVar[Optional[ModerationJob]] = contextvars.ContextVar(
+    "moderation_queue_job", default=None
+)
+
+
+class ModerationQueue:
+    """Bounded queue with a worker pool, per-guild concurrency caps and round-robin fairness.
+
+    Args:
+        max_size: Maximum number of queued jobs across all guilds.
+        workers: Number of worker tasks draining the queue.
+        guild_concurrency: Maximum analyses running at once for a single guild.
+        guild_max_pending: Maximum queued jobs for a single guild before shedding.
+        shed_policy: One of ``skip``, ``keyword_only`` or ``defer``.
+        defer_seconds: Delay before a deferred job retries admission.
+        max_deferrals: Deferrals allowed per job before it is dropped.
+        guild_max_parked: Maximum parked jobs for a single guild; further jobs keep their slot while they wait.
+    """
+
+    def __init__(
+        self,
+        max_size: Optional[int] = None,
+        workers: Optional[int] = None,
+        guild_concurrency: Optional[int] = None,
+        guild_max_pending: Optional[int] = None,
+        shed_policy: Optional[str] = None,
+        defer_seconds: Optional[float] = None,
+        max_deferrals: Optional[int] = None,
+        guild_max_parked: Optional[int] = None,
+    ):
+        self.max_size = max_size if max_size is not None else int(os.getenv("AI_QUEUE_MAX_SIZE", "1000"))
+        self.workers = workers if workers is not None else int(os.getenv("AI_QUEUE_WORKERS", "8"))
+        self.guild_concurrency = (
+            guild_concurrency if guild_concurrency is not None else int(os.getenv("AI_QUEUE_GUILD_CONCURRENCY", "2"))
+        )
+        self.guild_max_pending = (
+            guild_max_pending if guild_max_pending is not None else int(os.getenv("AI_QUEUE_GUILD_MAX_PENDING", "50"))
+        )
+        policy = shed_policy or os.getenv("AI_QUEUE_SHED_POLICY", SHED_KEYWORD_ONLY)
+        self.shed_policy = policy if policy in SHED_POLICIES else SHED_KEYWORD_ONLY
+        self.defer_seconds = (
+            defer_seconds if defer_seconds is not None else float(os.getenv("AI_QUEUE_DEFER_SECONDS", "5"))
+        )
+        self.max_deferrals = (
+            max_deferrals if max_deferrals is not None else int(os.getenv("AI_QUEUE_MAX_DEFERRALS", "3"))
+        )
+        self.guild_max_parked = (
+            guild_max_parked if guild_max_parked is not None else int(os.getenv("AI_QUEUE_GUILD_MAX_PARKED", "8"))
+        )
+
+        self._pending: Dict[int, Deque[ModerationJob]] = {}
+        self._active: Dict[int, int] = {}
+        self._parked: Dict[int, int] = {}
+        self._job_tasks: set[asyncio.Task] = set()
+        self._rotation: Deque[int] = deque()
+        self._size = 0
+        self._cond: Optional[asyncio.Condition] = None
+        self._worker_tasks: list[asyncio.Task] = []
+        self._deferred_tasks: set[asyncio.Task] = set()
+
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.shed_counts: Dict[str, int] = {policy: 0 for policy in SHED_POLICIES}
+        self.deferred = 0
+        self.max_wait = 0.0
+        self._total_wait = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._worker_tasks)
+
+    def start(self) -> None:
+        """Start the worker pool on the running event loop."""
+        if self._worker_tasks:
+            return
+        self._cond = asyncio.Condition()
+        self._worker_tasks = [asyncio.create_task(self._worker(i)) for i in range(max(1, self.workers))]
+
+    async def stop(self) -> None:
+        """Cancel the workers and drop any queued or deferred jobs."""
+        tasks = self._worker_tasks + list(self._deferred_tasks) + list(self._job_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._deferred_tasks.clear()
+        self._job_tasks.clear()
+        self._pending.clear()
+        self._active.clear()
+        self._parked.clear()
+        self._rotation.clear()
+        self._size = 0
+
+    def depth(self, guild_id: Optional[int] = None) -> int:
+        """Number of queued jobs overall or for one guild."""
+        if guild_id is None:
+            return self._size
+        return len(self._pending.get(guild_id, ()))
+
+    def active(self, guild_id: Optional[int] = None) -> int:
+        """Number of jobs currently being processed overall or for one guild."""
+        if guild_id is None:
+            return sum(self._active.values())
+        return self._active.get(guild_id, 0)
+
+    def parked_count(self, guild_id: Optional[int] = None) -> int:
+        """Number of running jobs parked overall or for one guild."""
+        if guild_id is None:
+            return sum(self._parked.values())
+        return self._parked.get(guild_id, 0)
+
+    @asynccontextmanager
+    async def parked(self) -> AsyncIterator[bool]:
+        """Park the calling job for the duration of the block, e.g. while it waits for a batch.
+
+        The job's worker and guild slot are released and stay released once the
+        block ends; the rest of the job runs without counting against either.
+        Outside a queued job, for a job that already parked, or once the guild
+        has ``guild_max_parked`` parked jobs, the job keeps its slot. Yields
+        whether the job is parked.
+        """
+        job = _current_job.get()
+        if job is None or job.parked or self._parked.get(job.guild_id, 0) >= self.guild_max_parked:
+            yield False
+            return
+        job.parked = True
+        self._parked[job.guild_id] = self._parked.get(job.guild_id, 0) + 1
+        self._release_guild(job.guild_id)
+        job._released.set()
+        try:
+            yield True
+        finally:
+            remaining = self._parked.get(job.guild_id, 1) - 1
+            if remaining > 0:
+                self._parked[job.guild_id] = remaining
+            else:
+                self._parked.pop(job.guild_id, None)
+
+    def _release_guild(self, guild_id: int) -> None:
+        remaining = self._active.get(guild_id, 1) - 1
+        if remaining > 0:
+            self._active[guild_id] = remaining
+        else:
+            self._active.pop(guild_id, None)
+
+    async def submit(self, job: ModerationJob) -> str:
+        """Queue a job, applying the load-shedding policy when over budget.
+
+        Returns ``queued``, ``deferred`` or ``shed``.
+        """
+        if self._cond is None:
+            self.start()
+        if job.deferrals == 0:
+            self.submitted += 1
+
+        pending = len(self._pending.get(job.guild_id, ()))
+        if self._size >= self.max_size or pending >= self.guild_max_pending:
+            admitted = self.shed_policy == SHED_KEYWORD_ONLY and job.keyword_match and self._size < self.max_size
+            if not admitted:
+                return self._shed(job)
+
+        async with self._cond:
+            queue = self._pending.get(job.guild_id)
+            if queue is None:
+                queue = self._pending[job.guild_id] = deque()
+                self._rotation.append(job.guild_id)
+            queue.append(job)
+            self._size += 1
+            self._cond.notify()
+        return QUEUED
+
+    def _shed(self, job: ModerationJob) -> str:
+        if self.shed_policy == SHED_DEFER and job.deferrals < self.max_deferrals:
+            job.deferrals += 1
+            self.deferred += 1
+            task = asyncio.create_task(self._resubmit_later(job))
+            self._deferred_tasks.add(task)
+            task.add_done_callback(self._deferred_tasks.discard)
+            return DEFERRED
+        self.shed_counts[self.shed_policy] += 1
+        return SHED
+
+    async def _resubmit_later(self, job: ModerationJob) -> None:
+        await asyncio.sleep(self.defer_seconds)
+        await self.submit(job)
+
+    def _next_job(self) -> Optional[ModerationJob]:
+        """Pop the next job from the first guild in rotation that has spare concurrency."""
+        for _ in range(len(self._rotation)):
+            guild_id = self._rotation[0]
+            self._rotation.rotate(-1)
+            if self._active.get(guild_id, 0) >= self.guild_concurrency:
+                continue
+            queue = self._pending[guild_id]
+            job = queue.popleft()
+            if not queue:
+                del self._pending[guild_id]
+                self._rotation.remove(guild_id)
+            self._size -= 1
+            self._active[guild_id] = self._active.get(guild_id, 0) + 1
+            return job
+        return None
+
+    async def _run_job(self, job: ModerationJob, worker_id: int) -> None:
+        try:
+            await job.run()
+            self.processed += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            print(f"ModerationQueue worker {worker_id}: job for guild {job.guild_id} failed: {e}")
+        finally:
+            if not job.parked:
+                self._release_guild(job.guild_id)
+                job._released.set()
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            async with self._cond:
+                job = self._next_job()
+                while job is None:
+                    await self._cond.wait()
+                    job = self._next_job()
+
+            wait = time.monotonic() - job.enqueued_at
+            self._total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            # The job runs in its own task so the worker can move on if it parks
+            token = _current_job.set(job)
+            try:
+                task = asyncio.create_task(self._run_job(job, worker_id))
+            finally:
+                _current_job.reset(token)
+            self._job_tasks.add(task)
+            task.add_done_callback(self._job_tasks.discard)
+            try:
+                await job._released.wait()
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            async with self._cond:
+                self._cond.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of queue counters for monitoring."""
+        started = self.processed + self.failed
+        return {
+            "depth": self._size,
+            "active": self.active(),
+            "parked": self.parked_count(),
+            "guilds_waiting": len(self._pending),
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "failed": self.failed,
+            "deferred": self.deferred,
+            "shed": dict(self.shed_counts),
+            "avg_wait": self._total_wait / started if started else 0.0,
+            "max_wait": self.max_wait,
+            "workers": len(self._worker_tasks),
+            "shed_policy": self.shed_policy,
+        }
@@ -0,0 +1,230 @@
+"""
+Cheap local pre-classification ahead of the LLM.
+
+A hashed n-gram logistic regression scores how likely a text message is to
+violate the rules. Messages scoring below the threshold skip the LLM entirely.
+A small sample of those would-be skips is still sent to the LLM so the skip
+decision can be checked: the disagreement rate is the share of sampled skips
+the LLM judged to be violations.
+
+Any object with ``predict_proba(text) -> float`` can be plugged into
+``PreClassifierStage``; ``HashedNGramClassifier`` is the built-in CPU model and
+is trained from the ``ai_decisions`` table by ``scripts/train_preclassifier.py``.
+
+That table only keeps the first ``SNIPPET_LENGTH`` characters of each message,
+so the stage scores the same prefix at serve time that the model was trained
+on. There is one model for the whole bot: it learns what the LLM flagged
+across every guild and knows nothing about an individual guild's rules, so a
+guild whose rules forbid things most guilds allow can see those messages
+skipped. Keep the threshold low, and watch the disagreement rate.
+"""
+
+import math
+import os
+import random
+import re
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Protocol, Tuple
+
+import numpy as np
+
+from .decision_cache import normalize_content
+
+DEFAULT_MODEL_PATH = "wdiscordbot-json-data/preclassifier.npz"
+N_FEATURES = 2**18
+# Length of the message_content_snippet stored with each decision
+SNIPPET_LENGTH = 100
+SNIPPET_ELLIPSIS = "..."
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def classifier_text(text: str) -> str:
+    """Cut a message down to the prefix the model is trained on."""
+    return (text or "")[:SNIPPET_LENGTH]
+
+
+def hashed_features(text: str, n_features: int = N_FEATURES) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (indices, values) of the L2-normalized hashed n-gram vector for ``text``.
+
+    Features are word unigrams and bigrams plus character trigrams, which keeps
+    some signal on obfuscated spellings.
+    """
+    normalized = normalize_content(text)
+    words = _WORD_RE.findall(normalized)
+    grams = [f"w:{word}" for word in words]
+    grams.extend(f"b:{first} {second}" for first, second in zip(words, words[1:]))
+    padded = f" {normalized} "
+    grams.extend(f"c:{padded[i : i + 3]}" for i in range(len(padded) - 2))
+
+    counts: Dict[int, float] = {}
+    for gram in grams:
+        index = zlib.crc32(gram.encode()) % n_features
+        counts[index] = counts.get(index, 0.0) + 1.0
+    if not counts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+    indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    values = 1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+    values /= np.linalg.norm(values)
+    return indices, values
+
+
+class Classifier(Protocol):
+    def predict_proba(self, text: str) -> float: ...
+
+
+class HashedNGramClassifier:
+    """Logistic regression over hashed n-gram features.
+
+    Args:
+        n_features: Size of the hashed feature space.
+    """
+
+    def __init__(self, n_features: int = N_FEATURES):
+        self.n_features = n_features
+        self.weights = np.zeros(n_features, dtype=np.float32)
+        self.bias = 0.0
+
+    def predict_proba(self, text: str) -> float:
+        """Probability that ``text`` is a rule violation."""
+        indices, values = hashed_features(text, self.n_features)
+        z = self.bias + float(np.dot(self.weights[indices], values))
+        return 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, z))))
+
+    def fit(
+        self,
+        texts: List[str],
+        labels: List[bool],
+        epochs: int = 5,
+        learning_rate: float = 0.5,
+        l2: float = 1e-6,
+        seed: int = 0,
+    ) -> "HashedNGramClassifier":
+        """Train with SGD, weighting the (usually rare) violations up to balance the classes."""
+        samples = [(hashed_features(text, self.n_features), bool(label)) for text, label in zip(texts, labels)]
+        positives = sum(1 for _, label in samples if label)
+        negatives = len(samples) - positives
+        positive_weight = negatives / positives if positives else 1.0
+
+        rng = random.Random(seed)
+        for _ in range(epochs):
+            rng.shuffle(samples)
+            for (indices, values), label in samples:
+                z = self.bias + float(np.dot(self.weights[indices], values))
+                p = 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, z))))
+                gradient = (p - label) * (positive_weight if label else 1.0)
+                self.weights[indices] -= learning_rate * (gradient * values + l2 * self.weights[indices])
+                self.bias -= learning_rate * gradient
+        return self
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(path, weights=self.weights, bias=np.float32(self.bias))
+
+    @classmethod
+    def load(cls, path: str) -> "HashedNGramClassifier":
+        data = np.load(path)
+        classifier = cls(n_features=len(data["weights"]))
+        classifier.weights = data["weights"].astype(np.float32)
+        classifier.bias = float(data["bias"])
+        return classifier
+
+
+def training_examples(decisions: Iterable[Dict[str, Any]]) -> Tuple[List[str], List[bool]]:
+    """Turn ``ai_decisions`` rows into (texts, labels), skipping errors and empty snippets.
+
+    Texts are the snippets without the truncation marker, matching what
+    ``PreClassifierStage.evaluate`` scores.
+    """
+    texts, labels = [], []
+    for row in decisions:
+        decision = row.get("decision") or {}
+        text = row.get("message_content_snippet") or ""
+        if len(text) == SNIPPET_LENGTH + len(SNIPPET_ELLIPSIS) and text.endswith(SNIPPET_ELLIPSIS):
+            # The marker was added when the message was cut and is not part of what was sent
+            text = text[:SNIPPET_LENGTH]
+        if not text or not isinstance(decision, dict) or "violation" not in decision:
+            continue
+        texts.append(classifier_text(text))
+        labels.append(bool(decision["violation"]))
+    return texts, labels
+
+
+class PreClassifierStage:
+    """Decides which messages may skip the LLM and tracks how well that works.
+
+    Args:
+        classifier: Model scoring violation probability; None disables the stage.
+        threshold: Messages scoring below this skip the LLM.
+        sample_rate: Fraction of would-be skips still sent to the LLM for measurement.
+    """
+
+    def __init__(
+        self,
+        classifier: Optional[Classifier] = None,
+        threshold: Optional[float] = None,
+        sample_rate: Optional[float] = None,
+    ):
+        self.classifier = classifier
+        self.threshold = threshold if threshold is not None else float(os.getenv("AI_PRECLASSIFIER_THRESHOLD", "0.05"))
+        self.sample_rate = (
+            sample_rate if sample_rate is not None else float(os.getenv("AI_PRECLASSIFIER_SAMPLE_RATE", "0.05"))
+        )
+        self._random = random.Random()
+
+        self.scored = 0
+        self.skipped = 0
+        self.sampled = 0
+        self.sampled_decisions = 0
+        self.sampled_violations = 0
+
+    @classmethod
+    def from_env(cls) -> "PreClassifierStage":
+        """Build the stage from ``AI_PRECLASSIFIER_*`` settings, loading the trained model if enabled."""
+        classifier = None
+        if os.getenv("AI_PRECLASSIFIER_ENABLED", "false").lower() in ("1", "true", "yes"):
+            path = os.getenv("AI_PRECLASSIFIER_PATH", DEFAULT_MODEL_PATH)
+            try:
+                classifier = HashedNGramClassifier.load(path)
+                print(f"PreClassifier: Loaded model from {path}.")
+            except (OSError, KeyError, ValueError) as e:
+                print(f"PreClassifier: Could not load model from {path}; stage disabled: {e}")
+        return cls(classifier)
+
+    @property
+    def enabled(self) -> bool:
+        return self.classifier is not None
+
+    def evaluate(self, content: str) -> Tuple[bool, Optional[float]]:
+        """Return (skip_llm, score). Sampled would-be skips return False with their score."""
+        if self.classifier is None or not content:
+            return False, None
+        score = self.classifier.predict_proba(classifier_text(content))
+        self.scored += 1
+        if score >= self.threshold:
+            return False, None
+        if self._random.random() < self.sample_rate:
+            self.sampled += 1
+            return False, score
+        self.skipped += 1
+        return True, score
+
+    def record_sample(self, decision: Optional[Dict[str, Any]]) -> None:
+        """Record the LLM's verdict on a sampled would-be skip."""
+        if not isinstance(decision, dict) or "violation" not in decision:
+            return
+        self.sampled_decisions += 1
+        if decision["violation"]:
+            self.sampled_violations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "scored": self.scored,
+            "skipped": self.skipped,
+            "sampled": self.sampled,
+            "skip_rate": self.skipped / self.scored if self.scored else 0.0,
+            "disagreement_rate": self.sampled_violations / self.sampled_decisions if self.sampled_decisions else 0.0,
+            "sampled_violations": self.sampled_violations,
+        }
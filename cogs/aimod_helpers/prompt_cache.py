@@ -0,0 +1,53 @@
+"""
+Memoized, cache-friendly system prompts.
+
+The system prompt depends only on the rules text and the request mode, so it
+is formatted once per rules version and the same string is reused for every
+message after that. Keeping the prefix byte-identical across a guild's
+requests is also what provider-side prompt caching keys on. OpenAI and Gemini
+cache long identical prefixes automatically, while Anthropic models need an
+explicit ``cache_control`` breakpoint on the system block.
+"""
+
+import functools
+import os
+from typing import Any, Dict
+
+from .system_prompt import SYSTEM_PROMPT_TEMPLATE
+
+PROMPT_CACHE_SIZE = int(os.getenv("AI_PROMPT_CACHE_SIZE", "1024"))
+
+# Model name prefixes whose providers accept Anthropic-style cache_control blocks
+CACHE_CONTROL_PREFIXES = ("anthropic/", "openrouter/anthropic/", "vertex_ai/claude", "bedrock/anthropic.")
+
+
+@functools.lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def format_system_prompt(rules_text: str, suffix: str = "") -> str:
+    """Format the system prompt for ``rules_text``, reusing the string for repeated rules."""
+    return SYSTEM_PROMPT_TEMPLATE.format(rules_text=rules_text) + suffix
+
+
+def supports_cache_control(model: str) -> bool:
+    return model.lower().startswith(CACHE_CONTROL_PREFIXES)
+
+
+def system_message(model: str, rules_text: str, suffix: str = "") -> Dict[str, Any]:
+    """Build the system message, marked as a cache breakpoint where the provider needs one."""
+    text = format_system_prompt(rules_text, suffix)
+    if supports_cache_control(model):
+        return {
+            "role": "system",
+            "content": [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}],
+        }
+    return {"role": "system", "content": text}
+
+
+def prompt_cache_stats() -> Dict[str, Any]:
+    info = format_system_prompt.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "size": info.currsize,
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit_rate": info.hits / lookups if lookups else 0.0,
+    }
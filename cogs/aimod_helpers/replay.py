@@ -0,0 +1,322 @@
+"""
+Offline replay and shadow evaluation of the moderation pipeline.
+
+Stored ``ai_decisions`` rows or a JSONL corpus are replayed through
+``CoreAICog.match_keyword_rule`` and ``CoreAICog.query_vertex_ai`` with
+bounded concurrency, without Discord or the database. Usually this runs
+against a local OpenAI-compatible stand-in server. The report covers
+throughput, latency percentiles, token usage and how the new decisions differ
+from the recorded ones.
+
+JSONL corpus lines look like::
+
+    {"id": "1", "guild_id": 1, "content": "free nitro", "rules": "1. No spam",
+     "keyword_rules": [{"keywords": ["nitro"]}], "expected": {"violation": true, "action": "DELETE"}}
+"""
+
+import asyncio
+import contextvars
+import json
+import math
+import time
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from database.operations import get_ai_decisions, prime_guild_config_snapshot
+
+from .decision_cache import DecisionCache
+
+DEFAULT_RULES = "1. Be respectful.\n2. No spam or scams.\n3. No NSFW content outside NSFW channels."
+DIFF_FIELDS = ("violation", "action", "rule_violated")
+
+_current_result: contextvars.ContextVar[Optional["ReplayResult"]] = contextvars.ContextVar(
+    "replay_current_result", default=None
+)
+
+
+@dataclass
+class ReplayCase:
+    """One message to replay."""
+
+    case_id: str
+    content: str
+    guild_id: int = 0
+    rules_text: Optional[str] = None
+    keyword_rules: List[Dict[str, Any]] = field(default_factory=list)
+    expected: Optional[Dict[str, Any]] = None
+
+
+@dataclass
+class ReplayResult:
+    """Outcome of replaying one case."""
+
+    case: ReplayCase
+    decision: Optional[Dict[str, Any]] = None
+    keyword_rule: Optional[Dict[str, Any]] = None
+    latency: float = 0.0
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    error: Optional[str] = None
+
+    def diff(self) -> Dict[str, tuple]:
+        """Fields whose replayed value differs from the recorded decision."""
+        if not self.case.expected or not self.decision:
+            return {}
+        return {
+            key: (self.case.expected.get(key), self.decision.get(key))
+            for key in DIFF_FIELDS
+            if key in self.case.expected and self.case.expected.get(key) != self.decision.get(key)
+        }
+
+
+def load_jsonl(path: str) -> List[ReplayCase]:
+    """Read replay cases from a JSONL corpus."""
+    cases = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            data = json.loads(line)
+            cases.append(
+                ReplayCase(
+                    case_id=str(data.get("id", line_number)),
+                    content=data.get("content", ""),
+                    guild_id=int(data.get("guild_id", 0)),
+                    rules_text=data.get("rules"),
+                    keyword_rules=data.get("keyword_rules", []),
+                    expected=data.get("expected"),
+                )
+            )
+    return cases
+
+
+async def load_ai_decisions(guild_id: int, limit: int = 500) -> List[ReplayCase]:
+    """Build replay cases from a guild's logged decisions, skipping failed ones."""
+    cases = []
+    for row in await get_ai_decisions(guild_id, limit=limit):
+        decision = row.get("ai_decision") or {}
+        content = row.get("message_content_snippet") or ""
+        if not content or "violation" not in decision:
+            continue
+        cases.append(ReplayCase(case_id=str(row["message_id"]), content=content, guild_id=guild_id, expected=decision))
+    return cases
+
+
+def replay_message(case: ReplayCase, message_id: int):
+    """Minimal stand-in for a discord.Message with everything the prompt builder reads."""
+
+    async def no_history(limit=None, before=None):
+        return
+        yield
+
+    permissions = SimpleNamespace(administrator=False, manage_messages=False)
+    author = SimpleNamespace(
+        id=1, bot=False, display_name="replay-user", guild_permissions=permissions, roles=[], mention="@replay-user"
+    )
+    channel = SimpleNamespace(id=1, name="replay", category=None, nsfw=False, history=no_history)
+    guild = SimpleNamespace(id=case.guild_id, owner_id=0, name="replay")
+    return SimpleNamespace(
+        id=message_id,
+        content=case.content,
+        author=author,
+        channel=channel,
+        guild=guild,
+        reference=None,
+        attachments=[],
+    )
+
+
+def percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+@dataclass
+class ReplayReport:
+    """Aggregate metrics for a replay run."""
+
+    results: List[ReplayResult]
+    wall_time: float
+
+    def summary(self) -> Dict[str, Any]:
+        latencies = [result.latency for result in self.results if result.error is None]
+        compared = [result for result in self.results if result.case.expected and result.decision]
+        diffs = [result for result in compared if result.diff()]
+        return {
+            "cases": len(self.results),
+            "errors": sum(1 for result in self.results if result.error),
+            "no_decision": sum(1 for result in self.results if result.error is None and not result.decision),
+            "throughput": len(self.results) / self.wall_time if self.wall_time else 0.0,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "llm_calls": sum(result.llm_calls for result in self.results),
+            "prompt_tokens": sum(result.prompt_tokens for result in self.results),
+            "completion_tokens": sum(result.completion_tokens for result in self.results),
+            "keyword_matches": sum(1 for result in self.results if result.keyword_rule is not None),
+            "compared": len(compared),
+            "diffs": len(diffs),
+            "agreement": 1 - len(diffs) / len(compared) if compared else 0.0,
+        }
+
+    def format(self, max_diffs: int = 20) -> str:
+        s = self.summary()
+        lines = [
+            f"Cases: {s['cases']} (errors {s['errors']}, no decision {s['no_decision']})",
+            f"Wall time: {self.wall_time:.2f}s | Throughput: {s['throughput']:.1f} msg/s",
+            f"Latency: p50 {s['p50'] * 1000:.0f} ms | p95 {s['p95'] * 1000:.0f} ms | p99 {s['p99'] * 1000:.0f} ms",
+            f"LLM calls: {s['llm_calls']} | Tokens: {s['prompt_tokens']} prompt / {s['completion_tokens']} completion",
+            f"Keyword rule matches: {s['keyword_matches']}",
+            f"Decisions compared: {s['compared']} | Diffs: {s['diffs']} | Agreement: {s['agreement']:.1%}",
+        ]
+        shown = 0
+        for result in self.results:
+            diff = result.diff()
+            if not diff or shown >= max_diffs:
+                continue
+            shown += 1
+            changes = ", ".join(f"{key}: {old!r} -> {new!r}" for key, (old, new) in diff.items())
+            lines.append(f"  [{result.case.case_id}] {result.case.content[:60]!r}: {changes}")
+        return "\n".join(lines)
+
+
+class ReplayHarness:
+    """Replays cases through a CoreAICog with bounded concurrency.
+
+    Args:
+        cog: The CoreAICog whose pipeline is exercised.
+        model: Model configured for every replayed guild.
+        concurrency: Cases processed at once.
+        default_rules: Rules text used for cases that do not carry their own.
+        use_decision_cache: Keep the cog's decision cache; off by default so every case hits the LLM.
+        batching: Route cases through the cog's micro-batcher when it has one. Token usage
+            of a batch is attributed to the case that opened it.
+    """
+
+    def __init__(
+        self,
+        cog,
+        model: str,
+        concurrency: int = 8,
+        default_rules: str = DEFAULT_RULES,
+        use_decision_cache: bool = False,
+        batching: bool = False,
+    ):
+        self.cog = cog
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.default_rules = default_rules
+        if not batching:
+            cog.batcher = None
+        if not use_decision_cache:
+            cog.decision_cache = DecisionCache(maxsize=0, use_redis=False)
+        # Replays use the shared key rather than looking up guild keys in the database.
+        cog._resolve_api_credentials = self._shared_credentials
+        self._wrap_client()
+
+    @staticmethod
+    async def _shared_credentials(guild_id: int):
+        return None, None
+
+    def _wrap_client(self) -> None:
+        """Attribute LLM calls and token usage to the case being replayed."""
+        client = self.cog.genai_client
+        generate_content = client.generate_content
+        stream_content = client.stream_content
+
+        def record_usage(result: Optional[ReplayResult], usage: Optional[Dict[str, Any]]) -> None:
+            if result is None:
+                return
+            usage = usage or {}
+            result.prompt_tokens += usage.get("prompt_tokens", 0) or 0
+            result.completion_tokens += usage.get("completion_tokens", 0) or 0
+
+        async def recording_generate_content(*args, **kwargs):
+            response = await generate_content(*args, **kwargs)
+            result = _current_result.get()
+            if result is not None:
+                result.llm_calls += 1
+            record_usage(result, response.usage)
+            return response
+
+        def recording_stream_content(*args, on_usage=None, **kwargs):
+            result = _current_result.get()
+            if result is not None:
+                result.llm_calls += 1
+
+            def on_stream_usage(usage):
+                record_usage(result, usage)
+                if on_usage is not None:
+                    on_usage(usage)
+
+            return stream_content(*args, on_usage=on_stream_usage, **kwargs)
+
+        client.generate_content = recording_generate_content
+        client.stream_content = recording_stream_content
+
+    async def _replay(self, case: ReplayCase, message_id: int) -> ReplayResult:
+        result = ReplayResult(case=case)
+        _current_result.set(result)
+        rules_text = case.rules_text or self.default_rules
+        prime_guild_config_snapshot(
+            case.guild_id, {"AI_MODEL": self.model, "SERVER_RULES": rules_text, "AI_KEYWORD_RULES": case.keyword_rules}
+        )
+        start = time.perf_counter()
+        try:
+            result.keyword_rule = self.cog.match_keyword_rule(case.content, case.keyword_rules)
+            message = replay_message(case, message_id)
+            user_history = "No prior infractions recorded."
+            if self.cog.batcher:
+                result.decision = await self.cog.query_vertex_ai_batched(
+                    message, case.content, user_history, custom_rules_text=rules_text
+                )
+            else:
+                result.decision = await self.cog.query_vertex_ai(
+                    message, case.content, user_history, None, custom_rules_text=rules_text
+                )
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        result.latency = time.perf_counter() - start
+        return result
+
+    async def run(self, cases: List[ReplayCase]) -> ReplayReport:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(index: int, case: ReplayCase) -> ReplayResult:
+            async with semaphore:
+                # Each case runs in its own task, so the context variable is per case.
+                return await self._replay(case, message_id=index + 1)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(bounded(index, case) for index, case in enumerate(cases)))
+        return ReplayReport(results=list(results), wall_time=time.perf_counter() - start)
+
+
+def write_results(report: ReplayReport, path: str) -> None:
+    """Write per-case results as JSONL for later comparison between runs."""
+    with open(path, "w", encoding="utf-8") as f:
+        for result in report.results:
+            f.write(
+                json.dumps(
+                    {
+                        "id": result.case.case_id,
+                        "content": result.case.content,
+                        "expected": result.case.expected,
+                        "decision": result.decision,
+                        "keyword_rule": result.keyword_rule,
+                        "latency": result.latency,
+                        "llm_calls": result.llm_calls,
+                        "prompt_tokens": result.prompt_tokens,
+                        "completion_tokens": result.completion_tokens,
+                        "error": result.error,
+                        "diff": {key: list(values) for key, values in result.diff().items()},
+                    },
+                    default=str,
+                )
+                + "\n"
+            )
@@ -0,0 +1,73 @@
+"""
+Per-stage timing for the moderation pipeline.
+
+``StageTimings`` records how long each named stage of a single request took,
+including stages that run concurrently. ``StageStats`` aggregates those
+timings across requests so they can be reported by monitoring commands.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Dict, Optional
+
+
+class StageTimings:
+    """Durations (seconds) of the named stages of one request."""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, duration: float) -> None:
+        """Record a duration measured elsewhere, e.g. a milestone inside a stage."""
+        self.stages[name] = self.stages.get(name, 0.0) + duration
+
+    async def run(self, name: str, awaitable: Awaitable[Any]) -> Any:
+        """Await ``awaitable`` and record its duration under ``name``."""
+        with self.stage(name):
+            return await awaitable
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    def summary(self) -> str:
+        parts = [f"{name}={duration * 1000:.1f}ms" for name, duration in self.stages.items()]
+        parts.append(f"total={self.elapsed * 1000:.1f}ms")
+        return " ".join(parts)
+
+
+class StageStats:
+    """Running count, mean and max duration per stage across many requests."""
+
+    def __init__(self):
+        self._count: Dict[str, int] = {}
+        self._total: Dict[str, float] = {}
+        self._max: Dict[str, float] = {}
+
+    def record(self, timings: StageTimings, total_name: Optional[str] = None) -> None:
+        stages = dict(timings.stages)
+        if total_name:
+            stages[total_name] = timings.elapsed
+        for name, duration in stages.items():
+            self._count[name] = self._count.get(name, 0) + 1
+            self._total[name] = self._total.get(name, 0.0) + duration
+            self._max[name] = max(self._max.get(name, 0.0), duration)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {
+                "count": count,
+                "avg": self._total[name] / count,
+                "max": self._max[name],
+            }
+            for name, count in self._count.items()
+        }
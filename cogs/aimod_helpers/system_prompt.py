@@ -100,6 +100,30 @@ Example Response (Suicidal Content):
 }}
 """
 
+BATCH_PROMPT_SUFFIX = """
+BATCH MODE:
+You will receive several messages at once, each under its own "### Message" heading with a message_id.
+Judge every message independently, using only its own context block.
+Respond ONLY with a single JSON object of the form:
+{
+  "decisions": [
+    {
+      "message_id": "<message_id exactly as given>",
+      "reasoning": "...",
+      "violation": false,
+      "rule_violated": "None",
+      "action": "IGNORE"
+    }
+  ]
+}
+Include exactly one entry per message, with the same keys as the single-message format above.
+"""
+
+STREAMING_PROMPT_SUFFIX = """
+KEY ORDER:
+Write the keys in this order: "violation", "rule_violated", "action", then "reasoning" (and "notify_mods_message" if used).
+"""
+
 SUICIDAL_HELP_RESOURCES = """
 Hey, I'm really concerned to hear you're feeling this way. Please know that you're not alone and there are people who want to support you.
 Your well-being is important to us on this server.
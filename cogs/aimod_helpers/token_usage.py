@@ -0,0 +1,125 @@
+"""
+Per-guild LLM token accounting.
+
+``TokenUsageRecorder`` adds up ``LiteLLMResponse.usage`` per guild, model and
+UTC day in memory and periodically flushes the totals into the
+``ai_token_usage`` rollup table in one batched upsert, so moderation requests
+never wait on a database write for accounting. Streams whose provider sends
+no usage block are still counted, with tokens estimated by ``estimate_usage``.
+"""
+
+import asyncio
+import datetime
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from database.operations import add_token_usage
+
+TOKEN_USAGE_FLUSH_INTERVAL = float(os.getenv("AI_TOKEN_USAGE_FLUSH_INTERVAL", "60"))
+
+USAGE_FIELDS = ("requests", "prompt_tokens", "completion_tokens", "cached_tokens")
+
+UsageKey = Tuple[int, datetime.date, str]
+
+# Rough characters per token for English text, used when a provider reports no usage
+CHARS_PER_TOKEN = 4
+
+
+def _text_parts(messages: List[Dict[str, Any]]):
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            yield content
+        elif isinstance(content, list):
+            # Image parts are billed by the provider's own rules and left out of the estimate
+            yield from (part.get("text", "") for part in content if part.get("type") == "text")
+
+
+def estimate_usage(messages: List[Dict[str, Any]], completion_text: str) -> Dict[str, int]:
+    """Estimate the token usage of a request from the length of its text."""
+    prompt_chars = sum(len(text) for text in _text_parts(messages))
+    return {
+        "prompt_tokens": -(-prompt_chars // CHARS_PER_TOKEN),
+        "completion_tokens": -(-len(completion_text or "") // CHARS_PER_TOKEN),
+    }
+
+
+class TokenUsageRecorder:
+    """Buffers token usage and writes it to the database in batches.
+
+    Args:
+        flush_interval: Seconds between background flushes.
+    """
+
+    def __init__(self, flush_interval: float = TOKEN_USAGE_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._pending: Dict[UsageKey, Dict[str, int]] = {}
+        self._totals: Dict[int, Dict[str, int]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.failed_flushes = 0
+
+    def record(self, guild_id: int, model: str, usage: Optional[Dict[str, Any]]) -> None:
+        """Count one request and its token usage against a guild and model."""
+        usage = usage or {}
+        counts = {
+            "requests": 1,
+            "prompt_tokens": usage.get("prompt_tokens") or 0,
+            "completion_tokens": usage.get("completion_tokens") or 0,
+            "cached_tokens": usage.get("cached_tokens") or 0,
+        }
+        key = (guild_id, datetime.datetime.now(datetime.timezone.utc).date(), model)
+        self._add(self._pending.setdefault(key, dict.fromkeys(USAGE_FIELDS, 0)), counts)
+        self._add(self._totals.setdefault(guild_id, dict.fromkeys(USAGE_FIELDS, 0)), counts)
+
+    @staticmethod
+    def _add(target: Dict[str, int], counts: Dict[str, int]) -> None:
+        for name in USAGE_FIELDS:
+            target[name] += counts[name]
+
+    async def flush(self) -> bool:
+        """Write buffered usage to the rollup table; failed rows are kept for the next flush."""
+        if not self._pending:
+            return True
+        pending, self._pending = self._pending, {}
+        rows: List[Dict[str, Any]] = [
+            {"guild_id": guild_id, "usage_date": usage_date, "model": model, **counts}
+            for (guild_id, usage_date, model), counts in pending.items()
+        ]
+        if await add_token_usage(rows):
+            self.flushes += 1
+            return True
+        self.failed_flushes += 1
+        for key, counts in pending.items():
+            self._add(self._pending.setdefault(key, dict.fromkeys(USAGE_FIELDS, 0)), counts)
+        return False
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        """Start periodic flushing on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Stop periodic flushing and write whatever is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def guild_totals(self, guild_id: int) -> Dict[str, int]:
+        """Usage recorded for a guild since startup, flushed or not."""
+        return dict(self._totals.get(guild_id, dict.fromkeys(USAGE_FIELDS, 0)))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "guilds": len(self._totals),
+            "pending_rows": len(self._pending),
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+        }
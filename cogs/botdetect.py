@@ -5,10 +5,13 @@ import asyncio
 from typing import List, Dict, Any, Optional
 
 # Import database operations
+from database.cache import register_invalidation_handler, unregister_invalidation_handler
 from database.operations import (
     set_botdetect_config,
     get_all_botdetect_config,
 )
+from .botdetect_helpers.detector import BotDetectorCache
+from .botdetect_helpers.url_scanner import UrlScanner
 
 # Legacy configuration paths (kept for compatibility but not used)
 BOTDETECT_CONFIG_DIR = "wdiscordbot-json-data"
@@ -37,8 +40,6 @@ DEFAULT_SCAM_KEYWORDS = [
     "free skins",
     "skin giveaway",
     "steam giveaway",
-    "steamcommunity",
-    "steam-community",
     # Cryptocurrency/investment scams
     "crypto giveaway",
     "bitcoin giveaway",
@@ -81,13 +82,7 @@ DEFAULT_SCAM_KEYWORDS = [
     "account verification",
     "verify your account",
     "discord security",
-    # Suspicious domains (partial matches)
-    "bit.ly",
-    "tinyurl",
-    "discord-nitro",
-    "steam-community",
-    "steamcommunlty",
-    "steampowered",
+    # Scam domains are matched as links by the link scanner (see configs/scam_domains.txt)
 ]
 
 # Legacy variables (now use database)
@@ -100,62 +95,35 @@ async def save_botdetect_config():
     pass
 
 
-async def get_guild_botdetect_config(guild_id: int) -> Dict[str, Any]:
-    """Get bot detection configuration for a guild from database."""
-    try:
-        config = await get_all_botdetect_config(guild_id)
-
-        # If no config exists, return default configuration
-        if not config:
-            default_config = {
-                "enabled": False,
-                "keywords": DEFAULT_SCAM_KEYWORDS.copy(),
-                "action": "warn",
-                "timeout_duration": 300,
-                "log_channel": None,
-                "whitelist_roles": [],
-                "whitelist_users": [],
-            }
-            # Save default config to database
-            for key, value in default_config.items():
-                await set_botdetect_config(guild_id, key, value)
-            return default_config
-
-        # Convert database format to expected format
-        result = {}
-        for key, value in config.items():
-            result[key] = value
-
-        # Ensure all required keys exist with defaults
-        defaults = {
-            "enabled": False,
-            "keywords": DEFAULT_SCAM_KEYWORDS.copy(),
-            "action": "warn",
-            "timeout_duration": 300,
-            "log_channel": None,
-            "whitelist_roles": [],
-            "whitelist_users": [],
-        }
+def default_botdetect_config() -> Dict[str, Any]:
+    """Return a fresh copy of the default bot detection configuration."""
+    return {
+        "enabled": False,
+        "scan_links": True,
+        "keywords": DEFAULT_SCAM_KEYWORDS.copy(),
+        "action": "warn",
+        "timeout_duration": 300,
+        "log_channel": None,
+        "whitelist_roles": [],
+        "whitelist_users": [],
+    }
 
-        for key, default_value in defaults.items():
-            if key not in result:
-                result[key] = default_value
-                await set_botdetect_config(guild_id, key, default_value)
 
-        return result
+async def get_guild_botdetect_config(guild_id: int) -> Dict[str, Any]:
+    """Get bot detection configuration for a guild from database.
 
+    Keys the guild has never set fall back to the defaults. Defaults are not
+    written back; the config command saves every key once something changes.
+    """
+    try:
+        config = await get_all_botdetect_config(guild_id)
     except Exception as e:
         print(f"Failed to get botdetect config for guild {guild_id}: {e}")
-        # Return default config on error
-        return {
-            "enabled": False,
-            "keywords": DEFAULT_SCAM_KEYWORDS.copy(),
-            "action": "warn",
-            "timeout_duration": 300,
-            "log_channel": None,
-            "whitelist_roles": [],
-            "whitelist_users": [],
-        }
+        config = {}
+
+    result = default_botdetect_config()
+    result.update(config)
+    return result
 
 
 async def set_guild_botdetect_config(guild_id: int, config: Dict[str, Any]):
@@ -175,8 +143,17 @@ class BotDetectCog(commands.Cog):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        # Compiled keyword and whitelist checks per guild, dropped when the guild's config changes
+        self.detectors = BotDetectorCache(get_guild_botdetect_config)
+        register_invalidation_handler(self.detectors.on_config_invalidation)
+        # Links to domains on the blocklist file, with per-host verdicts cached
+        self.url_scanner = UrlScanner.from_env()
         print("BotDetectCog initialized.")
 
+    def cog_unload(self):
+        """Clean up when cog is unloaded."""
+        unregister_invalidation_handler(self.detectors.on_config_invalidation)
+
     @commands.hybrid_group(name="botdetect", description="Bot detection commands.")
     async def botdetect(self, ctx: commands.Context):
         """Bot detection commands."""
@@ -187,6 +164,7 @@ class BotDetectCog(commands.Cog):
         action="Action to take when bot is detected",
         keywords="Comma-separated list of keywords to detect (leave empty to view current)",
         enabled="Enable or disable bot detection",
+        scan_links="Check links against the scam domain blocklist",
         timeout_duration="Duration in seconds for timeout action (default: 300)",
         log_channel="Channel to log bot detection events",
         add_keyword="Add a single keyword to the list",
@@ -214,6 +192,7 @@ class BotDetectCog(commands.Cog):
         action: Optional[app_commands.Choice[str]] = None,
         keywords: Optional[str] = None,
         enabled: Optional[bool] = None,
+        scan_links: Optional[bool] = None,
         timeout_duration: Optional[int] = None,
         log_channel: Optional[discord.TextChannel] = None,
         add_keyword: Optional[str] = None,
@@ -246,6 +225,7 @@ class BotDetectCog(commands.Cog):
                 action,
                 keywords,
                 enabled,
+                scan_links,
                 timeout_duration,
                 log_channel,
                 add_keyword,
@@ -272,6 +252,12 @@ class BotDetectCog(commands.Cog):
 
             embed.add_field(name="Action", value=config["action"].title(), inline=True)
 
+            embed.add_field(
+                name="Link Scanning",
+                value="On" if config["scan_links"] else "Off",
+                inline=True,
+            )
+
             if config["action"] == "timeout":
                 embed.add_field(
                     name="Timeout Duration",
@@ -332,6 +318,10 @@ class BotDetectCog(commands.Cog):
             config["enabled"] = enabled
             changes.append(f"Status: {'Enabled' if enabled else 'Disabled'}")
 
+        if scan_links is not None:
+            config["scan_links"] = scan_links
+            changes.append(f"Link scanning: {'On' if scan_links else 'Off'}")
+
         if action is not None:
             config["action"] = action.value
             changes.append(f"Action: {action.value.title()}")
@@ -493,11 +483,6 @@ class BotDetectCog(commands.Cog):
                 for kw in DEFAULT_SCAM_KEYWORDS
                 if any(word in kw for word in ["support", "admin", "staff", "official", "team"])
             ],
-            "Suspicious Domains": [
-                kw
-                for kw in DEFAULT_SCAM_KEYWORDS
-                if any(word in kw for word in ["bit.ly", "tinyurl", "discrod", "steampowered"])
-            ],
         }
 
         # Add uncategorized keywords
@@ -525,6 +510,13 @@ class BotDetectCog(commands.Cog):
                     inline=False,
                 )
 
+        embed.add_field(
+            name="Scam Domains",
+            value=f"Links to {len(self.url_scanner.blocklist)} blocklisted domains are caught separately "
+            "while link scanning is on.",
+            inline=False,
+        )
+
         embed.add_field(
             name="💡 Usage",
             value="Use `/botdetect config load_default_keywords:True` to load these keywords into your server's configuration.",
@@ -636,6 +628,9 @@ class BotDetectCog(commands.Cog):
         # Keywords count
         embed.add_field(name="Keywords", value=f"{len(config['keywords'])} configured", inline=True)
 
+        # Link scanning
+        embed.add_field(name="Link Scanning", value="On" if config["scan_links"] else "Off", inline=True)
+
         # Log channel
         if config["log_channel"]:
             log_channel = ctx.guild.get_channel(config["log_channel"])
@@ -680,33 +675,28 @@ class BotDetectCog(commands.Cog):
         if message.author.bot or not message.guild or message.author == self.bot.user:
             return
 
-        guild_id = message.guild.id
-        config = await get_guild_botdetect_config(guild_id)
+        detector = await self.detectors.get(message.guild.id)
 
         # Check if bot detection is enabled
-        if not config["enabled"]:
+        if not detector.enabled:
             return
 
-        # Check if user is whitelisted
-        if message.author.id in config["whitelist_users"]:
-            return
-
-        # Check if user has whitelisted role
-        user_role_ids = [role.id for role in message.author.roles]
-        if any(role_id in config["whitelist_roles"] for role_id in user_role_ids):
+        # Check if the user or one of their roles is whitelisted
+        if detector.is_whitelisted(message.author):
             return
 
         # Check if message contains any keywords
-        message_content = message.content.lower()
-        detected_keywords = []
+        detected_keywords = detector.detect(message.content)
 
-        for keyword in config["keywords"]:
-            if keyword in message_content:
-                detected_keywords.append(keyword)
+        # Check links against the domain blocklist
+        if detector.scan_links:
+            detected_keywords += [
+                f"{verdict.host} (blocked link)" for verdict in self.url_scanner.scan(message.content)
+            ]
 
         # If keywords detected, take action
         if detected_keywords:
-            await self._handle_bot_detection(message, detected_keywords, config)
+            await self._handle_bot_detection(message, detected_keywords, detector.action_config)
 
     async def _handle_bot_detection(self, message: discord.Message, keywords: List[str], config: Dict[str, Any]):
         """Handle detected bot message based on configuration."""
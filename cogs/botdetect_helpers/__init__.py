@@ -0,0 +1,3 @@
+"""
+Bot detection helpers package for the BotDetectCog.
+"""
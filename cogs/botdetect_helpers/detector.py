@@ -0,0 +1,156 @@
+"""
+Compiled per-guild bot detection settings.
+
+``BotDetectCog.on_message`` used to read the guild's botdetect config for every
+message and scan the keyword list with one substring search per keyword. A
+``BotDetector`` is built once from a guild's config. It holds the keywords
+compiled into an Aho-Corasick automaton, the whitelisted users and roles as
+frozensets, whether links are checked against the domain blocklist, and the
+action settings. Keywords older defaults used to match links by substring are
+dropped when building it, see ``LEGACY_LINK_KEYWORDS``. ``BotDetectorCache`` keeps one detector per guild in process
+and drops it when a ``botdetect_config`` invalidation names the guild, so the
+config is only re-read after it changes.
+"""
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, List, Optional
+
+from cachetools import TTLCache
+
+from ..aimod_helpers.keyword_matcher import NO_MATCH, AhoCorasick
+
+DETECTOR_CACHE_SIZE = int(os.getenv("BOTDETECT_CACHE_SIZE", "5000"))
+# Upper bound on how long a detector lives when an invalidation is missed
+DETECTOR_CACHE_TTL = float(os.getenv("BOTDETECT_CACHE_TTL", "600"))
+
+# Settings the detection action needs, passed on to the cog's handlers
+ACTION_KEYS = ("action", "timeout_duration", "log_channel")
+
+# Link keywords from older defaults that guilds may still have stored. The real
+# Steam domains and the shorteners flagged legitimate links, so they are always
+# dropped; the lookalikes are covered by the link scanner while it is enabled.
+LEGACY_LEGITIMATE_KEYWORDS = frozenset({"steamcommunity", "steampowered", "bit.ly", "tinyurl"})
+LEGACY_LINK_KEYWORDS = frozenset({"steam-community", "steamcommunlty", "discord-nitro"})
+
+ConfigLoader = Callable[[int], Awaitable[Dict[str, Any]]]
+
+
+def _ids(values: Optional[Iterable[Any]]) -> FrozenSet[int]:
+    ids = set()
+    for value in values or ():
+        try:
+            ids.add(int(value))
+        except (TypeError, ValueError):
+            continue
+    return frozenset(ids)
+
+
+class BotDetector:
+    """A guild's bot detection config, compiled for per-message checks."""
+
+    __slots__ = (
+        "enabled",
+        "scan_links",
+        "keywords",
+        "whitelist_users",
+        "whitelist_roles",
+        "action_config",
+        "_automaton",
+    )
+
+    def __init__(self, config: Dict[str, Any]):
+        self.enabled = bool(config.get("enabled", False))
+        self.scan_links = bool(config.get("scan_links", True))
+        # An empty keyword would be found in every message
+        dropped = LEGACY_LEGITIMATE_KEYWORDS | LEGACY_LINK_KEYWORDS if self.scan_links else LEGACY_LEGITIMATE_KEYWORDS
+        keywords = (keyword.lower() for keyword in config.get("keywords") or () if isinstance(keyword, str))
+        self.keywords = tuple(dict.fromkeys(keyword for keyword in keywords if keyword and keyword not in dropped))
+        self.whitelist_users = _ids(config.get("whitelist_users"))
+        self.whitelist_roles = _ids(config.get("whitelist_roles"))
+        self.action_config = {key: config.get(key) for key in ACTION_KEYS}
+        self._automaton = (
+            AhoCorasick([(keyword, index) for index, keyword in enumerate(self.keywords)]) if self.keywords else None
+        )
+
+    def is_whitelisted(self, member: Any) -> bool:
+        """Whether a member is whitelisted directly or through one of their roles."""
+        if member.id in self.whitelist_users:
+            return True
+        if not self.whitelist_roles:
+            return False
+        return not self.whitelist_roles.isdisjoint(role.id for role in getattr(member, "roles", ()))
+
+    def detect(self, content: str) -> List[str]:
+        """Return the keywords found in ``content``, in configured order."""
+        if self._automaton is None or not content:
+            return []
+        content = content.lower()
+        if self._automaton.search(content) == NO_MATCH:
+            return []
+        # Only messages that matched pay for listing every keyword they contain
+        return [keyword for keyword in self.keywords if keyword in content]
+
+
+class BotDetectorCache:
+    """One ``BotDetector`` per guild, rebuilt only after the guild's config changes.
+
+    Concurrent cold lookups for the same guild share a single load.
+
+    Args:
+        loader: Coroutine function returning a guild's full botdetect config.
+        maxsize: Guilds held in process.
+        ttl: Seconds a detector is kept before its config is read again.
+    """
+
+    def __init__(self, loader: ConfigLoader, maxsize: int = DETECTOR_CACHE_SIZE, ttl: float = DETECTOR_CACHE_TTL):
+        self._loader = loader
+        self._detectors: TTLCache = TTLCache(maxsize=max(1, maxsize), ttl=ttl)
+        self._loads: Dict[int, "asyncio.Task[BotDetector]"] = {}
+        self.hits = 0
+        self.builds = 0
+
+    def __len__(self) -> int:
+        return len(self._detectors)
+
+    async def _load(self, guild_id: int) -> BotDetector:
+        task = asyncio.current_task()
+        try:
+            detector = BotDetector(await self._loader(guild_id))
+            self.builds += 1
+            # The config may have been invalidated while it was being read
+            if self._loads.get(guild_id) is task:
+                self._detectors[guild_id] = detector
+            return detector
+        finally:
+            if self._loads.get(guild_id) is task:
+                del self._loads[guild_id]
+
+    async def get(self, guild_id: int) -> BotDetector:
+        """Return the detector for a guild, loading its config when not cached."""
+        detector = self._detectors.get(guild_id)
+        if detector is not None:
+            self.hits += 1
+            return detector
+        load = self._loads.get(guild_id)
+        if load is None:
+            load = asyncio.ensure_future(self._load(guild_id))
+            self._loads[guild_id] = load
+        return await asyncio.shield(load)
+
+    def invalidate(self, guild_id: Optional[int] = None) -> None:
+        """Drop the detector for a guild, or for every guild when ``guild_id`` is None."""
+        if guild_id is None:
+            self._detectors.clear()
+            self._loads.clear()
+            return
+        self._detectors.pop(guild_id, None)
+        self._loads.pop(guild_id, None)
+
+    def on_config_invalidation(self, payload: Dict[str, Any]) -> None:
+        """Invalidation handler: drop detectors whose botdetect config changed."""
+        if payload.get("scope") == "botdetect_config":
+            self.invalidate(payload.get("guild_id"))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"guilds": len(self._detectors), "hits": self.hits, "builds": self.builds}
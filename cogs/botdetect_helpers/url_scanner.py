@@ -0,0 +1,265 @@
+"""
+Link scanning for bot detection.
+
+Scam keywords such as "steamcommunlty" or "discord-nitro" used to be matched as
+substrings of the whole message. That also hits legitimate text and misses
+the same domain under another path or subdomain. ``UrlScanner`` pulls the
+links out of a message in one regex pass and reduces each to its host. Tricks
+like userinfo (``https://discord.com@evil.example``), ports, trailing dots,
+case and Unicode lookalikes are normalized away, and the host is checked
+against a local domain blocklist.
+
+The blocklist is a plain text file of domains, one per line. An entry also
+blocks its subdomains, so a lookup walks the host's parent domains through a
+set. An entry written as ``name.*`` blocks every registrable domain named
+``name`` under any public suffix, which covers lookalikes such as
+``steamcommunlty.net`` that get re-registered under new TLDs. Verdicts are
+cached per host with a TTL, and the file is reloaded when it changes on disk.
+"""
+
+import ipaddress
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+from cachetools import TTLCache
+
+DEFAULT_BLOCKLIST_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "configs", "scam_domains.txt")
+BLOCKLIST_PATH = os.getenv("BOTDETECT_DOMAIN_BLOCKLIST", DEFAULT_BLOCKLIST_PATH)
+VERDICT_CACHE_SIZE = int(os.getenv("BOTDETECT_VERDICT_CACHE_SIZE", "20000"))
+VERDICT_CACHE_TTL = float(os.getenv("BOTDETECT_VERDICT_CACHE_TTL", "3600"))
+# Seconds between checks of the blocklist file for changes
+BLOCKLIST_RELOAD_INTERVAL = float(os.getenv("BOTDETECT_BLOCKLIST_RELOAD_INTERVAL", "60"))
+
+log = logging.getLogger(__name__)
+
+# Links with a scheme or "www.", or bare host names with a letter-only TLD (``bit.ly/abc``)
+URL_PATTERN = re.compile(
+    r"(?:https?://|\bwww\.)[^\s<>()\[\]{}\"'`|]+"
+    r"|(?<![\w@.-])(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,24}(?![\w@-])(?:[:/][^\s<>()\[\]{}\"'`|]*)?",
+    re.IGNORECASE,
+)
+# Characters that end the host part of a link
+_HOST_DELIMITERS = re.compile(r"[/?#\\]")
+
+# Public suffixes of more than one label; any other host's registrable domain is its last two labels
+MULTI_LABEL_SUFFIXES = frozenset(
+    {
+        "ac.uk", "co.uk", "gov.uk", "ltd.uk", "me.uk", "net.uk", "org.uk", "plc.uk",
+        "com.au", "net.au", "org.au", "edu.au", "gov.au", "id.au",
+        "co.nz", "net.nz", "org.nz",
+        "co.jp", "ne.jp", "or.jp", "ac.jp",
+        "co.kr", "or.kr",
+        "co.in", "net.in", "org.in", "firm.in",
+        "co.za", "org.za", "web.za",
+        "com.br", "net.br", "org.br",
+        "com.ar", "com.mx", "com.co", "com.pe", "com.ve",
+        "com.cn", "net.cn", "org.cn", "com.hk", "com.tw", "com.sg", "com.my", "com.ph", "com.vn",
+        "com.tr", "com.ua", "com.pl", "com.ru", "net.ru", "org.ru",
+        "co.id", "co.il", "co.th",
+    }
+)  # fmt: skip
+
+
+@dataclass(frozen=True)
+class LinkVerdict:
+    """Result of checking one host against the blocklist."""
+
+    host: str
+    domain: str
+    blocked_by: Optional[str] = None
+
+    @property
+    def blocked(self) -> bool:
+        return self.blocked_by is not None
+
+
+def iter_urls(content: str) -> Iterator[str]:
+    """Yield the link-like tokens of a message, in order."""
+    # Every link has a dot in its host, so messages without one skip the regex
+    if not content or "." not in content:
+        return
+    for match in URL_PATTERN.finditer(content):
+        # Sentence punctuation right after a link is not part of it
+        yield match.group(0).rstrip(".,!?;:")
+
+
+def normalize_host(url: str) -> Optional[str]:
+    """Return the lower-case ASCII host of a link, or None when it has none."""
+    _, sep, rest = url.partition("://")
+    host = _HOST_DELIMITERS.split(rest if sep else url, 1)[0]
+    # Anything before "@" is userinfo, not the host: https://discord.com@evil.example
+    host = host.rpartition("@")[2].partition(":")[0].strip(".").lower()
+    if not host:
+        return None
+    if not host.isascii():
+        try:
+            host = host.encode("idna").decode("ascii")
+        except UnicodeError:
+            return None
+    return host
+
+
+def registrable_domain(host: str) -> str:
+    """The domain a host was registered under, e.g. ``evil.co.uk`` for ``login.evil.co.uk``."""
+    try:
+        ipaddress.ip_address(host)
+        return host
+    except ValueError:
+        pass
+    labels = host.split(".")
+    if len(labels) > 2 and ".".join(labels[-2:]) in MULTI_LABEL_SUFFIXES:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def load_blocklist(path: str) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    """Read a blocklist file into its normalized hosts and its ``name.*`` names."""
+    domains, names = set(), set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            entry = line.split("#", 1)[0].strip()
+            if entry.endswith(".*"):
+                name = normalize_host(entry[:-2])
+                if name and "." not in name:
+                    names.add(name)
+            elif entry:
+                host = normalize_host(entry)
+                if host:
+                    domains.add(host)
+    return frozenset(domains), frozenset(names)
+
+
+class DomainBlocklist:
+    """Blocked domains loaded from a file; an entry blocks the domain and all of its subdomains.
+
+    ``name.*`` entries block any registrable domain called ``name``, whatever its suffix.
+
+    Args:
+        path: Blocklist file. A missing file gives an empty blocklist.
+        reload_interval: Seconds between checks of the file's modification time.
+    """
+
+    def __init__(self, path: Optional[str] = None, reload_interval: float = BLOCKLIST_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.domains: FrozenSet[str] = frozenset()
+        self.names: FrozenSet[str] = frozenset()
+        self.version = 0
+        self._mtime: Optional[float] = None
+        self._checked = -float("inf")
+        self.reload()
+
+    def __len__(self) -> int:
+        return len(self.domains) + len(self.names)
+
+    def reload(self) -> bool:
+        """Re-read the file if it changed since the last load; returns whether it was reloaded."""
+        self._checked = time.monotonic()
+        if not self.path:
+            return False
+        try:
+            mtime = os.path.getmtime(self.path)
+            if mtime == self._mtime:
+                return False
+            domains, names = load_blocklist(self.path)
+        except OSError as e:
+            if self._mtime is not None:
+                log.error(f"Failed to reload domain blocklist {self.path}: {e}")
+            return False
+        self.domains = domains
+        self.names = names
+        self._mtime = mtime
+        self.version += 1
+        return True
+
+    def maybe_reload(self) -> bool:
+        if time.monotonic() - self._checked < self.reload_interval:
+            return False
+        return self.reload()
+
+    def match(self, host: str, domain: Optional[str] = None) -> Optional[str]:
+        """Return the blocklist entry covering ``host``, or None.
+
+        ``domain`` is the host's registrable domain, computed when not given.
+        """
+        domains = self.domains
+        if host in domains:
+            return host
+        index = host.find(".")
+        while index != -1:
+            parent = host[index + 1 :]
+            if parent in domains:
+                return parent
+            index = host.find(".", index + 1)
+        if self.names:
+            name = (domain or registrable_domain(host)).partition(".")[0]
+            if name in self.names:
+                return f"{name}.*"
+        return None
+
+
+class UrlScanner:
+    """Finds links to blocked domains in message content.
+
+    Args:
+        blocklist: Domains to block.
+        maxsize: Hosts whose verdicts are cached.
+        ttl: Seconds a cached verdict is kept.
+    """
+
+    def __init__(
+        self,
+        blocklist: DomainBlocklist,
+        maxsize: int = VERDICT_CACHE_SIZE,
+        ttl: float = VERDICT_CACHE_TTL,
+    ):
+        self.blocklist = blocklist
+        self._verdicts: TTLCache = TTLCache(maxsize=max(1, maxsize), ttl=ttl)
+        self._blocklist_version = blocklist.version
+        self.scanned = 0
+        self.cache_hits = 0
+        self.blocked = 0
+
+    @classmethod
+    def from_env(cls) -> "UrlScanner":
+        return cls(DomainBlocklist(BLOCKLIST_PATH))
+
+    def verdict(self, host: str) -> LinkVerdict:
+        """Check a normalized host, using the cached verdict when there is one."""
+        verdict = self._verdicts.get(host)
+        if verdict is not None:
+            self.cache_hits += 1
+            return verdict
+        domain = registrable_domain(host)
+        verdict = LinkVerdict(host, domain, self.blocklist.match(host, domain))
+        self._verdicts[host] = verdict
+        return verdict
+
+    def scan(self, content: str) -> List[LinkVerdict]:
+        """Return a verdict for each distinct blocked host linked in ``content``."""
+        if self.blocklist.maybe_reload() or self.blocklist.version != self._blocklist_version:
+            self._verdicts.clear()
+            self._blocklist_version = self.blocklist.version
+        seen: Dict[str, LinkVerdict] = {}
+        for url in iter_urls(content):
+            host = normalize_host(url)
+            if host is None or host in seen:
+                continue
+            self.scanned += 1
+            seen[host] = self.verdict(host)
+        blocked = [verdict for verdict in seen.values() if verdict.blocked]
+        self.blocked += len(blocked)
+        return blocked
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "blocklist": len(self.blocklist),
+            "cached": len(self._verdicts),
+            "scanned": self.scanned,
+            "cache_hits": self.cache_hits,
+            "blocked": self.blocked,
+        }
@@ -1,9 +1,14 @@
+import asyncio
+import base64
+import contextlib
 import json
+import time
 import discord
 from discord.ext import commands
 from discord import app_commands
 import collections
 import datetime
+import functools
 
 from lists import config
 from .aimod_helpers.config_manager import (
@@ -13,29 +18,51 @@ from .aimod_helpers.config_manager import (
     save_global_bans,
     save_user_infractions,
     get_guild_config_async,
-    is_channel_excluded,
-    get_channel_rules,
-    get_analysis_mode,
-    get_message_rules,
+    CHANNEL_EXCLUSIONS_KEY,
+    CHANNEL_RULES_KEY,
+    ANALYSIS_MODE_KEY,
+    MESSAGE_RULES_KEY,
 )
 from .aimod_helpers.utils import (
     truncate_text,
     get_user_infraction_history,
     add_user_infraction,
 )
-from .aimod_helpers.media_processor import MediaProcessor
-from .aimod_helpers.system_prompt import SUICIDAL_HELP_RESOURCES, SYSTEM_PROMPT_TEMPLATE
-from .aimod_helpers.litellm_config import get_litellm_client
+from .aimod_helpers.media_hash_index import MediaHashIndex
+from .aimod_helpers.media_processor import MEDIA_MAX_PARTS, MediaProcessor
+from .aimod_helpers.system_prompt import BATCH_PROMPT_SUFFIX, STREAMING_PROMPT_SUFFIX, SUICIDAL_HELP_RESOURCES
+from .aimod_helpers.litellm_config import get_litellm_client, model_supports_vision
 from .aimod_helpers.ui import ActionConfirmationView
+from .aimod_helpers.moderation_queue import QUEUED, ModerationJob, ModerationQueue
+from .aimod_helpers.batcher import BATCHING_ENABLED, MicroBatcher
+from .aimod_helpers.decision_cache import DecisionCache
+from .aimod_helpers.decision_stream import STREAMING_ENABLED, StreamingDecisionParser
+from .aimod_helpers.keyword_matcher import compile_rules, get_guild_matcher
+from .aimod_helpers.message_buffer import RecentMessageBuffer
+from .aimod_helpers.pre_classifier import PreClassifierStage
+from .aimod_helpers.prompt_cache import prompt_cache_stats, system_message
+from .aimod_helpers.stage_timer import StageStats, StageTimings
+from .aimod_helpers.token_usage import TokenUsageRecorder, estimate_usage
 from database.operations import (
     get_guild_api_key,
+    get_guild_config_snapshot,
     add_ai_decision,
     get_ai_decisions,
+    get_token_usage,
 )
 
 DEV_AIMODTEST_USER_IDS = config.OwnersTuple
 DEV_AIMODTEST_ENABLED = False
 
+# Shown in place of the reasoning when an action starts before the model has written it
+EARLY_ACTION_REASONING = "Flagged by AI moderation; the full reasoning is in the AI decision log."
+# Verdicts worth remembering for media reposts; NOTIFY_MODS and SUICIDAL need a fresh look every time
+MEDIA_HASH_ACTIONS = ("WARN", "DELETE", "TIMEOUT_SHORT", "TIMEOUT_MEDIUM", "TIMEOUT_LONG", "KICK", "BAN")
+# Actions a hash match may take on its own; harsher verdicts are replayed as a delete
+MEDIA_HASH_REPLAY_ACTIONS = ("WARN", "DELETE")
+# Infraction history text for authors with a clean record; only their decisions are cached
+NO_INFRACTIONS_TEXT = "No prior infractions recorded."
+
 
 def is_dev_aimodtest_user(interaction: discord.Interaction) -> bool:
     return interaction.user.id in DEV_AIMODTEST_USER_IDS
@@ -77,6 +104,19 @@ class CoreAICog(commands.Cog, name="Core AI"):
         self.bot = bot
         self.last_ai_decisions = collections.deque(maxlen=5)
         self.media_processor = MediaProcessor()
+        self.media_hash_index = MediaHashIndex()
+        self.decision_cache = DecisionCache()
+        self.stage_stats = StageStats()
+        self.message_buffer = RecentMessageBuffer()
+        self.pre_classifier = PreClassifierStage.from_env()
+        self.batcher = MicroBatcher(self._flush_moderation_batch) if BATCHING_ENABLED else None
+        self.streaming_enabled = STREAMING_ENABLED
+        self.token_usage = TokenUsageRecorder()
+        self.early_actions = 0
+        self.moderation_queue = ModerationQueue()
+        if self.batcher:
+            # Jobs park while their batch fills, so a guild needs enough parked jobs to fill one.
+            self.moderation_queue.guild_max_parked = self.batcher.max_size
         try:
             self.genai_client = get_litellm_client()
             print("CoreAICog: LiteLLM client initialized successfully.")
@@ -93,6 +133,8 @@ class CoreAICog(commands.Cog, name="Core AI"):
                 print("CoreAICog: LiteLLM client re-initialized on load.")
             except Exception as e:
                 print(f"CoreAICog: Failed to re-initialize LiteLLM client on load: {e}")
+        self.moderation_queue.start()
+        self.token_usage.start()
         print("CoreAICog cog_load finished.")
 
         # Auto-ban any users already in servers who are on the global ban list
@@ -152,6 +194,11 @@ class CoreAICog(commands.Cog, name="Core AI"):
         """
         Close any open connections when the cog is unloaded.
         """
+        await self.moderation_queue.stop()
+        if self.batcher:
+            await self.batcher.close()
+        await self.token_usage.stop()
+        await self.media_processor.close()
         print("CoreAICog Unloaded.")
 
     @commands.hybrid_group(name="infractions", description="Manage user infractions.")
@@ -431,58 +478,119 @@ class CoreAICog(commands.Cog, name="Core AI"):
             ephemeral=False,
         )
 
-    async def query_vertex_ai(
-        self,
-        message: discord.Message,
-        message_content: str,
-        user_history: str,
-        image_data_list=None,
-        custom_rules_text: str | None = None,
-    ):
-        """Analyze a message using LiteLLM and the provided rules."""
-        guild_id = message.guild.id
-
-        # Fetch guild's API key
+    async def _resolve_api_credentials(self, guild_id: int) -> tuple[str | None, dict | None]:
+        """Return the API key and Copilot auth info to use for a guild."""
         guild_api_key = await get_guild_api_key(guild_id)
 
         api_key = None
         auth_info = None
-        model_used = await get_guild_config_async(guild_id, "AI_MODEL", DEFAULT_VERTEX_AI_MODEL)
 
         if guild_api_key:
             if guild_api_key.api_provider == "github_copilot":
                 auth_info = guild_api_key.github_auth_info
             else:
                 # For other providers, the key is the api_key
-                api_key = guild_api_key.api_key
                 # The model is still taken from the guild config, not overridden by the provider name
-                model_used = await get_guild_config_async(guild_id, "AI_MODEL", DEFAULT_VERTEX_AI_MODEL)
+                api_key = guild_api_key.api_key
+        return api_key, auth_info
 
+    def _resolve_rules_text(self, message: discord.Message, guild_config, custom_rules_text: str | None):
+        """Pick custom, channel or server rules for a message; None when no rules are set."""
         if custom_rules_text is not None:
-            rules_text = custom_rules_text
             print("Using custom rule instructions for analysis.")
-        else:
-            # Check for channel-specific rules first, fallback to server rules
-            channel_rules = await get_channel_rules(guild_id, message.channel.id)
-            if channel_rules:
-                rules_text = channel_rules
-                print(f"Using channel-specific rules for channel {message.channel.name} (ID: {message.channel.id})")
-            else:
-                rules_text = await self.get_server_rules(guild_id)
-                if rules_text == "No rules set.":
-                    print("No server rules set; skipping analysis.")
-                    return None
-                print(f"Using server default rules for channel {message.channel.name} (ID: {message.channel.id})")
+            return custom_rules_text
+
+        # Check for channel-specific rules first, fallback to server rules
+        channel_rules = guild_config.get(CHANNEL_RULES_KEY, {}).get(str(message.channel.id), "")
+        if channel_rules:
+            print(f"Using channel-specific rules for channel {message.channel.name} (ID: {message.channel.id})")
+            return channel_rules
+
+        rules_text = guild_config.get("SERVER_RULES", "No rules set.")
+        if rules_text == "No rules set.":
+            print("No server rules set; skipping analysis.")
+            return None
+        print(f"Using server default rules for channel {message.channel.name} (ID: {message.channel.id})")
+        return rules_text
+
+    async def _fetch_replied_context(self, message: discord.Message) -> str:
+        """Describe the message being replied to, if any."""
+        if not (message.reference and message.reference.message_id):
+            return ""
+        buffered = self.message_buffer.get(message.channel.id, message.reference.message_id)
+        if buffered is not None:
+            return f"Replied-to Message: {buffered.author_name}: {buffered.content[:200]}"
+        try:
+            replied_message = await message.channel.fetch_message(message.reference.message_id)
+            return f"Replied-to Message: {replied_message.author.display_name}: {replied_message.content[:200]}"
+        except Exception:
+            return "Replied-to Message: [Could not fetch]"
+
+    async def _fetch_recent_history(self, message: discord.Message) -> str:
+        """Summarize the last few non-bot messages before this one."""
+        limit = 4
+        buffered = self.message_buffer.recent(message.channel.id, message.id, limit)
+        if buffered is not None:
+            recent_history = [
+                f"{entry.author_name}: {entry.content[:100]}" for entry in buffered if not entry.author_bot
+            ]
+            return "\n".join(recent_history[:3]) if recent_history else "No recent history available."
+
+        recent_history = []
+        try:
+            fetched = [hist_message async for hist_message in message.channel.history(limit=limit, before=message)]
+            self.message_buffer.seed(message.channel.id, fetched, complete=len(fetched) < limit)
+            for hist_message in fetched:
+                if not hist_message.author.bot:
+                    recent_history.append(f"{hist_message.author.display_name}: {hist_message.content[:100]}")
+        except Exception:
+            recent_history = ["[Could not fetch recent history]"]
+
+        return "\n".join(recent_history[:3]) if recent_history else "No recent history available."
 
-        system_prompt_text = SYSTEM_PROMPT_TEMPLATE.format(rules_text=rules_text)
+    async def _gather_context(self, message: discord.Message, timings: StageTimings):
+        """Run the independent pre-LLM lookups concurrently, timing each stage."""
+        (api_key, auth_info), replied_to_content, recent_history_text = await asyncio.gather(
+            timings.run("api_key", self._resolve_api_credentials(message.guild.id)),
+            timings.run("reply", self._fetch_replied_context(message)),
+            timings.run("history", self._fetch_recent_history(message)),
+        )
+        return api_key, auth_info, replied_to_content, recent_history_text
 
-        user_role = "Member"
+    @staticmethod
+    def _author_role(message: discord.Message) -> str:
+        """Return the coarse server role shown to the model for the message author."""
         if message.author.guild_permissions.administrator:
-            user_role = "Admin"
-        elif message.author.guild_permissions.manage_messages:
-            user_role = "Moderator"
-        elif message.guild.owner_id == message.author.id:
-            user_role = "Server Owner"
+            return "Admin"
+        if message.author.guild_permissions.manage_messages:
+            return "Moderator"
+        if message.guild.owner_id == message.author.id:
+            return "Server Owner"
+        return "Member"
+
+    def _decision_cache_context(self, message: discord.Message, user_history: str) -> str | None:
+        """Describe the prompt context a cached decision depends on, or None to bypass the cache.
+
+        Authors with recorded infractions get escalating actions based on their
+        exact history, so their verdicts are never shared or replayed.
+        """
+        if user_history != NO_INFRACTIONS_TEXT:
+            return None
+        is_nsfw = getattr(message.channel, "nsfw", False)
+        is_reply = bool(message.reference and message.reference.message_id)
+        return f"{self._author_role(message)}|nsfw={int(is_nsfw)}|reply={int(is_reply)}"
+
+    def _build_user_prompt(
+        self,
+        message: discord.Message,
+        message_content: str,
+        user_history: str,
+        replied_to_content: str,
+        recent_history_text: str,
+        image_data_list=None,
+    ) -> str:
+        """Build the per-message context block sent to the model."""
+        user_role = self._author_role(message)
 
         # Get user's top 10 roles, highest first
         user_role_list = [role.name for role in reversed(message.author.roles) if not role.is_default()]
@@ -492,26 +600,6 @@ class CoreAICog(commands.Cog, name="Core AI"):
         channel_category = message.channel.category.name if message.channel.category else "No Category"
         is_nsfw_channel = getattr(message.channel, "nsfw", False)
 
-        replied_to_content = ""
-        if message.reference and message.reference.message_id:
-            try:
-                replied_message = await message.channel.fetch_message(message.reference.message_id)
-                replied_to_content = (
-                    f"Replied-to Message: {replied_message.author.display_name}: {replied_message.content[:200]}"
-                )
-            except Exception:
-                replied_to_content = "Replied-to Message: [Could not fetch]"
-
-        recent_history = []
-        try:
-            async for hist_message in message.channel.history(limit=4, before=message):
-                if not hist_message.author.bot:
-                    recent_history.append(f"{hist_message.author.display_name}: {hist_message.content[:100]}")
-        except Exception:
-            recent_history = ["[Could not fetch recent history]"]
-
-        recent_history_text = "\n".join(recent_history[:3]) if recent_history else "No recent history available."
-
         user_prompt = f"""
 **Context Information:**
 - User's Server Role: {user_role}
@@ -529,23 +617,74 @@ class CoreAICog(commands.Cog, name="Core AI"):
 {message_content if message_content else "[No text content]"}
 """
 
-        # Prepare messages for LiteLLM format
-        messages = [
-            {"role": "system", "content": system_prompt_text},
-            {"role": "user", "content": user_prompt},
-        ]
-
-        # Handle image attachments for LiteLLM
+        # Describe attachments in text; vision-capable models also get the images via _user_content
         if image_data_list:
-            # For now, we'll add image descriptions to the user message
-            # LiteLLM/OpenRouter vision support may vary by model
             image_descriptions = []
-            for mime_type, image_bytes, attachment_type, filename in image_data_list:
-                image_descriptions.append(f"[{attachment_type.upper()} ATTACHMENT: {filename}]")
+            for _mime_type, image_bytes, attachment_type, filename, *_ in image_data_list:
+                note = "" if image_bytes else " (not available to view)"
+                image_descriptions.append(f"[{attachment_type.upper()} ATTACHMENT: {filename}]{note}")
                 print(f"Added {attachment_type} attachment to AI analysis: {filename}")
 
             if image_descriptions:
-                messages[-1]["content"] += "\n\nAttachments:\n" + "\n".join(image_descriptions)
+                user_prompt += "\n\nAttachments:\n" + "\n".join(image_descriptions)
+        return user_prompt
+
+    @staticmethod
+    def _user_content(user_prompt: str, image_data_list, model_used: str):
+        """Attach the downscaled media as image parts when the model accepts images."""
+        images = [part for part in image_data_list or [] if part[1]]
+        if not images or not model_supports_vision(model_used):
+            return user_prompt
+        content = [{"type": "text", "text": user_prompt}]
+        for mime_type, image_bytes, *_ in images[:MEDIA_MAX_PARTS]:
+            encoded = base64.b64encode(image_bytes).decode("ascii")
+            content.append({"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{encoded}"}})
+        return content
+
+    @staticmethod
+    def _extract_json(ai_response_text: str):
+        """Parse the JSON object from a model response, tolerating code fences."""
+        json_start_index = ai_response_text.find("{")
+        if json_start_index == -1:
+            print("Error: Could not find the start of the JSON object in AI response.")
+            print(f"Raw AI response: {ai_response_text}")
+            return None
+
+        json_string = ai_response_text[json_start_index:].strip()
+
+        if json_string.startswith("```json"):
+            json_string = json_string[7:]
+        if json_string.endswith("```"):
+            json_string = json_string[:-3]
+        json_string = json_string.strip()
+
+        try:
+            return json.loads(json_string)
+        except json.JSONDecodeError as e:
+            print(f"Error parsing AI response as JSON: {e}")
+            print(f"Raw AI response: {ai_response_text}")
+            return None
+
+    @staticmethod
+    def _is_valid_decision(ai_decision) -> bool:
+        required_keys = ["reasoning", "violation", "rule_violated", "action"]
+        return isinstance(ai_decision, dict) and all(key in ai_decision for key in required_keys)
+
+    async def _request_decision(
+        self,
+        rules_text: str,
+        user_prompt: str | list,
+        model_used: str,
+        api_key: str | None,
+        auth_info: dict | None,
+        guild_id: int | None = None,
+    ):
+        """Send a single-message moderation request and return the parsed decision."""
+        # Prepare messages for LiteLLM format; the system prompt is memoized per rules text
+        messages = [
+            system_message(model_used, rules_text),
+            {"role": "user", "content": user_prompt},
+        ]
 
         try:
             response = await self.genai_client.generate_content(
@@ -556,6 +695,8 @@ class CoreAICog(commands.Cog, name="Core AI"):
                 temperature=0.2,
                 max_tokens=4096,
             )
+            if guild_id is not None:
+                self.token_usage.record(guild_id, model_used, response.usage)
 
             ai_response_text = response.text
 
@@ -563,39 +704,257 @@ class CoreAICog(commands.Cog, name="Core AI"):
                 print("Error: Empty response from LiteLLM API.")
                 return None
 
-            try:
-                json_start_index = ai_response_text.find("{")
-                if json_start_index == -1:
-                    print("Error: Could not find the start of the JSON object in AI response.")
-                    print(f"Raw AI response: {ai_response_text}")
-                    return None
+            ai_decision = self._extract_json(ai_response_text)
+            if ai_decision is None:
+                return None
 
-                json_string = ai_response_text[json_start_index:].strip()
+            if not self._is_valid_decision(ai_decision):
+                print(f"Error: AI response missing required keys. Got: {ai_decision}")
+                return None
 
-                if json_string.startswith("```json"):
-                    json_string = json_string[7:]
-                if json_string.endswith("```"):
-                    json_string = json_string[:-3]
-                json_string = json_string.strip()
+            print(f"AI Decision: {ai_decision}")
+            return ai_decision
+        except Exception as e:
+            print(f"Exception during LiteLLM API call: {e}")
+            return None
 
-                ai_decision = json.loads(json_string)
+    async def _request_decision_streaming(
+        self,
+        rules_text: str,
+        user_prompt: str | list,
+        model_used: str,
+        api_key: str | None,
+        auth_info: dict | None,
+        on_verdict=None,
+        timings: StageTimings | None = None,
+        guild_id: int | None = None,
+    ):
+        """Stream a single-message decision, calling ``on_verdict`` as soon as the verdict fields are parsed.
 
-                required_keys = ["reasoning", "violation", "rule_violated", "action"]
-                if not all(key in ai_decision for key in required_keys):
-                    print(f"Error: AI response missing required keys. Got: {ai_decision}")
-                    return None
+        The reasoning keeps streaming after the verdict and only ends up in the
+        returned decision, which is what gets logged.
+        """
+        messages = [
+            system_message(model_used, rules_text, STREAMING_PROMPT_SUFFIX),
+            {"role": "user", "content": user_prompt},
+        ]
+        parser = StreamingDecisionParser()
+        verdict = None
+        usage_reported = False
 
-                print(f"AI Decision: {ai_decision}")
-                return ai_decision
+        def on_usage(usage):
+            nonlocal usage_reported
+            usage_reported = True
+            self.token_usage.record(guild_id, model_used, usage)
 
-            except json.JSONDecodeError as e:
-                print(f"Error parsing AI response as JSON: {e}")
-                print(f"Raw AI response: {ai_response_text}")
-                return None
+        start = time.perf_counter()
+        try:
+            stream = self.genai_client.stream_content(
+                model=model_used,
+                messages=messages,
+                api_key=api_key,
+                auth_info=auth_info,
+                temperature=0.2,
+                max_tokens=4096,
+                on_usage=on_usage if guild_id is not None else None,
+            )
+            async with contextlib.aclosing(stream):
+                async for delta in stream:
+                    if parser.complete:
+                        # Anything after the object is a code fence, but the stream is still read to the end
+                        # so the call records its latency in the model health and reports its token usage.
+                        continue
+                    parser.feed(delta)
+                    if verdict is None and parser.verdict is not None:
+                        verdict = parser.verdict
+                        if timings is not None:
+                            timings.record("llm_verdict", time.perf_counter() - start)
+                        if on_verdict is not None:
+                            await on_verdict(verdict)
         except Exception as e:
-            print(f"Exception during LiteLLM API call: {e}")
+            print(f"Exception during streamed LiteLLM API call: {e}")
+            if verdict is None:
+                return None
+        finally:
+            # Some providers ignore include_usage; the request is still counted, with estimated tokens
+            if guild_id is not None and not usage_reported and parser.text:
+                self.token_usage.record(guild_id, model_used, estimate_usage(messages, parser.text))
+
+        ai_decision = parser.decision()
+        if ai_decision is None and parser.text.strip():
+            ai_decision = self._extract_json(parser.text)
+        if not self._is_valid_decision(ai_decision):
+            if verdict is None:
+                print(f"Error: Streamed AI response missing required keys. Got: {parser.text}")
+                return None
+            # The verdict was already acted on, so log it even if the reasoning got cut off.
+            ai_decision = {"reasoning": parser.fields.get("reasoning", EARLY_ACTION_REASONING), **verdict}
+
+        print(f"AI Decision: {ai_decision}")
+        return ai_decision
+
+    async def query_vertex_ai(
+        self,
+        message: discord.Message,
+        message_content: str,
+        user_history: str,
+        image_data_list=None,
+        custom_rules_text: str | None = None,
+        on_verdict=None,
+    ):
+        """Analyze a message using LiteLLM and the provided rules.
+
+        With streaming enabled, ``on_verdict`` is awaited with the violation,
+        rule and action as soon as they arrive, before the reasoning.
+        """
+        timings = StageTimings()
+        guild_config = await timings.run("config", get_guild_config_snapshot(message.guild.id))
+        model_used = guild_config.get("AI_MODEL", DEFAULT_VERTEX_AI_MODEL)
+
+        rules_text = self._resolve_rules_text(message, guild_config, custom_rules_text)
+        if rules_text is None:
+            return None
+
+        # Attachments are not part of the cache key, so only text-only messages use the cache.
+        cache_context = None if image_data_list else self._decision_cache_context(message, user_history)
+        if cache_context is not None:
+            cached_decision = await self.decision_cache.get(message_content, rules_text, model_used, cache_context)
+            if cached_decision is not None:
+                print(f"Reusing cached AI decision for message {message.id}.")
+                return cached_decision
+
+        with timings.stage("context"):
+            api_key, auth_info, replied_to_content, recent_history_text = await self._gather_context(message, timings)
+        user_prompt = self._user_content(
+            self._build_user_prompt(
+                message, message_content, user_history, replied_to_content, recent_history_text, image_data_list
+            ),
+            image_data_list,
+            model_used,
+        )
+        if self.streaming_enabled:
+            request = self._request_decision_streaming(
+                rules_text, user_prompt, model_used, api_key, auth_info, on_verdict, timings, guild_id=message.guild.id
+            )
+        else:
+            request = self._request_decision(
+                rules_text, user_prompt, model_used, api_key, auth_info, guild_id=message.guild.id
+            )
+        ai_decision = await timings.run("llm", request)
+        self.stage_stats.record(timings, total_name="total")
+        print(f"Moderation timings for message {message.id}: {timings.summary()}")
+        if ai_decision and cache_context is not None:
+            await self.decision_cache.set(message_content, rules_text, model_used, ai_decision, cache_context)
+        return ai_decision
+
+    async def query_vertex_ai_batched(
+        self,
+        message: discord.Message,
+        message_content: str,
+        user_history: str,
+        custom_rules_text: str | None = None,
+    ):
+        """Analyze a text message as part of a micro-batch sharing guild, rules and model."""
+        timings = StageTimings()
+        guild_id = message.guild.id
+        guild_config = await timings.run("config", get_guild_config_snapshot(guild_id))
+        model_used = guild_config.get("AI_MODEL", DEFAULT_VERTEX_AI_MODEL)
+
+        rules_text = self._resolve_rules_text(message, guild_config, custom_rules_text)
+        if rules_text is None:
             return None
 
+        cache_context = self._decision_cache_context(message, user_history)
+        if cache_context is not None:
+            cached_decision = await self.decision_cache.get(message_content, rules_text, model_used, cache_context)
+            if cached_decision is not None:
+                print(f"Reusing cached AI decision for message {message.id}.")
+                return cached_decision
+
+        with timings.stage("context"):
+            api_key, auth_info, replied_to_content, recent_history_text = await self._gather_context(message, timings)
+        user_prompt = self._build_user_prompt(
+            message, message_content, user_history, replied_to_content, recent_history_text
+        )
+        batch_key = (guild_id, hash(rules_text), model_used)
+        item = {
+            "message": message,
+            "user_prompt": user_prompt,
+            "rules_text": rules_text,
+            "model": model_used,
+            "api_key": api_key,
+            "auth_info": auth_info,
+        }
+        # Waiting for the batch window must not hold a queue worker or the guild's slot
+        async with self.moderation_queue.parked():
+            ai_decision = await timings.run("llm", self.batcher.submit(batch_key, item))
+        self.stage_stats.record(timings, total_name="total")
+        print(f"Moderation timings for message {message.id}: {timings.summary()}")
+        if ai_decision and cache_context is not None:
+            await self.decision_cache.set(message_content, rules_text, model_used, ai_decision, cache_context)
+        return ai_decision
+
+    async def _flush_moderation_batch(self, batch_key, items: list[dict]) -> list:
+        """Send a batch of messages as one request and fan the decisions back out."""
+        first = items[0]
+        guild_id = batch_key[0]
+        if len(items) == 1:
+            return [
+                await self._request_decision(
+                    first["rules_text"],
+                    first["user_prompt"],
+                    first["model"],
+                    first["api_key"],
+                    first["auth_info"],
+                    guild_id=guild_id,
+                )
+            ]
+
+        batch_prompt = "\n\n".join(
+            f"### Message {index + 1} (message_id: {item['message'].id})\n{item['user_prompt']}"
+            for index, item in enumerate(items)
+        )
+        messages = [
+            system_message(first["model"], first["rules_text"], BATCH_PROMPT_SUFFIX),
+            {"role": "user", "content": batch_prompt},
+        ]
+
+        decisions_by_id = {}
+        try:
+            response = await self.genai_client.generate_content(
+                model=first["model"],
+                messages=messages,
+                api_key=first["api_key"],
+                auth_info=first["auth_info"],
+                temperature=0.2,
+                max_tokens=4096,
+            )
+            self.token_usage.record(guild_id, first["model"], response.usage)
+            parsed = self._extract_json(response.text) if response.text else None
+            if isinstance(parsed, dict):
+                for decision in parsed.get("decisions", []):
+                    if self._is_valid_decision(decision) and "message_id" in decision:
+                        decisions_by_id[str(decision.pop("message_id"))] = decision
+            print(f"Batched AI request for {len(items)} messages returned {len(decisions_by_id)} decisions.")
+        except Exception as e:
+            print(f"Exception during batched LiteLLM API call: {e}")
+
+        async def resolve(item: dict):
+            decision = decisions_by_id.get(str(item["message"].id))
+            if decision is not None:
+                return decision
+            # Fall back to a single request for anything the batch response missed.
+            return await self._request_decision(
+                item["rules_text"],
+                item["user_prompt"],
+                item["model"],
+                item["api_key"],
+                item["auth_info"],
+                guild_id=guild_id,
+            )
+
+        return list(await asyncio.gather(*(resolve(item) for item in items)))
+
     async def _execute_ban(self, message: discord.Message, reason: str, rule_violated: str):
         """Helper function to execute a ban."""
         ban_reason = f"AI Mod: Rule {rule_violated}. Reason: {reason}"
@@ -698,6 +1057,43 @@ class CoreAICog(commands.Cog, name="Core AI"):
             datetime.datetime.now(datetime.timezone.utc).isoformat(),
         )
 
+    async def _acts_without_confirmation(self, guild_id: int, action: str) -> bool:
+        """Whether handle_violation would carry out ``action`` without moderator approval."""
+        guild_config = await get_guild_config_snapshot(guild_id)
+        if guild_config.get("TEST_MODE_ENABLED", False):
+            return False
+        return guild_config.get("ACTION_CONFIRMATION_SETTINGS", {}).get(action, "automatic") != "manual"
+
+    async def _known_media_decision(self, message: discord.Message, image_data_list) -> dict | None:
+        """Reuse the verdict for previously flagged media that an attachment matches by perceptual hash."""
+        hashes = [part[4] for part in image_data_list if len(part) > 4]
+        match = await self.media_hash_index.lookup(hashes)
+        if match is None:
+            return None
+        decision = dict(match.verdict)
+        if match.guild_id != message.guild.id:
+            # Another guild's rules may allow what this one doesn't, and NSFW channels are their own call
+            if not self.media_hash_index.share or getattr(message.channel, "nsfw", False):
+                return None
+            decision["rule_violated"] = "Known flagged media"
+        # A near-duplicate is not proof enough to punish the member without the model looking
+        if decision.get("action") not in MEDIA_HASH_REPLAY_ACTIONS:
+            decision["action"] = "DELETE"
+        decision["reasoning"] = (
+            f"Matched previously flagged media (Hamming distance {match.distance}). "
+            f"Original reasoning: {match.verdict.get('reasoning', 'N/A')}"
+        )
+        return decision
+
+    async def _remember_flagged_media(self, message: discord.Message, image_data_list, ai_decision: dict):
+        """Index the hashes of a media-only message the model judged a violation."""
+        if not ai_decision.get("violation") or ai_decision.get("action") not in MEDIA_HASH_ACTIONS:
+            return
+        verdict = {key: ai_decision.get(key) for key in ("violation", "rule_violated", "action", "reasoning")}
+        for part in image_data_list:
+            if len(part) > 4 and part[4] is not None:
+                await self.media_hash_index.add(part[4], message.guild.id, verdict)
+
     async def handle_violation(
         self,
         message: discord.Message,
@@ -708,12 +1104,13 @@ class CoreAICog(commands.Cog, name="Core AI"):
         user_id = message.author.id
 
         # --- Configuration Fetching ---
-        test_mode_enabled = await get_guild_config_async(guild_id, "TEST_MODE_ENABLED", False)
-        confirmation_settings = await get_guild_config_async(guild_id, "ACTION_CONFIRMATION_SETTINGS", {})
-        ping_role_id = await get_guild_config_async(guild_id, "CONFIRMATION_PING_ROLE_ID")
-        moderator_role_id = await get_guild_config_async(guild_id, "MODERATOR_ROLE_ID")
-        log_channel_id = await get_guild_config_async(guild_id, "ai_actions_log_channel_id")
-        model_used = await get_guild_config_async(guild_id, "AI_MODEL", DEFAULT_VERTEX_AI_MODEL)
+        guild_config = await get_guild_config_snapshot(guild_id)
+        test_mode_enabled = guild_config.get("TEST_MODE_ENABLED", False)
+        confirmation_settings = guild_config.get("ACTION_CONFIRMATION_SETTINGS", {})
+        ping_role_id = guild_config.get("CONFIRMATION_PING_ROLE_ID")
+        moderator_role_id = guild_config.get("MODERATOR_ROLE_ID")
+        log_channel_id = guild_config.get("ai_actions_log_channel_id")
+        model_used = guild_config.get("AI_MODEL", DEFAULT_VERTEX_AI_MODEL)
 
         # --- Decision and Context Setup ---
         rule_violated = ai_decision.get("rule_violated", "Unknown")
@@ -862,19 +1259,7 @@ class CoreAICog(commands.Cog, name="Core AI"):
     @staticmethod
     def match_keyword_rule(content: str, rules: list[dict]):
         """Return the first matching keyword/regex rule."""
-        import re
-
-        for rule in rules:
-            for kw in rule.get("keywords", []):
-                if kw.lower() in content.lower():
-                    return rule
-            for pattern in rule.get("regex", []):
-                try:
-                    if re.search(pattern, content, re.IGNORECASE):
-                        return rule
-                except re.error:
-                    continue
-        return None
+        return compile_rules(rules).match(content)
 
     @commands.Cog.listener(name="on_member_join")
     async def member_join_listener(self, member: discord.Member):
@@ -961,10 +1346,25 @@ class CoreAICog(commands.Cog, name="Core AI"):
                         print("FATAL: Bot lacks permission to send messages, even error notifications.")
             return
 
+    @commands.Cog.listener(name="on_message_edit")
+    async def buffer_edit_listener(self, before: discord.Message, after: discord.Message):
+        """Keeps buffered channel context in sync with edits."""
+        if after.guild:
+            self.message_buffer.update(after)
+
+    @commands.Cog.listener(name="on_raw_message_delete")
+    async def buffer_delete_listener(self, payload: discord.RawMessageDeleteEvent):
+        """Drops deleted messages from buffered channel context."""
+        if payload.guild_id:
+            self.message_buffer.remove(payload.channel_id, payload.message_id)
+
     @commands.Cog.listener(name="on_message")
     async def message_listener(self, message: discord.Message):
         """Listens to messages and triggers moderation checks."""
         print(f"on_message triggered for message ID: {message.id}")
+        if message.guild:
+            # Bot messages are recorded too so buffered history matches what the channel shows.
+            self.message_buffer.record(message)
         if message.author.bot:
             print(f"Ignoring message {message.id} from bot.")
             return
@@ -974,12 +1374,13 @@ class CoreAICog(commands.Cog, name="Core AI"):
         if not message.guild:
             print(f"Ignoring message {message.id} from DM.")
             return
-        if not await get_guild_config_async(message.guild.id, "ENABLED", True):
+        guild_config = await get_guild_config_snapshot(message.guild.id)
+        if not guild_config.get("ENABLED", True):
             print(f"Moderation disabled for guild {message.guild.id}. Ignoring message {message.id}.")
             return
 
         # Check if channel is excluded from AI moderation
-        if await is_channel_excluded(message.guild.id, message.channel.id):
+        if message.channel.id in guild_config.get(CHANNEL_EXCLUSIONS_KEY, []):
             print(
                 f"Channel {message.channel.name} (ID: {message.channel.id}) is excluded from AI moderation. Ignoring message {message.id}."
             )
@@ -1026,9 +1427,9 @@ class CoreAICog(commands.Cog, name="Core AI"):
                         print("FATAL: Bot lacks permission to send messages, even error notifications.")
             return
 
-        analysis_mode = await get_analysis_mode(message.guild.id)
-        message_rules = await get_message_rules(message.guild.id)
-        matched_rule = self.match_keyword_rule(message.content, message_rules)
+        analysis_mode = guild_config.get(ANALYSIS_MODE_KEY, "all")
+        message_rules = guild_config.get(MESSAGE_RULES_KEY, [])
+        matched_rule = get_guild_matcher(message.guild.id, message_rules).match(message.content)
         custom_rules_text = None
         if analysis_mode == "rules_only":
             if not matched_rule:
@@ -1038,14 +1439,43 @@ class CoreAICog(commands.Cog, name="Core AI"):
         elif analysis_mode == "override":
             if matched_rule:
                 custom_rules_text = matched_rule.get("instructions", "")
+
+        pre_score = None
+        if analysis_mode == "all" and matched_rule is None and not message.attachments:
+            skip_llm, pre_score = self.pre_classifier.evaluate(message.content)
+            if skip_llm:
+                print(f"Pre-classifier scored message {message.id} at {pre_score:.3f}; skipping AI analysis.")
+                return
+
+        job = ModerationJob(
+            guild_id=message.guild.id,
+            run=functools.partial(self.analyze_message, message, custom_rules_text, pre_score),
+            keyword_match=matched_rule is not None,
+        )
+        outcome = await self.moderation_queue.submit(job)
+        if outcome != QUEUED:
+            print(f"AI moderation queue over budget for guild {message.guild.id}; message {message.id} {outcome}.")
+
+    async def analyze_message(
+        self, message: discord.Message, custom_rules_text: str | None = None, pre_score: float | None = None
+    ):
+        """Run the full AI analysis for a message and act on the decision.
+
+        ``pre_score`` is set when the pre-classifier would have skipped this
+        message but sampled it, so the LLM verdict is recorded against it.
+        """
         message_content = message.content
         image_data_list = []
         if message.attachments:
-            for attachment in message.attachments:
-                mime_type, image_bytes, attachment_type = await self.media_processor.process_attachment(attachment)
-                if mime_type and image_bytes and attachment_type:
-                    image_data_list.append((mime_type, image_bytes, attachment_type, attachment.filename))
-                    print(f"Processed attachment: {attachment.filename} as {attachment_type}")
+            media_timings = StageTimings()
+            results = await asyncio.gather(
+                *(
+                    self.media_processor.process_attachment(attachment, media_timings)
+                    for attachment in message.attachments
+                )
+            )
+            image_data_list = [part for parts in results for part in parts]
+            self.stage_stats.record(media_timings)
 
             if image_data_list:
                 print(f"Processed {len(image_data_list)} attachments for message {message.id}")
@@ -1054,7 +1484,13 @@ class CoreAICog(commands.Cog, name="Core AI"):
             print(f"Ignoring message {message.id} with no content or valid attachments.")
             return
 
-        if not self.genai_client:
+        # Only media-only messages are remembered, so only they are matched; text can change the verdict
+        known_media_decision = (
+            await self._known_media_decision(message, image_data_list)
+            if image_data_list and not message_content
+            else None
+        )
+        if known_media_decision is None and not self.genai_client:
             print(f"Skipping AI analysis for message {message.id}: LiteLLM Client is not available.")
             return
 
@@ -1065,9 +1501,7 @@ class CoreAICog(commands.Cog, name="Core AI"):
                 history_summary_parts.append(
                     f"- Action: {infr.get('action_taken', 'N/A')} for Rule {infr.get('rule_violated', 'N/A')} on {infr.get('timestamp', 'N/A')[:10]}. Reason: {infr.get('reasoning', 'N/A')[:50]}..."
                 )
-        user_history_summary = (
-            "\n".join(history_summary_parts) if history_summary_parts else "No prior infractions recorded."
-        )
+        user_history_summary = "\n".join(history_summary_parts) if history_summary_parts else NO_INFRACTIONS_TEXT
 
         max_history_len = 500
         if len(user_history_summary) > max_history_len:
@@ -1077,13 +1511,44 @@ class CoreAICog(commands.Cog, name="Core AI"):
         if image_data_list:
             attachment_types = [data[2] for data in image_data_list]
             print(f"Including {len(image_data_list)} attachments in analysis: {', '.join(attachment_types)}")
-        ai_decision = await self.query_vertex_ai(
-            message,
-            message_content,
-            user_history_summary,
-            image_data_list,
-            custom_rules_text,
-        )
+        early_action = None
+
+        async def act_on_verdict(verdict: dict):
+            nonlocal early_action
+            action = str(verdict.get("action", "")).upper()
+            # NOTIFY_MODS needs its message and manual review needs the reasoning, so both wait.
+            if verdict.get("violation") is not True or action == "NOTIFY_MODS":
+                return
+            if not await self._acts_without_confirmation(message.guild.id, action):
+                return
+            self.early_actions += 1
+            print(f"Acting on streamed verdict for message {message.id} before the reasoning finished.")
+            early_action = asyncio.create_task(
+                self.handle_violation(message, {**verdict, "reasoning": EARLY_ACTION_REASONING})
+            )
+
+        if known_media_decision is not None:
+            print(f"Message {message.id} matched previously flagged media; skipping the AI request.")
+            ai_decision = known_media_decision
+        elif self.batcher and not image_data_list:
+            ai_decision = await self.query_vertex_ai_batched(
+                message,
+                message_content,
+                user_history_summary,
+                custom_rules_text,
+            )
+        else:
+            ai_decision = await self.query_vertex_ai(
+                message,
+                message_content,
+                user_history_summary,
+                image_data_list,
+                custom_rules_text,
+                on_verdict=act_on_verdict,
+            )
+
+        if pre_score is not None and known_media_decision is None:
+            self.pre_classifier.record_sample(ai_decision)
 
         if not ai_decision:
             print(f"Failed to get valid AI decision for message {message.id}.")
@@ -1132,8 +1597,12 @@ class CoreAICog(commands.Cog, name="Core AI"):
             (message.content[:100] + "..." if len(message.content) > 100 else message.content),
             ai_decision,
         )
+        if known_media_decision is None and not message_content:
+            await self._remember_flagged_media(message, image_data_list, ai_decision)
 
-        if ai_decision.get("violation"):
+        if early_action is not None:
+            await early_action
+        elif ai_decision.get("violation"):
             notify_mods_message = (
                 ai_decision.get("notify_mods_message") if ai_decision.get("action") == "NOTIFY_MODS" else None
             )
@@ -1164,6 +1633,176 @@ class CoreAICog(commands.Cog, name="Core AI"):
             await ctx.reply(f"An error occurred: {error}", ephemeral=True)
             print(f"Error in ai_last_decisions command: {error}")
 
+    @ai.command(name="usage", description="Show AI token usage for this server")
+    @app_commands.guild_only()
+    @app_commands.checks.has_permissions(administrator=True)
+    @app_commands.describe(days="How many days of usage to include (default 30)")
+    async def ai_usage(self, ctx: commands.Context, days: app_commands.Range[int, 1, 365] = 30):
+        # Write buffered counts first so the rollup includes the latest requests
+        await self.token_usage.flush()
+        rows = await get_token_usage(ctx.guild.id, days=days)
+        embed = discord.Embed(title=f"AI Token Usage (last {days} days)", color=discord.Color.blurple())
+        for row in rows[:10]:
+            cached_share = row["cached_tokens"] / row["prompt_tokens"] if row["prompt_tokens"] else 0.0
+            embed.add_field(
+                name=row["model"],
+                value=(
+                    f"Requests: {row['requests']}\n"
+                    f"Prompt tokens: {row['prompt_tokens']:,} ({cached_share:.0%} cached)\n"
+                    f"Completion tokens: {row['completion_tokens']:,}"
+                ),
+                inline=False,
+            )
+        if not rows:
+            totals = self.token_usage.guild_totals(ctx.guild.id)
+            embed.description = (
+                "No usage has been stored for this server yet."
+                if not totals["requests"]
+                else f"Usage since the bot started: {totals['requests']} requests, "
+                f"{totals['prompt_tokens']:,} prompt / {totals['completion_tokens']:,} completion tokens."
+            )
+        await ctx.reply(embed=embed, ephemeral=True)
+
+    @ai.command(name="pipeline", description="Show AI moderation queue statistics (bot owners only)")
+    @app_commands.guild_only()
+    @app_commands.check(is_dev_aimodtest_user)
+    async def ai_pipeline(self, ctx: commands.Context):
+        # The statistics cover every guild the bot serves, so only the bot's owners may see them
+        if ctx.author.id not in DEV_AIMODTEST_USER_IDS:
+            await ctx.reply("❌ Only the bot owners can view pipeline statistics.", ephemeral=True)
+            return
+        stats = self.moderation_queue.stats()
+        embed = discord.Embed(title="AI Moderation Pipeline", color=discord.Color.blurple())
+        embed.add_field(
+            name="Queue",
+            value=(
+                f"Depth: {stats['depth']}\n"
+                f"Active: {stats['active']}\n"
+                f"Guilds waiting: {stats['guilds_waiting']}\n"
+                f"Workers: {stats['workers']}"
+            ),
+            inline=True,
+        )
+        embed.add_field(
+            name="Throughput",
+            value=(
+                f"Submitted: {stats['submitted']}\n"
+                f"Processed: {stats['processed']}\n"
+                f"Failed: {stats['failed']}\n"
+                f"Deferred: {stats['deferred']}"
+            ),
+            inline=True,
+        )
+        embed.add_field(
+            name="Load Shedding",
+            value=f"Policy: `{stats['shed_policy']}`\n"
+            + "\n".join(f"{policy}: {count}" for policy, count in stats["shed"].items()),
+            inline=True,
+        )
+        embed.add_field(
+            name="Queue Wait",
+            value=f"Avg: {stats['avg_wait'] * 1000:.0f} ms\nMax: {stats['max_wait'] * 1000:.0f} ms",
+            inline=True,
+        )
+        stage_lines = [
+            f"{name}: {data['avg'] * 1000:.0f} ms avg / {data['max'] * 1000:.0f} ms max"
+            for name, data in self.stage_stats.snapshot().items()
+        ]
+        if stage_lines:
+            embed.add_field(name="Stage Timings", value="\n".join(stage_lines), inline=False)
+        cache_stats = self.decision_cache.stats()
+        embed.add_field(
+            name="Decision Cache",
+            value=(
+                f"Entries: {cache_stats['size']}\n"
+                f"Hits: {cache_stats['local_hits']} local / {cache_stats['redis_hits']} redis\n"
+                f"Misses: {cache_stats['misses']}\n"
+                f"Hit rate: {cache_stats['hit_rate']:.1%}"
+            ),
+            inline=True,
+        )
+        pre_stats = self.pre_classifier.stats()
+        if pre_stats["enabled"]:
+            embed.add_field(
+                name="Pre-classifier",
+                value=(
+                    f"Skipped: {pre_stats['skipped']}/{pre_stats['scored']} ({pre_stats['skip_rate']:.1%})\n"
+                    f"Sampled skips: {pre_stats['sampled']}\n"
+                    f"Disagreement: {pre_stats['disagreement_rate']:.1%} ({pre_stats['sampled_violations']} missed)"
+                ),
+                inline=True,
+            )
+        if self.streaming_enabled:
+            verdict_stats = self.stage_stats.snapshot().get("llm_verdict", {})
+            embed.add_field(
+                name="Streaming Decisions",
+                value=(
+                    f"Verdicts parsed early: {verdict_stats.get('count', 0)}\n"
+                    f"Actions started early: {self.early_actions}"
+                ),
+                inline=True,
+            )
+        media_stats = self.media_processor.stats()
+        embed.add_field(
+            name="Media",
+            value=(
+                f"Processed: {media_stats['processed']}\n"
+                f"Over size cap: {media_stats['skipped_too_large']}\n"
+                f"Failed: {media_stats['failed']}\n"
+                f"Downloaded: {media_stats['bytes_downloaded'] / 1_000_000:.1f} MB"
+            ),
+            inline=True,
+        )
+        hash_stats = self.media_hash_index.stats()
+        embed.add_field(
+            name="Known Media Index",
+            value=(
+                f"Hashes: {hash_stats['size']}\n"
+                f"Hit rate: {hash_stats['hit_rate']:.1%} ({hash_stats['redis_hits']} from Redis)"
+            ),
+            inline=True,
+        )
+        prompt_stats = prompt_cache_stats()
+        embed.add_field(
+            name="System Prompt Cache",
+            value=(
+                f"Prompts: {prompt_stats['size']}\n"
+                f"Hit rate: {prompt_stats['hit_rate']:.1%} ({prompt_stats['misses']} formatted)"
+            ),
+            inline=True,
+        )
+        buffer_stats = self.message_buffer.stats()
+        embed.add_field(
+            name="Message Buffer",
+            value=(
+                f"Channels: {buffer_stats['channels']}\n"
+                f"Messages: {buffer_stats['messages']}\n"
+                f"Hit rate: {buffer_stats['hit_rate']:.1%} ({buffer_stats['misses']} REST fallbacks)"
+            ),
+            inline=True,
+        )
+        if self.genai_client is not None:
+            pool_stats = self.genai_client.pool_stats()
+            embed.add_field(
+                name="LLM HTTP Pool",
+                value=(
+                    f"In flight: {pool_stats['in_flight']}/{pool_stats['max_connections']} "
+                    f"(peak {pool_stats['peak_in_flight']})\n"
+                    f"Saturated starts: {pool_stats['saturated_requests']}/{pool_stats['total_requests']}\n"
+                    f"HTTP/2: {'on' if pool_stats['http2'] else 'off'}"
+                ),
+                inline=True,
+            )
+        embed.add_field(
+            name="This Server",
+            value=(
+                f"Queued: {self.moderation_queue.depth(ctx.guild.id)}\n"
+                f"Active: {self.moderation_queue.active(ctx.guild.id)}"
+            ),
+            inline=True,
+        )
+        await ctx.reply(embed=embed, ephemeral=True)
+
     @staticmethod
     def build_decision_embed(record: dict, index: int, total: int) -> discord.Embed:
         decision_info = record.get("ai_decision", {})
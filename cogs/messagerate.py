@@ -4,14 +4,26 @@ Automatically adjusts channel slowmode based on message activity.
 Uses Singapore Time (UTC+8) for all timestamps and logging.
 """
 
+import os
+
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
 import logging
-from collections import defaultdict, deque
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Set
+from database.cache import register_invalidation_handler, unregister_invalidation_handler
 from database.operations import get_guild_config, set_guild_config
+from .aimod_helpers.stage_timer import StageStats, StageTimings
+from .messagerate_helpers.channel_index import AutoRateIndex
+from .messagerate_helpers.rate_counter import MessageRateCounter
+from .messagerate_helpers.redis_counter import RedisRateCounter
+from .messagerate_helpers.slowmode_controller import (
+    CoalescedSlowmodeEditor,
+    SlowmodeCurve,
+    edit_slowmode,
+    make_controller,
+)
 
 # Singapore timezone (UTC+8)
 SINGAPORE_TZ = timezone(timedelta(hours=8))
@@ -24,12 +36,21 @@ class MessageRateCog(commands.Cog):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        # Track message timestamps per channel (last 100 messages)
-        self.message_history: Dict[int, deque] = defaultdict(lambda: deque(maxlen=100))
+        # Message counts per channel and guild; shared through Redis when AUTO_RATE_REDIS is set
+        if os.getenv("AUTO_RATE_REDIS", "false").lower() in ("1", "true", "yes"):
+            self.message_counter = RedisRateCounter()
+        else:
+            self.message_counter = MessageRateCounter(span=300)
         # Track current slowmode settings
         self.current_slowmodes: Dict[int, int] = {}
-        # Track auto rate limiting enabled channels
-        self.auto_enabled_channels: Dict[int, bool] = {}
+        # Track auto rate limiting enabled channels, reloaded when their config changes
+        self.channel_index = AutoRateIndex()
+        register_invalidation_handler(self.channel_index.on_config_invalidation)
+        # Enabled channels the monitor still needs to visit: recently active or still slowed
+        self.watched_channels: Set[int] = set()
+        # Duration of each monitor tick and its stages
+        self.monitor_stats = StageStats()
+        self.last_tick_visits = 0
 
         # Configuration constants
         self.HIGH_RATE_THRESHOLD = 10  # messages per minute to trigger high rate
@@ -39,6 +60,22 @@ class MessageRateCog(commands.Cog):
         self.NO_SLOWMODE = 0  # No slowmode
         self.CHECK_INTERVAL = 30  # Check every 30 seconds
         self.ANALYSIS_WINDOW = 60  # Analyze last 60 seconds of activity
+        self.SURGE_CHECK_INTERVAL = 5  # Re-evaluate an active channel on its messages at most every 5 seconds
+
+        # Slowmode levels per guild (AUTO_RATE_CURVE), falling back to the constants above
+        self.default_curve = SlowmodeCurve(
+            levels=(
+                (self.LOW_RATE_THRESHOLD, self.LOW_RATE_SLOWMODE),
+                (self.HIGH_RATE_THRESHOLD, self.HIGH_RATE_SLOWMODE),
+            )
+        )
+        self.curves: Dict[int, SlowmodeCurve] = {}
+        # Optional levels against a guild's total rate (AUTO_RATE_GUILD_CURVE), applied as a floor to its channels
+        self.guild_curves: Dict[int, SlowmodeCurve] = {}
+        self.guild_floors: Dict[int, int] = {}
+        self.controller = make_controller(os.getenv("AUTO_RATE_CONTROLLER", "ewma"))
+        self.slowmode_editor = CoalescedSlowmodeEditor(edit_slowmode)
+        self.last_evaluated: Dict[int, float] = {}
 
         # Start the monitoring task
         self.rate_monitor.start()
@@ -46,76 +83,168 @@ class MessageRateCog(commands.Cog):
     def cog_unload(self):
         """Clean up when cog is unloaded."""
         self.rate_monitor.cancel()
+        unregister_invalidation_handler(self.channel_index.on_config_invalidation)
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
-        """Track message timestamps for rate analysis."""
+        """Count messages for rate analysis."""
         # Ignore bot messages and DMs
         if message.author.bot or not message.guild:
             return
 
         channel_id = message.channel.id
-        current_time = datetime.now(SINGAPORE_TZ)
+        enabled = self.channel_index.guild_of(channel_id) is not None
+        # Only auto rate channels are shared through Redis; the rest are counted for status display
+        self.message_counter.record(channel_id, guild_id=message.guild.id, share=enabled)
+        if not enabled:
+            return
+        self.watched_channels.add(channel_id)
+
+        # React to surges between monitor ticks, at most once per interval per channel
+        now = self.message_counter.clock()
+        if now - self.last_evaluated.get(channel_id, float("-inf")) < self.SURGE_CHECK_INTERVAL:
+            return
+        self.last_evaluated[channel_id] = now
+        if message.channel.permissions_for(message.guild.me).manage_channels:
+            await self.analyze_and_adjust_rate(message.channel)
 
-        # Add message timestamp to history
-        self.message_history[channel_id].append(current_time)
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild):
+        """Load the rate settings of a newly joined guild on the next tick."""
+        self.channel_index.mark_stale(guild.id)
 
     @tasks.loop(seconds=30)  # Check every 30 seconds
     async def rate_monitor(self):
         """Monitor message rates and adjust slowmode automatically."""
+        timings = StageTimings()
         try:
-            current_time = datetime.now(SINGAPORE_TZ)
-            analysis_cutoff = current_time - timedelta(seconds=self.ANALYSIS_WINDOW)
-
-            # Check each channel with auto rate limiting enabled
-            for guild in self.bot.guilds:
-                guild_enabled = await self.is_auto_rate_enabled(guild.id)
-                if not guild_enabled:
-                    continue
-
-                for channel in guild.text_channels:
-                    channel_enabled = await self.is_channel_auto_rate_enabled(guild.id, channel.id)
-                    if not channel_enabled:
+            # Channels quiet for the whole counter span have nothing left to count
+            self.message_counter.evict_idle()
+
+            # Only guilds whose rate settings changed since the last tick are read from config
+            with timings.stage("config_refresh"):
+                await self.channel_index.refresh([guild.id for guild in self.bot.guilds], self.load_enabled_channels)
+
+            # Check each watched channel that still has auto rate limiting enabled
+            watched, self.watched_channels = self.watched_channels, set()
+            with timings.stage("counter_sync"):
+                await self.message_counter.sync(
+                    [channel_id for channel_id in watched if self.channel_index.guild_of(channel_id) is not None],
+                    list(self.guild_curves),
+                )
+            self.last_tick_visits = 0
+            with timings.stage("adjust"):
+                for channel_id in watched:
+                    if self.channel_index.guild_of(channel_id) is None:
+                        continue
+                    channel = self.bot.get_channel(channel_id)
+                    if channel is None:
                         continue
 
                     # Check if bot has permission to manage channel
-                    if not channel.permissions_for(guild.me).manage_channels:
+                    if not channel.permissions_for(channel.guild.me).manage_channels:
                         continue
 
-                    await self.analyze_and_adjust_rate(channel, current_time, analysis_cutoff)
+                    self.last_tick_visits += 1
+                    self.last_evaluated[channel_id] = self.message_counter.clock()
+                    slowmode = await self.analyze_and_adjust_rate(channel)
+                    # Keep visiting until the channel is quiet and its slowmode is lifted
+                    if slowmode or self.message_counter.count(channel_id, self.ANALYSIS_WINDOW):
+                        self.watched_channels.add(channel_id)
+                    else:
+                        self.controller.forget(channel_id)
+                        self.last_evaluated.pop(channel_id, None)
 
         except Exception as e:
             log.error(f"Error in rate monitor: {e}")
+        finally:
+            self.monitor_stats.record(timings, total_name="tick")
 
     @rate_monitor.before_loop
     async def before_rate_monitor(self):
         """Wait for bot to be ready before starting the monitor."""
         await self.bot.wait_until_ready()
 
-    async def analyze_and_adjust_rate(
-        self,
-        channel: discord.TextChannel,
-        current_time: datetime,
-        analysis_cutoff: datetime,
-    ):
-        """Analyze message rate for a channel and adjust slowmode if needed."""
-        try:
-            channel_id = channel.id
+    def get_messages_per_minute(self, channel_id: int) -> int:
+        """Messages per minute in a channel over the analysis window."""
+        return round(self.message_counter.per_minute(channel_id, self.ANALYSIS_WINDOW))
+
+    def get_monitor_stats(self) -> Dict[str, float]:
+        """Cost of the rate monitor: channels visited and tick duration."""
+        tick = self.monitor_stats.snapshot().get("tick", {"count": 0, "avg": 0.0, "max": 0.0})
+        index_stats = self.channel_index.stats()
+        return {
+            "ticks": tick["count"],
+            "tick_avg_ms": tick["avg"] * 1000,
+            "tick_max_ms": tick["max"] * 1000,
+            "last_tick_visits": self.last_tick_visits,
+            "watched_channels": len(self.watched_channels),
+            "enabled_channels": index_stats["channels"],
+            "config_loads": index_stats["loads"],
+            "counter_backend": self.message_counter.stats()["backend"],
+            **{f"slowmode_{name}": value for name, value in self.slowmode_editor.stats().items()},
+        }
+
+    def get_curve(self, guild_id: int) -> SlowmodeCurve:
+        """Slowmode levels configured for a guild."""
+        return self.curves.get(guild_id, self.default_curve)
+
+    def get_guild_floor(self, guild_id: int) -> int:
+        """Slowmode every enabled channel of a guild gets while the guild as a whole is busy."""
+        guild_curve = self.guild_curves.get(guild_id)
+        if guild_curve is None:
+            return 0
+        rate = self.message_counter.guild_per_minute(guild_id, self.ANALYSIS_WINDOW)
+        floor = guild_curve.level_for(rate)
+        held = self.guild_floors.get(guild_id, 0)
+        # Same hysteresis as channel levels, so a guild hovering near a threshold keeps its floor
+        if floor < held and rate >= guild_curve.threshold_of(held) * (1 - guild_curve.hysteresis):
+            floor = held
+        self.guild_floors[guild_id] = floor
+        return floor
+
+    async def load_enabled_channels(self, guild_id: int) -> List[int]:
+        """Read a guild's enabled channels from config for the channel index."""
+        if not await self.is_auto_rate_enabled(guild_id):
+            self.guild_curves.pop(guild_id, None)
+            self.guild_floors.pop(guild_id, None)
+            return []
+        channel_ids = await get_guild_config(guild_id, "AUTO_RATE_CHANNELS", [])
+        curve_config = await get_guild_config(guild_id, "AUTO_RATE_CURVE", None)
+        self.curves[guild_id] = SlowmodeCurve.from_config(curve_config, self.default_curve)
+        guild_curve_config = await get_guild_config(guild_id, "AUTO_RATE_GUILD_CURVE", None)
+        # The guild floor is opt-in, so a curve that does not parse turns it off rather than using a default
+        guild_curve = SlowmodeCurve.from_config(guild_curve_config, None)
+        if guild_curve is not None:
+            self.guild_curves[guild_id] = guild_curve
+        else:
+            self.guild_curves.pop(guild_id, None)
+            self.guild_floors.pop(guild_id, None)
+        # Visit every enabled channel once after a reload, so slowmode left from before is re-evaluated
+        self.watched_channels.update(channel_ids)
+        return channel_ids
 
-            # Get recent messages within analysis window
-            recent_messages = [
-                timestamp for timestamp in self.message_history[channel_id] if timestamp >= analysis_cutoff
-            ]
+    async def analyze_and_adjust_rate(self, channel: discord.TextChannel) -> int:
+        """Analyze message rate for a channel and adjust slowmode if needed.
 
-            messages_per_minute = len(recent_messages)
+        Returns the channel's slowmode after any adjustment.
+        """
+        try:
+            channel_id = channel.id
+            messages_per_minute = self.get_messages_per_minute(channel_id)
             current_slowmode = channel.slowmode_delay
 
             # Determine appropriate slowmode based on activity
-            target_slowmode = self.calculate_target_slowmode(messages_per_minute)
+            target_slowmode = self.controller.target_slowmode(
+                channel_id, self.message_counter, self.get_curve(channel.guild.id), current_slowmode
+            )
+            target_slowmode = max(target_slowmode, self.get_guild_floor(channel.guild.id))
 
             # Only change if different from current setting
             if target_slowmode != current_slowmode:
-                await channel.edit(slowmode_delay=target_slowmode)
+                if not await self.slowmode_editor.apply(channel, target_slowmode):
+                    # Folded into an edit already in flight for this channel
+                    return target_slowmode
                 self.current_slowmodes[channel_id] = target_slowmode
 
                 # Log the change
@@ -134,11 +263,14 @@ class MessageRateCog(commands.Cog):
                     messages_per_minute,
                     activity_level,
                 )
+                return target_slowmode
+            return current_slowmode
 
         except discord.Forbidden:
             log.warning(f"No permission to edit slowmode in #{channel.name}")
         except Exception as e:
             log.error(f"Error adjusting rate for #{channel.name}: {e}")
+        return channel.slowmode_delay
 
     def calculate_target_slowmode(self, messages_per_minute: int) -> int:
         """Calculate the appropriate slowmode delay based on message rate."""
@@ -218,6 +350,8 @@ class MessageRateCog(commands.Cog):
     async def enable_channel_auto_rate(self, guild_id: int, channel_id: int) -> bool:
         """Enable auto rate limiting for a channel."""
         enabled_channels = await get_guild_config(guild_id, "AUTO_RATE_CHANNELS", [])
+        self.channel_index.enable_channel(guild_id, channel_id)
+        self.watched_channels.add(channel_id)
         if channel_id not in enabled_channels:
             enabled_channels.append(channel_id)
             return await set_guild_config(guild_id, "AUTO_RATE_CHANNELS", enabled_channels)
@@ -226,6 +360,7 @@ class MessageRateCog(commands.Cog):
     async def disable_channel_auto_rate(self, guild_id: int, channel_id: int) -> bool:
         """Disable auto rate limiting for a channel."""
         enabled_channels = await get_guild_config(guild_id, "AUTO_RATE_CHANNELS", [])
+        self.channel_index.disable_channel(guild_id, channel_id)
         if channel_id in enabled_channels:
             enabled_channels.remove(channel_id)
             return await set_guild_config(guild_id, "AUTO_RATE_CHANNELS", enabled_channels)
@@ -244,6 +379,8 @@ class MessageRateCog(commands.Cog):
         channel="Channel to configure (defaults to current channel)",
         notifications="Enable/disable notifications for rate changes",
         notification_channel="Channel to send notifications to",
+        curve="Slowmode levels as msg/min:seconds pairs, e.g. 3:2,10:5,30:10 (or 'default')",
+        guild_curve="Slowmode floor by server-wide msg/min, e.g. 60:2,200:10 (or 'off')",
     )
     @app_commands.choices(
         action=[
@@ -262,6 +399,8 @@ class MessageRateCog(commands.Cog):
         channel: Optional[discord.TextChannel] = None,
         notifications: Optional[bool] = None,
         notification_channel: Optional[discord.TextChannel] = None,
+        curve: Optional[str] = None,
+        guild_curve: Optional[str] = None,
     ):
         """Configure automatic message rate limiting for channels."""
         if hasattr(interaction, "response"):
@@ -281,7 +420,9 @@ class MessageRateCog(commands.Cog):
         elif action.value == "status":
             await self.handle_status_action(interaction, guild_id, target_channel)
         elif action.value == "config":
-            await self.handle_config_action(interaction, guild_id, notifications, notification_channel)
+            await self.handle_config_action(
+                interaction, guild_id, notifications, notification_channel, curve, guild_curve
+            )
 
     async def handle_toggle_action(
         self,
@@ -319,9 +460,7 @@ class MessageRateCog(commands.Cog):
 
                 embed.add_field(
                     name="Configuration",
-                    value=f"• High activity (≥{self.HIGH_RATE_THRESHOLD} msg/min): {self.HIGH_RATE_SLOWMODE}s slowmode\n"
-                    f"• Medium activity (≥{self.LOW_RATE_THRESHOLD} msg/min): {self.LOW_RATE_SLOWMODE}s slowmode\n"
-                    f"• Low activity: No slowmode",
+                    value=self.get_curve(guild_id).describe(),
                     inline=False,
                 )
 
@@ -362,9 +501,7 @@ class MessageRateCog(commands.Cog):
 
             embed.add_field(
                 name="Configuration",
-                value=f"• High activity (≥{self.HIGH_RATE_THRESHOLD} msg/min): {self.HIGH_RATE_SLOWMODE}s slowmode\n"
-                f"• Medium activity (≥{self.LOW_RATE_THRESHOLD} msg/min): {self.LOW_RATE_SLOWMODE}s slowmode\n"
-                f"• Low activity: No slowmode",
+                value=self.get_curve(guild_id).describe(),
                 inline=False,
             )
 
@@ -430,14 +567,7 @@ class MessageRateCog(commands.Cog):
             channel_enabled = await self.is_channel_auto_rate_enabled(guild_id, channel.id)
 
             # Get current activity stats
-            current_time = datetime.now(SINGAPORE_TZ)
-            analysis_cutoff = current_time - timedelta(seconds=self.ANALYSIS_WINDOW)
-
-            recent_messages = [
-                timestamp for timestamp in self.message_history[channel.id] if timestamp >= analysis_cutoff
-            ]
-
-            messages_per_minute = len(recent_messages)
+            messages_per_minute = self.get_messages_per_minute(channel.id)
             activity_level = self.get_activity_level(messages_per_minute)
             current_slowmode = channel.slowmode_delay
 
@@ -467,15 +597,29 @@ class MessageRateCog(commands.Cog):
                 inline=True,
             )
 
+            curve = self.get_curve(guild_id)
             embed.add_field(
-                name="Thresholds",
-                value=f"High: ≥{self.HIGH_RATE_THRESHOLD} msg/min\nMedium: ≥{self.LOW_RATE_THRESHOLD} msg/min",
-                inline=True,
+                name="Slowmode Curve",
+                value=f"{curve.describe()}\nStep down {curve.hysteresis:.0%} below a level, after {curve.dwell:g}s",
+                inline=False,
             )
 
+            if guild_id in self.guild_curves:
+                guild_rate = self.message_counter.guild_per_minute(guild_id, self.ANALYSIS_WINDOW)
+                embed.add_field(
+                    name="Server-wide Activity",
+                    value=f"{guild_rate:.0f} msg/min, slowmode floor {self.guild_floors.get(guild_id, 0)}s",
+                    inline=False,
+                )
+
+            monitor_stats = self.get_monitor_stats()
             embed.add_field(
-                name="Slowmode Settings",
-                value=f"High: {self.HIGH_RATE_SLOWMODE}s\nMedium: {self.LOW_RATE_SLOWMODE}s\nLow: {self.NO_SLOWMODE}s",
+                name="Monitor",
+                value=f"Last tick: {monitor_stats['last_tick_visits']} channels checked\n"
+                f"Tick time: {monitor_stats['tick_avg_ms']:.1f}ms avg, {monitor_stats['tick_max_ms']:.1f}ms max\n"
+                f"Enabled channels: {monitor_stats['enabled_channels']}\n"
+                f"Slowmode edits: {monitor_stats['slowmode_edits']} ({monitor_stats['slowmode_coalesced']} coalesced)\n"
+                f"Counters: {monitor_stats['counter_backend']}",
                 inline=True,
             )
 
@@ -516,11 +660,49 @@ class MessageRateCog(commands.Cog):
         guild_id: int,
         notifications: Optional[bool],
         notification_channel: Optional[discord.TextChannel],
+        curve: Optional[str] = None,
+        guild_curve: Optional[str] = None,
     ):
         """Handle config action for global settings."""
         try:
             changes = []
 
+            if curve is not None:
+                if curve.strip().lower() == "default":
+                    new_curve = self.default_curve
+                    await set_guild_config(guild_id, "AUTO_RATE_CURVE", None)
+                else:
+                    try:
+                        new_curve = SlowmodeCurve.parse(curve.replace(" ", ""))
+                    except ValueError as e:
+                        if hasattr(interaction, "followup"):
+                            await interaction.followup.send(f"❌ Invalid curve: {e}", ephemeral=True)
+                        else:
+                            await interaction.send(f"❌ Invalid curve: {e}")
+                        return
+                    await set_guild_config(guild_id, "AUTO_RATE_CURVE", new_curve.to_config())
+                self.curves[guild_id] = new_curve
+                changes.append(f"Slowmode curve:\n{new_curve.describe()}")
+
+            if guild_curve is not None:
+                if guild_curve.strip().lower() == "off":
+                    await set_guild_config(guild_id, "AUTO_RATE_GUILD_CURVE", None)
+                    self.guild_curves.pop(guild_id, None)
+                    self.guild_floors.pop(guild_id, None)
+                    changes.append("Server-wide slowmode floor: ❌ Disabled")
+                else:
+                    try:
+                        new_guild_curve = SlowmodeCurve.parse(guild_curve.replace(" ", ""))
+                    except ValueError as e:
+                        if hasattr(interaction, "followup"):
+                            await interaction.followup.send(f"❌ Invalid server-wide curve: {e}", ephemeral=True)
+                        else:
+                            await interaction.send(f"❌ Invalid server-wide curve: {e}")
+                        return
+                    await set_guild_config(guild_id, "AUTO_RATE_GUILD_CURVE", new_guild_curve.to_config())
+                    self.guild_curves[guild_id] = new_guild_curve
+                    changes.append(f"Server-wide slowmode floor:\n{new_guild_curve.describe()}")
+
             if notifications is not None:
                 await set_guild_config(guild_id, "AUTO_RATE_NOTIFY", notifications)
                 changes.append(f"Notifications: {'✅ Enabled' if notifications else '❌ Disabled'}")
@@ -529,7 +711,13 @@ class MessageRateCog(commands.Cog):
                 await set_guild_config(guild_id, "AUTO_RATE_NOTIFY_CHANNEL", notification_channel.id)
                 changes.append(f"Notification channel: {notification_channel.mention}")
 
-            if not changes:
+            if changes:
+                embed = discord.Embed(
+                    title="✅ Auto Rate Limiting Configuration Updated",
+                    description="\n".join(changes),
+                    color=discord.Color.green(),
+                )
+            else:
                 # Show current config
                 notify_enabled = await get_guild_config(guild_id, "AUTO_RATE_NOTIFY", False)
                 notify_channel_id = await get_guild_config(guild_id, "AUTO_RATE_NOTIFY_CHANNEL", None)
@@ -552,21 +740,17 @@ class MessageRateCog(commands.Cog):
                     inline=True,
                 )
 
-                embed = discord.Embed(
-                    title="⚙️ Auto Rate Limiting Configuration",
-                    color=discord.Color.blue(),
-                )
-
                 embed.add_field(
-                    name="Notifications",
-                    value="✅ Enabled" if notify_enabled else "❌ Disabled",
-                    inline=True,
+                    name="Slowmode Curve",
+                    value=self.get_curve(guild_id).describe(),
+                    inline=False,
                 )
 
+                guild_curve_value = self.guild_curves.get(guild_id)
                 embed.add_field(
-                    name="Notification Channel",
-                    value=notify_channel.mention if notify_channel else "Not set",
-                    inline=True,
+                    name="Server-wide Slowmode Floor",
+                    value=guild_curve_value.describe() if guild_curve_value else "Not set",
+                    inline=False,
                 )
 
             if hasattr(interaction, "followup"):
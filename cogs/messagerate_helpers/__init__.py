@@ -0,0 +1,3 @@
+"""
+Message rate helpers package for the MessageRateCog.
+"""
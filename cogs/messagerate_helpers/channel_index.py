@@ -0,0 +1,105 @@
+"""
+In-process index of the channels that have automatic rate limiting enabled.
+
+The rate monitor used to read ``AUTO_RATE_ENABLED`` and ``AUTO_RATE_CHANNELS``
+for every text channel of every guild on every tick. This index keeps the
+enabled channels of each guild in memory. It is updated directly when a
+command enables or disables a channel, and a guild is marked stale when a
+config invalidation touches its rate settings, so the config is only re-read
+for guilds whose settings actually changed.
+"""
+
+import logging
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Iterable, Optional, Set
+
+# Guild config keys loaded with a guild's enabled channels
+AUTO_RATE_KEYS = ("AUTO_RATE_ENABLED", "AUTO_RATE_CHANNELS", "AUTO_RATE_CURVE", "AUTO_RATE_GUILD_CURVE")
+
+ChannelLoader = Callable[[int], Awaitable[Iterable[int]]]
+
+log = logging.getLogger(__name__)
+
+
+class AutoRateIndex:
+    """Enabled auto rate channels per guild, reloaded only for guilds marked stale."""
+
+    def __init__(self):
+        self._guild_channels: Dict[int, FrozenSet[int]] = {}
+        self._channel_guilds: Dict[int, int] = {}
+        self._stale: Set[int] = set()
+        self._all_stale = True
+        self.loads = 0
+
+    def __len__(self) -> int:
+        return len(self._channel_guilds)
+
+    def guild_of(self, channel_id: int) -> Optional[int]:
+        """Guild of an enabled channel, or None when the channel is not enabled."""
+        return self._channel_guilds.get(channel_id)
+
+    def channels(self, guild_id: int) -> FrozenSet[int]:
+        return self._guild_channels.get(guild_id, frozenset())
+
+    def set_guild(self, guild_id: int, channel_ids: Iterable[int]) -> None:
+        """Replace a guild's enabled channels; an empty iterable disables the guild."""
+        for channel_id in self._guild_channels.pop(guild_id, ()):
+            self._channel_guilds.pop(channel_id, None)
+        channel_ids = frozenset(channel_ids)
+        if channel_ids:
+            self._guild_channels[guild_id] = channel_ids
+            for channel_id in channel_ids:
+                self._channel_guilds[channel_id] = guild_id
+        self._stale.discard(guild_id)
+
+    def enable_channel(self, guild_id: int, channel_id: int) -> None:
+        self.set_guild(guild_id, self.channels(guild_id) | {channel_id})
+
+    def disable_channel(self, guild_id: int, channel_id: int) -> None:
+        self.set_guild(guild_id, self.channels(guild_id) - {channel_id})
+
+    def forget_guild(self, guild_id: int) -> None:
+        self.set_guild(guild_id, ())
+
+    def mark_stale(self, guild_id: Optional[int] = None) -> None:
+        """Reload a guild on the next refresh, or every guild when ``guild_id`` is None."""
+        if guild_id is None:
+            self._all_stale = True
+        else:
+            self._stale.add(guild_id)
+
+    def on_config_invalidation(self, payload: Dict[str, Any]) -> None:
+        """Invalidation handler: mark guilds whose rate settings changed as stale."""
+        if payload.get("scope") != "guild_config":
+            return
+        if payload.get("key") is None or payload.get("key") in AUTO_RATE_KEYS:
+            self.mark_stale(payload.get("guild_id"))
+
+    async def refresh(self, guild_ids: Iterable[int], loader: ChannelLoader) -> int:
+        """Reload the stale guilds among ``guild_ids`` with ``loader``; returns how many were loaded."""
+        guild_ids = set(guild_ids)
+        stale = guild_ids if self._all_stale else self._stale & guild_ids
+        self._all_stale = False
+        # Guilds the bot has left keep nothing enabled
+        for guild_id in set(self._guild_channels) - guild_ids:
+            self.forget_guild(guild_id)
+        loaded = 0
+        for guild_id in stale:
+            try:
+                channel_ids = await loader(guild_id)
+            except Exception as e:
+                # Keep the previous channels and try again on the next refresh
+                log.error(f"Failed to load auto rate channels for guild {guild_id}: {e}")
+                self._stale.add(guild_id)
+                continue
+            self.set_guild(guild_id, channel_ids)
+            loaded += 1
+        self.loads += loaded
+        return loaded
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "guilds": len(self._guild_channels),
+            "channels": len(self._channel_guilds),
+            "stale": len(self._stale),
+            "loads": self.loads,
+        }
@@ -0,0 +1,149 @@
+"""
+Per-channel message counters bucketed by second.
+
+Each channel gets a fixed ring of per-second counts covering ``span`` seconds.
+Recording a message is an increment plus clearing the buckets of the seconds
+that passed since the channel's last message, so updates are O(1) amortized
+and memory per channel is constant no matter how busy it is. Counts over any
+window up to ``span`` are exact. The same rings also total each guild's messages across its channels.
+Channels with no messages in a whole span hold nothing worth keeping and are
+evicted.
+"""
+
+import time
+from array import array
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+
+class ChannelCounter:
+    """Ring of per-second message counts for one channel."""
+
+    __slots__ = ("buckets", "last_second")
+
+    def __init__(self, span: int, second: int):
+        self.buckets = array("I", bytes(4 * span))
+        self.last_second = second
+
+    def advance(self, second: int) -> None:
+        """Clear the buckets of the seconds between the last update and ``second``."""
+        span = len(self.buckets)
+        elapsed = second - self.last_second
+        if elapsed <= 0:
+            return
+        if elapsed >= span:
+            self.buckets = array("I", bytes(4 * span))
+        else:
+            for passed in range(self.last_second + 1, second + 1):
+                self.buckets[passed % span] = 0
+        self.last_second = second
+
+    def count(self, second: int, window: int) -> int:
+        """Messages in the ``window`` seconds ending at ``second``, without modifying the ring."""
+        span = len(self.buckets)
+        start = max(second - window + 1, self.last_second - span + 1)
+        return sum(self.buckets[s % span] for s in range(start, min(second, self.last_second) + 1))
+
+
+class MessageRateCounter:
+    """Sliding-window message counts for every channel and guild, kept in process.
+
+    Args:
+        span: Longest window, in seconds, that counts can be taken over.
+        clock: Source of the current time in seconds; ``time.monotonic`` by default.
+    """
+
+    def __init__(self, span: int = 300, clock=time.monotonic):
+        self.span = max(1, span)
+        self.clock = clock
+        self._channels: Dict[int, ChannelCounter] = {}
+        self._guilds: Dict[int, ChannelCounter] = {}
+        self.recorded = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._channels)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._channels)
+
+    def _second(self, now: Optional[float]) -> int:
+        return int(self.clock() if now is None else now)
+
+    def _add(self, counters: Dict[int, ChannelCounter], key: int, second: int, count: int) -> None:
+        counter = counters.get(key)
+        if counter is None:
+            counter = counters[key] = ChannelCounter(self.span, second)
+        counter.advance(second)
+        counter.buckets[max(second, counter.last_second) % self.span] += count
+
+    def record(
+        self,
+        channel_id: int,
+        count: int = 1,
+        now: Optional[float] = None,
+        guild_id: Optional[int] = None,
+        share: bool = True,
+    ) -> None:
+        """Count ``count`` messages in a channel, and its guild when given, at the current second.
+
+        ``share`` only matters to counters shared between processes; everything here is local.
+        """
+        second = self._second(now)
+        self._add(self._channels, channel_id, second, count)
+        if guild_id is not None:
+            self._add(self._guilds, guild_id, second, count)
+        self.recorded += count
+
+    def count(self, channel_id: int, window: int, now: Optional[float] = None) -> int:
+        """Messages a channel received in the last ``window`` seconds (capped at ``span``)."""
+        counter = self._channels.get(channel_id)
+        if counter is None:
+            return 0
+        return counter.count(self._second(now), min(window, self.span))
+
+    def guild_count(self, guild_id: int, window: int, now: Optional[float] = None) -> int:
+        """Messages across all of a guild's channels in the last ``window`` seconds."""
+        counter = self._guilds.get(guild_id)
+        if counter is None:
+            return 0
+        return counter.count(self._second(now), min(window, self.span))
+
+    def per_minute(self, channel_id: int, window: int = 60, now: Optional[float] = None) -> float:
+        """Average messages per minute over the last ``window`` seconds."""
+        window = min(max(1, window), self.span)
+        return self.count(channel_id, window, now) * 60 / window
+
+    def guild_per_minute(self, guild_id: int, window: int = 60, now: Optional[float] = None) -> float:
+        """Average messages per minute across a guild over the last ``window`` seconds."""
+        window = min(max(1, window), self.span)
+        return self.guild_count(guild_id, window, now) * 60 / window
+
+    async def sync(
+        self, channel_ids: Iterable[int] = (), guild_ids: Iterable[int] = (), now: Optional[float] = None
+    ) -> bool:
+        """Exchange counts with other processes; in-process counts have nothing to exchange."""
+        return True
+
+    def last_active(self, channel_id: int) -> Optional[int]:
+        """Second of the channel's most recent message, if it is still tracked."""
+        counter = self._channels.get(channel_id)
+        return counter.last_second if counter else None
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Forget channels with no messages in the last ``span`` seconds."""
+        cutoff = self._second(now) - self.span
+        idle = [channel_id for channel_id, counter in self._channels.items() if counter.last_second <= cutoff]
+        for channel_id in idle:
+            del self._channels[channel_id]
+        for guild_id in [guild_id for guild_id, counter in self._guilds.items() if counter.last_second <= cutoff]:
+            del self._guilds[guild_id]
+        self.evicted += len(idle)
+        return len(idle)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "channels": len(self._channels),
+            "recorded": self.recorded,
+            "evicted": self.evicted,
+        }
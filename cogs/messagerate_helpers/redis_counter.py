@@ -0,0 +1,197 @@
+"""
+Message rate counters shared through Redis.
+
+``MessageRateCounter`` lives in one process, so its counts start over on every
+cog reload and every process of a split ``AutoShardedBot`` sees only its own
+messages. ``RedisRateCounter`` has the same interface, backed by time-bucketed
+Redis keys (``msgrate:<c|g>:<id>:<bucket>``). Messages are counted locally and
+flushed once per monitor tick as pipelined ``INCRBY``/``EXPIRE`` commands.
+The same pipeline then reads back the shared buckets of the channels and
+guilds being watched. Buckets are aligned to wall-clock time, so every
+process agrees on them.
+
+Reads combine the last synced shared totals with increments that have not
+been flushed yet, so a burst in this process shows up before the next sync.
+Without Redis the counter keeps working on its local increments alone.
+Channels recorded with ``share=False`` (those without auto rate limiting) are
+only counted locally, so Redis holds the auto rate channels and guild totals.
+"""
+
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from database.cache import get_redis
+
+REDIS_KEY_PREFIX = "msgrate"
+
+log = logging.getLogger(__name__)
+
+# (kind, id, bucket) where kind is "c" for a channel or "g" for a guild
+BucketKey = Tuple[str, int, int]
+
+
+class RedisRateCounter:
+    """Message counts per channel and guild, shared across processes through Redis.
+
+    Args:
+        span: Longest window, in seconds, that counts can be taken over.
+        bucket: Width, in seconds, of each Redis bucket.
+        clock: Source of the current wall-clock time in seconds.
+    """
+
+    def __init__(self, span: int = 120, bucket: int = 5, clock=time.time):
+        self.bucket = max(1, bucket)
+        self.span = max(self.bucket, span)
+        self.clock = clock
+        self._pending: Dict[BucketKey, int] = defaultdict(int)
+        # Counts of unshared channels, never flushed to Redis
+        self._local: Dict[BucketKey, int] = defaultdict(int)
+        self._shared: Dict[Tuple[str, int], Dict[int, int]] = {}
+        self._last_seen: Dict[int, float] = {}
+        self.recorded = 0
+        self.evicted = 0
+        self.syncs = 0
+        self.failed_syncs = 0
+
+    def __len__(self) -> int:
+        return len(self._last_seen)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._last_seen)
+
+    def _now(self, now: Optional[float]) -> float:
+        return self.clock() if now is None else now
+
+    def _key(self, kind: str, entity_id: int, bucket: int) -> str:
+        return f"{REDIS_KEY_PREFIX}:{kind}:{entity_id}:{bucket}"
+
+    def _first_bucket(self, now: float, window: int) -> int:
+        return int((now - min(window, self.span)) // self.bucket)
+
+    def _buckets(self, now: float, window: int) -> range:
+        """Buckets overlapping the last ``window`` seconds, ending with the current, partly filled one."""
+        return range(self._first_bucket(now, window), int(now // self.bucket) + 1)
+
+    def record(
+        self,
+        channel_id: int,
+        count: int = 1,
+        now: Optional[float] = None,
+        guild_id: Optional[int] = None,
+        share: bool = True,
+    ) -> None:
+        """Count ``count`` messages in a channel, and its guild when given.
+
+        With ``share`` False the channel's count stays in this process; the guild's is shared regardless.
+        """
+        now = self._now(now)
+        bucket = int(now // self.bucket)
+        (self._pending if share else self._local)["c", channel_id, bucket] += count
+        if guild_id is not None:
+            self._pending["g", guild_id, bucket] += count
+        self._last_seen[channel_id] = now
+        self.recorded += count
+
+    def _count(self, kind: str, entity_id: int, window: int, now: Optional[float]) -> int:
+        shared = self._shared.get((kind, entity_id), {})
+        return sum(
+            shared.get(bucket, 0)
+            + self._pending.get((kind, entity_id, bucket), 0)
+            + self._local.get((kind, entity_id, bucket), 0)
+            for bucket in self._buckets(self._now(now), window)
+        )
+
+    def count(self, channel_id: int, window: int, now: Optional[float] = None) -> int:
+        """Messages a channel received in the last ``window`` seconds, to bucket precision."""
+        return self._count("c", channel_id, window, now)
+
+    def guild_count(self, guild_id: int, window: int, now: Optional[float] = None) -> int:
+        """Messages across all of a guild's channels in the last ``window`` seconds."""
+        return self._count("g", guild_id, window, now)
+
+    def _per_minute(self, kind: str, entity_id: int, window: int, now: Optional[float]) -> float:
+        now = self._now(now)
+        window = min(max(1, window), self.span)
+        # Counts cover whole buckets, the last one only partly elapsed, so divide by the time they span
+        covered = now - self._first_bucket(now, window) * self.bucket
+        return self._count(kind, entity_id, window, now) * 60 / covered
+
+    def per_minute(self, channel_id: int, window: int = 60, now: Optional[float] = None) -> float:
+        return self._per_minute("c", channel_id, window, now)
+
+    def guild_per_minute(self, guild_id: int, window: int = 60, now: Optional[float] = None) -> float:
+        return self._per_minute("g", guild_id, window, now)
+
+    def last_active(self, channel_id: int) -> Optional[int]:
+        seen = self._last_seen.get(channel_id)
+        return int(seen) if seen is not None else None
+
+    async def sync(
+        self, channel_ids: Iterable[int] = (), guild_ids: Iterable[int] = (), now: Optional[float] = None
+    ) -> bool:
+        """Flush local increments and fetch the shared buckets of ``channel_ids`` and ``guild_ids``."""
+        redis = await get_redis()
+        if redis is None:
+            return False
+        now = self._now(now)
+        pending, self._pending = self._pending, defaultdict(int)
+        entities = [("c", channel_id) for channel_id in set(channel_ids)]
+        entities += [("g", guild_id) for guild_id in set(guild_ids)]
+        buckets = self._buckets(now, self.span)
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                for (kind, entity_id, bucket), count in pending.items():
+                    key = self._key(kind, entity_id, bucket)
+                    pipe.incrby(key, count)
+                    pipe.expire(key, self.span + self.bucket)
+                for kind, entity_id in entities:
+                    pipe.mget([self._key(kind, entity_id, bucket) for bucket in buckets])
+                results = await pipe.execute()
+        except Exception as e:
+            log.error(f"Failed to sync message rate counters with Redis: {e}")
+            self.failed_syncs += 1
+            for key, count in pending.items():
+                self._pending[key] += count
+            return False
+
+        for entity, values in zip(entities, results[2 * len(pending) :]):
+            self._shared[entity] = {bucket: int(value) for bucket, value in zip(buckets, values) if value is not None}
+        self.syncs += 1
+        return True
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Forget channels idle for a whole span, and buckets that have aged out of every window."""
+        now = self._now(now)
+        cutoff = now - self.span
+        idle = [channel_id for channel_id, seen in self._last_seen.items() if seen <= cutoff]
+        for channel_id in idle:
+            del self._last_seen[channel_id]
+            self._shared.pop(("c", channel_id), None)
+        oldest = self._buckets(now, self.span).start
+        # Only left over when Redis is unreachable; nothing reads them once they are this old
+        for key in [key for key in self._pending if key[2] < oldest]:
+            del self._pending[key]
+        for key in [key for key in self._local if key[2] < oldest]:
+            del self._local[key]
+        for entity in list(self._shared):
+            buckets = self._shared[entity]
+            for bucket in [bucket for bucket in buckets if bucket < oldest]:
+                del buckets[bucket]
+            if not buckets:
+                del self._shared[entity]
+        self.evicted += len(idle)
+        return len(idle)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "redis",
+            "channels": len(self._last_seen),
+            "recorded": self.recorded,
+            "evicted": self.evicted,
+            "pending_buckets": len(self._pending),
+            "local_buckets": len(self._local),
+            "syncs": self.syncs,
+            "failed_syncs": self.failed_syncs,
+        }
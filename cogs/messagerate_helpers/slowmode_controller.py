@@ -0,0 +1,263 @@
+"""
+Slowmode controllers for the MessageRateCog.
+
+A controller turns a channel's message counts into a target slowmode. The
+original behaviour maps one 60 second count onto fixed levels, which flaps
+whenever a channel sits near a threshold. ``EwmaSlowmodeController`` keeps a
+fast and a slow exponentially weighted rate per channel. It escalates as soon
+as the fast rate crosses a level. It only steps down once the slower rate has
+fallen a hysteresis margin below the current level and the channel has spent
+the curve's dwell time there.
+
+``SlowmodeCurve`` holds the per-guild levels and tuning. ``CoalescedSlowmodeEditor``
+makes sure at most one ``channel.edit`` per channel is in flight and that
+targets computed meanwhile collapse into a single follow-up edit.
+"""
+
+import math
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from .rate_counter import MessageRateCounter
+
+# Discord's maximum slowmode, in seconds
+MAX_SLOWMODE = 21600
+
+
+@dataclass(frozen=True)
+class SlowmodeCurve:
+    """Slowmode levels for a guild.
+
+    Attributes:
+        levels: ``(messages per minute, slowmode seconds)`` pairs, both increasing.
+        hysteresis: Fraction below a level's threshold the rate must fall before stepping down from it.
+        dwell: Seconds a channel stays at a level before it may step down.
+    """
+
+    levels: Tuple[Tuple[float, int], ...] = ((3, 2), (10, 5))
+    hysteresis: float = 0.25
+    dwell: float = 120.0
+
+    def __post_init__(self):
+        rates = [rate for rate, _ in self.levels]
+        delays = [delay for _, delay in self.levels]
+        if not self.levels or any(rate <= 0 for rate in rates):
+            raise ValueError("A curve needs at least one level with a positive rate.")
+        if rates != sorted(set(rates)) or delays != sorted(set(delays)):
+            raise ValueError("Curve rates and slowmodes must both increase.")
+        if delays[0] <= 0 or delays[-1] > MAX_SLOWMODE:
+            raise ValueError(f"Slowmode levels must be between 1 and {MAX_SLOWMODE} seconds.")
+        if not 0 <= self.hysteresis < 1 or self.dwell < 0:
+            raise ValueError("Hysteresis must be in [0, 1) and dwell must not be negative.")
+
+    def level_for(self, rate: float) -> int:
+        """Slowmode of the highest level whose threshold ``rate`` reaches."""
+        slowmode = 0
+        for threshold, delay in self.levels:
+            if rate >= threshold:
+                slowmode = delay
+        return slowmode
+
+    def threshold_of(self, slowmode: int) -> float:
+        """Threshold of the highest level at or below ``slowmode``; 0 when none is."""
+        threshold = 0.0
+        for level_rate, delay in self.levels:
+            if delay <= slowmode:
+                threshold = level_rate
+        return threshold
+
+    @classmethod
+    def parse(cls, text: str, **kwargs) -> "SlowmodeCurve":
+        """Parse levels written as ``rate:seconds`` pairs, e.g. ``3:2,10:5,30:10``."""
+        try:
+            levels = tuple(
+                (float(rate), int(delay)) for rate, delay in (pair.split(":") for pair in text.split(",") if pair)
+            )
+        except ValueError:
+            raise ValueError("Write the curve as msg/min:seconds pairs, e.g. 3:2,10:5,30:10.") from None
+        return cls(levels=levels, **kwargs)
+
+    @classmethod
+    def from_config(
+        cls, value: Optional[Dict[str, Any]], default: Optional["SlowmodeCurve"]
+    ) -> Optional["SlowmodeCurve"]:
+        """Build a curve from its stored form, falling back to ``default`` for anything missing or invalid.
+
+        With ``default=None`` a stored curve must be complete, and None is returned when it is not.
+        """
+        if not value:
+            return default
+        try:
+            value = {**(default.to_config() if default is not None else {}), **value}
+            return cls(
+                levels=tuple((float(rate), int(delay)) for rate, delay in value["levels"]),
+                hysteresis=float(value["hysteresis"]),
+                dwell=float(value["dwell"]),
+            )
+        except (TypeError, ValueError, AttributeError, KeyError):
+            return default
+
+    def to_config(self) -> Dict[str, Any]:
+        return {"levels": [list(level) for level in self.levels], "hysteresis": self.hysteresis, "dwell": self.dwell}
+
+    def describe(self) -> str:
+        lines = [f"• ≥{rate:g} msg/min: {delay}s slowmode" for rate, delay in reversed(self.levels)]
+        lines.append(f"• Below {self.levels[0][0]:g} msg/min: No slowmode")
+        return "\n".join(lines)
+
+
+class SlowmodeController(ABC):
+    """Chooses a channel's slowmode from its message counts."""
+
+    @abstractmethod
+    def target_slowmode(
+        self,
+        channel_id: int,
+        counter: MessageRateCounter,
+        curve: SlowmodeCurve,
+        current: int,
+        now: Optional[float] = None,
+    ) -> int:
+        """Slowmode, in seconds, a channel currently at ``current`` should have."""
+
+    def estimate(self, channel_id: int) -> Optional[float]:
+        """The controller's current rate estimate for a channel, in messages per minute."""
+        return None
+
+    def forget(self, channel_id: int) -> None:
+        """Drop any state kept for a channel."""
+
+
+class ThresholdController(SlowmodeController):
+    """The original behaviour: the level for the message count of the last ``window`` seconds."""
+
+    def __init__(self, window: int = 60):
+        self.window = window
+
+    def target_slowmode(self, channel_id, counter, curve, current, now=None) -> int:
+        return curve.level_for(counter.per_minute(channel_id, self.window, now))
+
+
+@dataclass
+class _ChannelEstimate:
+    fast: float
+    slow: float
+    updated: float
+    changed: float = field(default=-math.inf)
+
+
+class EwmaSlowmodeController(SlowmodeController):
+    """Fast and slow EWMA rates with hysteresis and a minimum dwell time per level.
+
+    Args:
+        fast_tau: Time constant, in seconds, of the rate used to escalate.
+        slow_tau: Time constant, in seconds, of the rate used to step down.
+        warmup: Seconds of history that seed a channel's first estimate.
+    """
+
+    def __init__(self, fast_tau: float = 15.0, slow_tau: float = 90.0, warmup: int = 60):
+        self.fast_tau = fast_tau
+        self.slow_tau = slow_tau
+        self.warmup = warmup
+        self._channels: Dict[int, _ChannelEstimate] = {}
+
+    def _observe(self, channel_id: int, counter: MessageRateCounter, now: float) -> _ChannelEstimate:
+        state = self._channels.get(channel_id)
+        if state is None:
+            rate = counter.per_minute(channel_id, self.warmup, now)
+            state = self._channels[channel_id] = _ChannelEstimate(rate, rate, now)
+            return state
+        elapsed = min(now - state.updated, counter.span)
+        if elapsed < 1:
+            return state
+        # Exact rate since the last observation, folded in with time-aware weights
+        rate = counter.per_minute(channel_id, int(elapsed), now)
+        state.fast += (rate - state.fast) * (1 - math.exp(-elapsed / self.fast_tau))
+        state.slow += (rate - state.slow) * (1 - math.exp(-elapsed / self.slow_tau))
+        state.updated = now
+        return state
+
+    def target_slowmode(self, channel_id, counter, curve, current, now=None) -> int:
+        now = counter.clock() if now is None else now
+        state = self._observe(channel_id, counter, now)
+
+        # Surges escalate on the fast estimate straight away
+        escalated = curve.level_for(state.fast)
+        if escalated > current:
+            state.changed = now
+            return escalated
+
+        if escalated == current or now - state.changed < curve.dwell:
+            return current
+        # Step down only once the busier of the two estimates is clear of the current level's band
+        rate = max(state.fast, state.slow)
+        if rate >= curve.threshold_of(current) * (1 - curve.hysteresis):
+            return current
+        target = min(current, curve.level_for(rate / (1 - curve.hysteresis)))
+        if target != current:
+            state.changed = now
+        return target
+
+    def estimate(self, channel_id: int) -> Optional[float]:
+        state = self._channels.get(channel_id)
+        return state.fast if state else None
+
+    def forget(self, channel_id: int) -> None:
+        self._channels.pop(channel_id, None)
+
+
+CONTROLLERS: Dict[str, Callable[[], SlowmodeController]] = {
+    "ewma": EwmaSlowmodeController,
+    "threshold": ThresholdController,
+}
+
+
+def make_controller(name: str) -> SlowmodeController:
+    """Build the controller registered under ``name``, defaulting to the EWMA controller."""
+    return CONTROLLERS.get(name.lower(), EwmaSlowmodeController)()
+
+
+class CoalescedSlowmodeEditor:
+    """Applies slowmode edits with at most one request in flight per channel.
+
+    A target set while a channel's edit is in flight replaces any earlier
+    pending target, and only the latest one is applied once the current edit
+    finishes, so bursts of decisions cost at most one extra API call.
+
+    Args:
+        edit: Coroutine function performing the edit, ``edit(channel, slowmode)``.
+    """
+
+    def __init__(self, edit: Callable[[Any, int], Awaitable[Any]]):
+        self._edit = edit
+        self._in_flight: Dict[int, int] = {}
+        self._pending: Dict[int, int] = {}
+        self.edits = 0
+        self.coalesced = 0
+
+    async def apply(self, channel: Any, slowmode: int) -> bool:
+        """Set a channel's slowmode; returns False when the target was folded into an in-flight edit."""
+        if channel.id in self._in_flight:
+            self.coalesced += 1
+            self._pending[channel.id] = slowmode
+            return False
+        try:
+            while True:
+                self._in_flight[channel.id] = slowmode
+                self.edits += 1
+                await self._edit(channel, slowmode)
+                pending = self._pending.pop(channel.id, None)
+                if pending is None or pending == slowmode:
+                    return True
+                slowmode = pending
+        finally:
+            self._in_flight.pop(channel.id, None)
+            self._pending.pop(channel.id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"edits": self.edits, "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
+
+
+async def edit_slowmode(channel: Any, slowmode: int) -> None:
+    await channel.edit(slowmode_delay=slowmode)
@@ -12,6 +12,7 @@ from database.operations import (
     remove_guild_api_key,
 )
 from .aimod_helpers.copilot_auth import start_copilot_login
+from .aimod_helpers.litellm_config import CIRCUIT_CLOSED, CIRCUIT_OPEN, get_litellm_client
 
 
 class ApiKeyModal(discord.ui.Modal):
@@ -99,6 +100,60 @@ class ModelManagementCog(commands.Cog, name="Model Management"):
         response_func = ctx.interaction.response.send_message if ctx.interaction else ctx.send
         await response_func(embed=embed, ephemeral=False if ctx.interaction else False)
 
+    @model.command(name="health", description="View model error rates, latency and circuit breaker state.")
+    async def modhealth(self, ctx: commands.Context):
+        client = get_litellm_client()
+        snapshots = client.health_snapshot()
+        embed = discord.Embed(
+            title="AI Model Health",
+            description="Rolling error rate and p95 latency per model. Open circuits are skipped in favour of the fallback model.",
+            color=discord.Color.blue(),
+        )
+        if not snapshots:
+            embed.description = "No model requests have been made yet."
+        for snapshot in snapshots:
+            if snapshot["state"] == CIRCUIT_OPEN:
+                state = f"🔴 Open (probe in {snapshot['retry_in']:.0f}s)"
+            elif snapshot["state"] == CIRCUIT_CLOSED:
+                state = "🟢 Closed"
+            else:
+                state = "🟡 Half-open"
+            p95 = f"{snapshot['p95'] * 1000:.0f} ms" if snapshot["p95"] is not None else "n/a"
+            embed.add_field(
+                name=snapshot["model"],
+                value=(
+                    f"Circuit: {state}\n"
+                    f"Error rate: {snapshot['error_rate']:.0%} of {snapshot['requests']} requests\n"
+                    f"p95 latency: {p95}\n"
+                    f"Times opened: {snapshot['times_opened']} | Skipped: {snapshot['short_circuited']}"
+                ),
+                inline=False,
+            )
+        hedge_stats = client.hedge_stats()
+        if hedge_stats["enabled"]:
+            embed.add_field(
+                name="Request Hedging",
+                value=(
+                    f"Hedged: {hedge_stats['hedges_sent']}/{hedge_stats['eligible']} ({hedge_stats['hedge_rate']:.1%})\n"
+                    f"Hedge answered first: {hedge_stats['hedge_wins']} ({hedge_stats['win_rate']:.1%})"
+                ),
+                inline=False,
+            )
+        limiter_stats = client.key_limiter.stats()
+        if limiter_stats["keys"]:
+            embed.add_field(
+                name="Guild API Key Limits",
+                value=(
+                    f"Keys tracked: {limiter_stats['keys']} | Waiting: {limiter_stats['waiting']}\n"
+                    f"Admitted: {limiter_stats['admitted']} (delayed {limiter_stats['delayed']})\n"
+                    f"Shed locally: {limiter_stats['shed']} | Provider 429s: {limiter_stats['provider_throttles']}"
+                ),
+                inline=False,
+            )
+        embed.timestamp = discord.utils.utcnow()
+        response_func = ctx.interaction.response.send_message if ctx.interaction else ctx.send
+        await response_func(embed=embed, ephemeral=False if ctx.interaction else False)
+
     @byok.command(name="set", description="Set the guild's API key for a specific provider.")
     @app_commands.checks.has_permissions(administrator=True)
     @app_commands.describe(provider="The provider to set the key for (e.g., 'openai', 'anthropic').")
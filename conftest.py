@@ -10,5 +10,8 @@ if "ENCRYPTION_KEY" not in os.environ:
     key = Fernet.generate_key()
     os.environ["ENCRYPTION_KEY"] = key.decode()
 
+# The LiteLLM client is created at import time and requires an API key.
+os.environ.setdefault("SLIPSTREAM_OPENROUTER_KEY", "test-key")
+
 # Add the project root to the Python path to allow for absolute imports
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
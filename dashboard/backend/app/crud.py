@@ -6,9 +6,30 @@ import json
 from datetime import datetime
 import logging
 from .db import redis_client
+from database.cache import delete_cache, publish_config_invalidation
 
 logger = logging.getLogger(__name__)
 
+# Redis per-key cache prefixes used by database.operations for each config table.
+CONFIG_CACHE_PREFIXES = {
+    "guild_config": "guild_config",
+    "guild_settings": "guild_setting",
+    "botdetect_config": "botdetect_config",
+}
+
+
+async def invalidate_config_cache(table: str, guild_id: int, keys) -> None:
+    """Drop cached config values and tell bot processes to evict their local copies."""
+    prefix = CONFIG_CACHE_PREFIXES.get(table)
+    if prefix is None:
+        return
+    for key in keys:
+        try:
+            await delete_cache(f"{prefix}:{guild_id}:{key}")
+            await publish_config_invalidation(table, guild_id, key)
+        except Exception as e:
+            logger.warning(f"Failed to invalidate cached {table} {key} for guild {guild_id}: {e}")
+
 
 async def get_general_settings(db: Session, guild_id: int) -> schemas.GeneralSettings:
     """Retrieve general settings for a guild."""
@@ -39,7 +60,8 @@ async def update_general_settings(
     db: Session, guild_id: int, settings_data: schemas.GeneralSettingsUpdate
 ) -> schemas.GeneralSettings:
     """Update general settings for a guild."""
-    for key, value in settings_data.model_dump(exclude_unset=True).items():
+    updates = settings_data.model_dump(exclude_unset=True)
+    for key, value in updates.items():
         db_value = json.dumps(value)
         await db.execute(
             text(
@@ -55,6 +77,7 @@ async def update_general_settings(
         if key == "prefix":
             await redis_client.publish("prefix_updates", f"{guild_id}:{db_value}")
     await db.commit()
+    await invalidate_config_cache("guild_settings", guild_id, updates.keys())
     return await get_general_settings(db, guild_id)
 
 
@@ -126,7 +149,8 @@ async def update_moderation_settings(
     db: Session, guild_id: int, settings_data: schemas.ModerationSettingsUpdate
 ) -> schemas.ModerationSettings:
     """Update moderation settings for a guild."""
-    for key, value in settings_data.model_dump(exclude_unset=True).items():
+    updates = settings_data.model_dump(exclude_unset=True)
+    for key, value in updates.items():
         # Serialize dicts to JSON strings before storing
         db_value = json.dumps(value) if isinstance(value, dict) else value
         await db.execute(
@@ -141,6 +165,7 @@ async def update_moderation_settings(
             {"guild_id": guild_id, "key": key, "value": db_value},
         )
     await db.commit()
+    await invalidate_config_cache("guild_settings", guild_id, updates.keys())
     return await get_moderation_settings(db, guild_id)
 
 
@@ -207,6 +232,8 @@ async def update_logging_settings(
             )
 
     await db.commit()
+    if "webhook_url" in data:
+        await invalidate_config_cache("guild_settings", guild_id, ["logging_webhook_url"])
     return await get_logging_settings(db, guild_id)
 
 
@@ -866,6 +893,7 @@ async def get_bot_detection_config(db: Session, guild_id: int) -> schemas.BotDet
     # Apply defaults if not set
     defaults = {
         "enabled": False,
+        "scan_links": True,
         "keywords": [],
         "action": "warn",
         "timeout_duration": 300,
@@ -885,8 +913,10 @@ async def update_bot_detection_config(
     db: Session, guild_id: int, settings: schemas.BotDetectionSettingsUpdate
 ) -> schemas.BotDetectionSettings:
     """Update bot detection configuration for a guild."""
+    updated_keys = []
     for key, value in settings.model_dump(exclude_unset=True).items():
         if value is not None:
+            updated_keys.append(key)
             await db.execute(
                 text(
                     """
@@ -900,6 +930,7 @@ async def update_bot_detection_config(
             )
 
     await db.commit()
+    await invalidate_config_cache("botdetect_config", guild_id, updated_keys)
     return await get_bot_detection_config(db, guild_id)
 
 
@@ -948,6 +979,7 @@ async def update_channel_exclusions(
         },
     )
     await db.commit()
+    await invalidate_config_cache("guild_config", guild_id, ["AI_EXCLUDED_CHANNELS"])
     return await get_channel_exclusions(db, guild_id)
 
 
@@ -988,6 +1020,7 @@ async def update_channel_rules(
         },
     )
     await db.commit()
+    await invalidate_config_cache("guild_config", guild_id, ["AI_CHANNEL_RULES"])
     return await get_channel_rules(db, guild_id)
 
 
@@ -1017,6 +1050,7 @@ async def delete_channel_rules(db: Session, guild_id: int, channel_id: str) -> d
             },
         )
         await db.commit()
+        await invalidate_config_cache("guild_config", guild_id, ["AI_CHANNEL_RULES"])
         return {"message": f"Custom rules for channel {channel_id} have been deleted."}
     else:
         return {"message": f"No custom rules found for channel {channel_id}."}
@@ -1064,9 +1098,11 @@ async def update_rate_limiting_settings(
     db: Session, guild_id: int, settings: schemas.RateLimitingSettingsUpdate
 ) -> schemas.RateLimitingSettings:
     """Update rate limiting configuration for a guild."""
+    updated_keys = []
     for key, value in settings.model_dump(exclude_unset=True).items():
         if value is not None:
             prefixed_key = f"message_rate_{key}"
+            updated_keys.append(prefixed_key)
             await db.execute(
                 text(
                     """
@@ -1080,6 +1116,7 @@ async def update_rate_limiting_settings(
             )
 
     await db.commit()
+    await invalidate_config_cache("guild_settings", guild_id, updated_keys)
     return await get_rate_limiting_settings(db, guild_id)
 
 
@@ -1110,6 +1147,7 @@ async def update_vanity_settings(
     db: Session, guild_id: int, settings: schemas.VanityURLSettingsUpdate
 ) -> schemas.VanityURLSettings:
     """Update vanity URL settings for a guild."""
+    updated_keys = []
     for key, value in settings.model_dump(exclude_unset=True).items():
         if key == "lock_code":
             db_key = "VANITY_URL_LOCK"
@@ -1119,6 +1157,7 @@ async def update_vanity_settings(
             db_key = "VANITY_URL_NOTIFY_TARGET"
         else:
             continue
+        updated_keys.append(db_key)
         await db.execute(
             text(
                 """
@@ -1135,6 +1174,7 @@ async def update_vanity_settings(
             },
         )
     await db.commit()
+    await invalidate_config_cache("guild_settings", guild_id, updated_keys)
     return await get_vanity_settings(db, guild_id)
 
 
@@ -1177,11 +1217,13 @@ async def get_ai_settings(db: Session, guild_id: int) -> schemas.AISettings:
 
 async def update_ai_settings(db: Session, guild_id: int, settings: schemas.AISettingsUpdate) -> schemas.AISettings:
     """Update AI settings for a guild."""
+    updated_keys = []
     if settings.channel_exclusions:
         await update_channel_exclusions(db, guild_id, settings.channel_exclusions)
     if settings.channel_rules:
         await update_channel_rules(db, guild_id, settings.channel_rules)
     if settings.analysis_mode is not None:
+        updated_keys.append("AI_ANALYSIS_MODE")
         await db.execute(
             text(
                 """
@@ -1194,6 +1236,7 @@ async def update_ai_settings(db: Session, guild_id: int, settings: schemas.AISet
             {"guild_id": guild_id, "value": json.dumps(settings.analysis_mode)},
         )
     if settings.keyword_rules is not None:
+        updated_keys.append("AI_KEYWORD_RULES")
         await db.execute(
             text(
                 """
@@ -1206,6 +1249,7 @@ async def update_ai_settings(db: Session, guild_id: int, settings: schemas.AISet
             {"guild_id": guild_id, "value": json.dumps(settings.keyword_rules)},
         )
     await db.commit()
+    await invalidate_config_cache("guild_config", guild_id, updated_keys)
     return await get_ai_settings(db, guild_id)
 
 
@@ -1269,9 +1313,11 @@ async def update_raid_defense_config(
     db: Session, guild_id: int, settings: schemas.RaidDefenseSettingsUpdate
 ) -> schemas.RaidDefenseSettings:
     """Update raid defense configuration for a guild."""
+    updated_keys = []
     for key, value in settings.model_dump(exclude_unset=True).items():
         if value is not None:
             prefixed_key = f"raid_defense_{key}"
+            updated_keys.append(prefixed_key)
             await db.execute(
                 text(
                     """
@@ -1285,6 +1331,7 @@ async def update_raid_defense_config(
             )
 
     await db.commit()
+    await invalidate_config_cache("guild_settings", guild_id, updated_keys)
     return await get_raid_defense_config(db, guild_id)
 
 
@@ -1307,7 +1354,8 @@ async def update_all_guild_settings(
     db: Session, guild_id: int, settings_data: schemas.GuildConfigUpdate
 ) -> schemas.GuildConfig:
     """Update all settings for a guild."""
-    for key, value in settings_data.model_dump(exclude_unset=True).items():
+    updates = settings_data.model_dump(exclude_unset=True)
+    for key, value in updates.items():
         db_value = json.dumps(value)
         await db.execute(
             text(
@@ -1323,6 +1371,7 @@ async def update_all_guild_settings(
         if key == "prefix":
             await redis_client.publish("prefix_updates", f"{guild_id}:{db_value}")
     await db.commit()
+    await invalidate_config_cache("guild_settings", guild_id, updates.keys())
     return await get_all_guild_settings(db, guild_id)
 
 
@@ -1494,6 +1543,9 @@ async def update_table_row(
     if not updated_row:
         raise ValueError("Row not found or update failed.")
 
+    if "guild_id" in pk_values and "key" in pk_values:
+        await invalidate_config_cache(safe_table_name, int(pk_values["guild_id"]), [pk_values["key"]])
+
     # Convert datetime objects to ISO format strings
     response_data = {}
     for key, value in updated_row.items():
@@ -1542,4 +1594,7 @@ async def delete_table_row(db: Session, table_name: str, pk_values: Dict[str, An
     result = await db.execute(query, params)
     await db.commit()
 
+    if "guild_id" in pk_values and "key" in pk_values:
+        await invalidate_config_cache(safe_table_name, int(pk_values["guild_id"]), [pk_values["key"]])
+
     return result.rowcount > 0
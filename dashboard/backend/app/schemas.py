@@ -266,6 +266,7 @@ class ModerationAction(BaseModel):
 
 class BotDetectionSettings(BaseModel):
     enabled: bool
+    scan_links: bool = True
     keywords: List[str]
     action: str
     timeout_duration: int
@@ -276,6 +277,7 @@ class BotDetectionSettings(BaseModel):
 
 class BotDetectionSettingsUpdate(BaseModel):
     enabled: Optional[bool] = None
+    scan_links: Optional[bool] = None
     keywords: Optional[List[str]] = None
     action: Optional[str] = None
     timeout_duration: Optional[int] = None
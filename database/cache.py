@@ -2,10 +2,12 @@
 
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
 import os
-from typing import Any, Optional
+import uuid
+from typing import Any, Callable, Optional
 from datetime import datetime
 
 import redis.asyncio as redis
@@ -16,6 +18,13 @@ log = logging.getLogger(__name__)
 _redis: Optional[redis.Redis] = None
 _redis_unavailable: bool = False
 
+# Pub/sub channel used to tell every process to drop cached configuration.
+CONFIG_INVALIDATION_CHANNEL = os.getenv("CONFIG_INVALIDATION_CHANNEL", "config_invalidations")
+
+# Identifies this process so it can skip invalidations it already applied locally.
+_PROCESS_ID = uuid.uuid4().hex
+_invalidation_handlers: list[Callable[[dict[str, Any]], Any]] = []
+
 
 class RedisConfig:
     """Configuration for connecting to Redis from environment variables."""
@@ -116,3 +125,98 @@ async def delete_cache(key: str) -> None:
 async def get_redis_client() -> Optional[redis.Redis]:
     """Returns the raw Redis client."""
     return await get_redis()
+
+
+# Configuration invalidation bus
+
+
+def register_invalidation_handler(handler: Callable[[dict[str, Any]], Any]) -> None:
+    """Register a callback run for every config invalidation, local or remote.
+
+    Handlers receive the payload dict (``scope``, ``guild_id``, ``key``) and must be
+    synchronous and cheap; they typically evict an in-process cache entry.
+    """
+    if handler not in _invalidation_handlers:
+        _invalidation_handlers.append(handler)
+
+
+def unregister_invalidation_handler(handler: Callable[[dict[str, Any]], Any]) -> None:
+    """Remove a previously registered invalidation handler."""
+    if handler in _invalidation_handlers:
+        _invalidation_handlers.remove(handler)
+
+
+def dispatch_invalidation(payload: dict[str, Any]) -> None:
+    """Run every registered handler for an invalidation payload."""
+    for handler in list(_invalidation_handlers):
+        try:
+            handler(payload)
+        except Exception as exc:
+            log.error(f"Config invalidation handler {handler!r} failed: {exc}")
+
+
+async def publish_config_invalidation(scope: str, guild_id: int | None, key: str | None = None) -> None:
+    """Evict local caches for a config change and broadcast it to other processes.
+
+    ``scope`` names the backing table (e.g. ``guild_config``); a ``key`` of None means
+    every key for the guild changed.
+    """
+    payload = {"scope": scope, "guild_id": guild_id, "key": key, "origin": _PROCESS_ID}
+    dispatch_invalidation(payload)
+
+    client = await get_redis()
+    if client is None:
+        return
+    try:
+        await client.publish(CONFIG_INVALIDATION_CHANNEL, json.dumps(payload))
+    except Exception as exc:
+        log.warning(f"Failed to publish config invalidation for {scope}:{guild_id}:{key}: {exc}")
+
+
+def parse_invalidation_message(data: Any) -> Optional[dict[str, Any]]:
+    """Decode a raw pub/sub message body into an invalidation payload."""
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    try:
+        payload = json.loads(data)
+    except (json.JSONDecodeError, TypeError):
+        return None
+    if not isinstance(payload, dict) or "scope" not in payload:
+        return None
+    return payload
+
+
+async def config_invalidation_listener() -> None:
+    """Subscribe to the invalidation channel and dispatch remote invalidations until cancelled."""
+    client = await get_redis()
+    if client is None:
+        log.info("Redis not available, config invalidation listener will not run.")
+        return
+
+    pubsub = client.pubsub()
+    await pubsub.subscribe(CONFIG_INVALIDATION_CHANNEL)
+    log.info(f"Subscribed to {CONFIG_INVALIDATION_CHANNEL} channel.")
+
+    try:
+        while True:
+            try:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if not message or message["type"] != "message":
+                    continue
+                payload = parse_invalidation_message(message["data"])
+                if payload is None:
+                    log.warning(f"Ignoring malformed config invalidation: {message['data']!r}")
+                    continue
+                if payload.get("origin") == _PROCESS_ID:
+                    continue
+                dispatch_invalidation(payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                log.error(f"Error in config invalidation listener: {exc}")
+                await asyncio.sleep(1)
+    finally:
+        try:
+            await pubsub.unsubscribe(CONFIG_INVALIDATION_CHANNEL)
+        except Exception:
+            pass
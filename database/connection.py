@@ -174,6 +174,12 @@ async def execute_query(query: str, *args, fetch_one: bool = False, fetch_all: b
             return await conn.execute(query, *args)
 
 
+async def execute_many(query: str, args: list) -> None:
+    """Execute a statement once per argument tuple in a single round trip."""
+    async with get_connection() as conn:
+        await conn.executemany(query, args)
+
+
 async def test_connection() -> bool:
     """Test the database connection."""
     try:
@@ -0,0 +1,20 @@
+-- Migration to add the ai_token_usage rollup table
+-- Run this script to add per-guild AI token accounting to existing databases
+
+-- Create daily token usage rollup table
+CREATE TABLE IF NOT EXISTS ai_token_usage (
+    guild_id BIGINT NOT NULL,
+    usage_date DATE NOT NULL,
+    model VARCHAR(255) NOT NULL,
+    requests INTEGER DEFAULT 0,
+    prompt_tokens BIGINT DEFAULT 0,
+    completion_tokens BIGINT DEFAULT 0,
+    cached_tokens BIGINT DEFAULT 0,
+    PRIMARY KEY (guild_id, usage_date, model)
+);
+
+-- Create indexes for better performance
+CREATE INDEX IF NOT EXISTS idx_ai_token_usage_date ON ai_token_usage(usage_date);
+
+COMMENT ON TABLE ai_token_usage IS 'Daily LLM token usage per guild and model';
+COMMENT ON COLUMN ai_token_usage.cached_tokens IS 'Prompt tokens served from the provider prompt cache';
@@ -5,7 +5,7 @@ type hints for better code organization.
 """
 
 from typing import Optional, Dict, Any
-from datetime import datetime
+from datetime import date, datetime
 from dataclasses import dataclass
 from enum import Enum
 
@@ -167,6 +167,19 @@ class AIDecision:
     decision_timestamp: Optional[datetime] = None
 
 
+@dataclass
+class AITokenUsage:
+    """Daily AI token usage rollup for a guild and model."""
+
+    guild_id: int = 0
+    usage_date: Optional[date] = None
+    model: str = ""
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+
+
 @dataclass
 class BlogPost:
     """Blog Post model."""
@@ -361,6 +374,18 @@ CREATE TABLE IF NOT EXISTS ai_decisions (
     decision_timestamp TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Daily AI token usage rollup per guild and model
+CREATE TABLE IF NOT EXISTS ai_token_usage (
+    guild_id BIGINT NOT NULL,
+    usage_date DATE NOT NULL,
+    model VARCHAR(255) NOT NULL,
+    requests INTEGER DEFAULT 0,
+    prompt_tokens BIGINT DEFAULT 0,
+    completion_tokens BIGINT DEFAULT 0,
+    cached_tokens BIGINT DEFAULT 0,
+    PRIMARY KEY (guild_id, usage_date, model)
+);
+
 -- Captcha configuration table
 CREATE TABLE IF NOT EXISTS captcha_config (
     guild_id BIGINT PRIMARY KEY,
@@ -443,6 +468,7 @@ CREATE INDEX IF NOT EXISTS idx_blog_posts_author_id ON blog_posts(author_id);
 CREATE INDEX IF NOT EXISTS idx_blog_posts_published ON blog_posts(published);
 CREATE INDEX IF NOT EXISTS idx_blog_posts_slug ON blog_posts(slug);
 CREATE INDEX IF NOT EXISTS idx_ai_decisions_guild_timestamp ON ai_decisions(guild_id, decision_timestamp);
+CREATE INDEX IF NOT EXISTS idx_ai_token_usage_date ON ai_token_usage(usage_date);
 """
 
 # Trigger creation SQL for automatic updated_at timestamps
@@ -3,17 +3,29 @@ Database operations for the Discord bot.
 This module provides high-level database operations that replace the JSON file operations.
 """
 
+import asyncio
+import copy
 import json
 import logging
+import time
 import uuid
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from typing import Any, Dict, List, Optional, Union
+from cachetools import TTLCache
 from cryptography.fernet import Fernet
 from os import getenv
 
-from .cache import delete_cache, get_cache, set_cache
+from .cache import (
+    delete_cache,
+    get_cache,
+    publish_config_invalidation,
+    register_invalidation_handler,
+    set_cache,
+)
 
 from .connection import (
+    execute_many,
     execute_query,
     insert_or_update,
     delete_record,
@@ -46,9 +58,116 @@ def decrypt_data(encrypted_data: str) -> str:
 
 # Guild Configuration Operations
 
+# In-process L1 cache of whole-guild config snapshots. Sits above the Redis
+# per-key cache so hot paths can read many keys without any network I/O.
+GUILD_CONFIG_CACHE_SIZE = int(getenv("GUILD_CONFIG_CACHE_SIZE", "5000"))
+GUILD_CONFIG_CACHE_TTL = float(getenv("GUILD_CONFIG_CACHE_TTL", "60"))
+
+_guild_config_snapshots: TTLCache = TTLCache(maxsize=GUILD_CONFIG_CACHE_SIZE, ttl=GUILD_CONFIG_CACHE_TTL)
+_snapshot_loads: Dict[int, "asyncio.Task[GuildConfigSnapshot]"] = {}
+
+
+@dataclass(frozen=True)
+class GuildConfigSnapshot:
+    """Immutable view of every guild_config row for a guild at load time."""
+
+    guild_id: int
+    values: Dict[str, Any] = field(default_factory=dict)
+    loaded_at: float = field(default_factory=time.monotonic)
+
+    def get(self, key: str, default=None):
+        """Return the value for ``key``; callers must not mutate the result."""
+        if key in self.values:
+            return self.values[key]
+        return default
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.values
+
+
+def _decode_config_value(value: Any) -> Any:
+    """Parse JSONB values that asyncpg hands back as strings."""
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except (json.JSONDecodeError, TypeError):
+            return value
+    return value
+
+
+async def _load_guild_config_snapshot(guild_id: int) -> GuildConfigSnapshot:
+    task = asyncio.current_task()
+    try:
+        results = await execute_query(
+            "SELECT key, value FROM guild_config WHERE guild_id = $1",
+            guild_id,
+            fetch_all=True,
+        )
+        values = {row["key"]: _decode_config_value(row["value"]) for row in results or []}
+        snapshot = GuildConfigSnapshot(guild_id=guild_id, values=values)
+        # A write may have invalidated this guild while the query was in flight.
+        if _snapshot_loads.get(guild_id) is task:
+            _guild_config_snapshots[guild_id] = snapshot
+        return snapshot
+    except Exception as e:
+        log.error(f"Failed to load guild config snapshot for guild {guild_id}: {e}")
+        return GuildConfigSnapshot(guild_id=guild_id)
+    finally:
+        if _snapshot_loads.get(guild_id) is task:
+            del _snapshot_loads[guild_id]
+
+
+async def get_guild_config_snapshot(guild_id: int) -> GuildConfigSnapshot:
+    """Get all configuration for a guild, served from the in-process cache when warm.
+
+    Concurrent cold lookups for the same guild share a single query. Failed loads
+    are not cached and yield an empty snapshot, so callers fall back to defaults.
+    """
+    snapshot = _guild_config_snapshots.get(guild_id)
+    if snapshot is not None:
+        return snapshot
+
+    load = _snapshot_loads.get(guild_id)
+    if load is None:
+        load = asyncio.ensure_future(_load_guild_config_snapshot(guild_id))
+        _snapshot_loads[guild_id] = load
+    return await asyncio.shield(load)
+
+
+def invalidate_guild_config_snapshot(guild_id: Optional[int] = None) -> None:
+    """Drop the cached snapshot for a guild, or for every guild when ``guild_id`` is None."""
+    if guild_id is None:
+        _guild_config_snapshots.clear()
+        _snapshot_loads.clear()
+        return
+    _guild_config_snapshots.pop(guild_id, None)
+    _snapshot_loads.pop(guild_id, None)
+
+
+def prime_guild_config_snapshot(guild_id: int, values: Dict[str, Any]) -> GuildConfigSnapshot:
+    """Install a snapshot for a guild without touching the database (used by offline replay)."""
+    snapshot = GuildConfigSnapshot(guild_id=guild_id, values=dict(values))
+    _guild_config_snapshots[guild_id] = snapshot
+    return snapshot
+
+
+def _on_config_invalidation(payload: Dict[str, Any]) -> None:
+    if payload.get("scope") == "guild_config":
+        invalidate_guild_config_snapshot(payload.get("guild_id"))
+
+
+register_invalidation_handler(_on_config_invalidation)
+
 
 async def get_guild_config(guild_id: int, key: str, default=None):
     """Get a guild configuration value."""
+    snapshot = _guild_config_snapshots.get(guild_id)
+    if snapshot is not None:
+        if key not in snapshot:
+            return default
+        # Callers commonly mutate returned lists/dicts before writing them back.
+        return copy.deepcopy(snapshot.get(key))
+
     cache_key = f"guild_config:{guild_id}:{key}"
     cached = await get_cache(cache_key)
     if cached is not None:
@@ -89,7 +208,9 @@ async def set_guild_config(guild_id: int, key: str, value: Any) -> bool:
         }
         success = await insert_or_update("guild_config", ["guild_id", "key"], data)
         if success:
+            invalidate_guild_config_snapshot(guild_id)
             await set_cache(f"guild_config:{guild_id}:{key}", value)
+            await publish_config_invalidation("guild_config", guild_id, key)
         return success
     except Exception as e:
         log.error(f"Failed to set guild config {key} for guild {guild_id}: {e}")
@@ -446,6 +567,7 @@ async def set_guild_setting(guild_id: int, key: str, value: Any) -> bool:
         success = await insert_or_update("guild_settings", ["guild_id", "key"], data)
         if success:
             await set_cache(f"guild_setting:{guild_id}:{key}", value)
+            await publish_config_invalidation("guild_settings", guild_id, key)
         return success
     except Exception as e:
         log.error(f"Failed to set guild setting {key} for guild {guild_id}: {e}")
@@ -539,6 +661,7 @@ async def set_botdetect_config(guild_id: int, key: str, value: Any) -> bool:
         success = await insert_or_update("botdetect_config", ["guild_id", "key"], data)
         if success:
             await set_cache(f"botdetect_config:{guild_id}:{key}", value)
+            await publish_config_invalidation("botdetect_config", guild_id, key)
         return success
     except Exception as e:
         log.error(f"Failed to set botdetect config {key} for guild {guild_id}: {e}")
@@ -653,6 +776,7 @@ async def set_guild_api_key(
         success = await insert_or_update("guild_api_keys", ["guild_id"], data)
         if success:
             await delete_cache(f"guild_api_key:{guild_id}")
+            await publish_config_invalidation("guild_api_key", guild_id)
         return success
     except Exception as e:
         log.error(f"Failed to set API key for guild {guild_id}: {e}")
@@ -712,6 +836,7 @@ async def remove_guild_api_key(guild_id: int) -> bool:
         success = await delete_record("guild_api_keys", "guild_id = $1", guild_id)
         if success:
             await delete_cache(f"guild_api_key:{guild_id}")
+            await publish_config_invalidation("guild_api_key", guild_id)
         return success
     except Exception as e:
         log.error(f"Failed to delete API key for guild {guild_id}: {e}")
@@ -756,6 +881,32 @@ async def add_ai_decision(
         return None
 
 
+async def get_ai_decisions_for_training(limit: int = 50000) -> List[Dict[str, Any]]:
+    """Retrieve recent AI decisions across all guilds that carry a violation verdict."""
+    try:
+        results = await execute_query(
+            """
+            SELECT message_content_snippet, decision
+            FROM ai_decisions
+            WHERE decision ? 'violation'
+            ORDER BY decision_timestamp DESC
+            LIMIT $1
+            """,
+            limit,
+            fetch_all=True,
+        )
+        return [
+            {
+                "message_content_snippet": row["message_content_snippet"],
+                "decision": json.loads(row["decision"]) if row["decision"] else {},
+            }
+            for row in results
+        ]
+    except Exception as e:
+        log.error(f"Failed to get AI decisions for training: {e}")
+        return []
+
+
 async def get_ai_decisions(guild_id: int, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
     """Retrieve AI decisions for a guild."""
     try:
@@ -794,6 +945,78 @@ async def get_ai_decisions(guild_id: int, limit: int = 20, offset: int = 0) -> L
         return []
 
 
+# AI Token Usage Operations
+
+
+async def add_token_usage(rows: List[Dict[str, Any]]) -> bool:
+    """Add usage counts to the daily per-guild, per-model token rollup."""
+    if not rows:
+        return True
+    try:
+        await execute_many(
+            """
+            INSERT INTO ai_token_usage (
+                guild_id, usage_date, model, requests, prompt_tokens, completion_tokens, cached_tokens
+            ) VALUES ($1, $2, $3, $4, $5, $6, $7)
+            ON CONFLICT (guild_id, usage_date, model) DO UPDATE SET
+                requests = ai_token_usage.requests + EXCLUDED.requests,
+                prompt_tokens = ai_token_usage.prompt_tokens + EXCLUDED.prompt_tokens,
+                completion_tokens = ai_token_usage.completion_tokens + EXCLUDED.completion_tokens,
+                cached_tokens = ai_token_usage.cached_tokens + EXCLUDED.cached_tokens
+            """,
+            [
+                (
+                    row["guild_id"],
+                    row["usage_date"],
+                    row["model"],
+                    row["requests"],
+                    row["prompt_tokens"],
+                    row["completion_tokens"],
+                    row["cached_tokens"],
+                )
+                for row in rows
+            ],
+        )
+        return True
+    except Exception as e:
+        log.error(f"Failed to add AI token usage: {e}")
+        return False
+
+
+async def get_token_usage(guild_id: int, days: int = 30) -> List[Dict[str, Any]]:
+    """Token usage per model for a guild over the last ``days`` days."""
+    try:
+        results = await execute_query(
+            """
+            SELECT model,
+                   SUM(requests) AS requests,
+                   SUM(prompt_tokens) AS prompt_tokens,
+                   SUM(completion_tokens) AS completion_tokens,
+                   SUM(cached_tokens) AS cached_tokens
+            FROM ai_token_usage
+            WHERE guild_id = $1 AND usage_date > CURRENT_DATE - $2::int
+            GROUP BY model
+            ORDER BY SUM(prompt_tokens) + SUM(completion_tokens) DESC
+            """,
+            guild_id,
+            days,
+            fetch_all=True,
+        )
+        return [
+            {
+                "model": row["model"],
+                "requests": int(row["requests"] or 0),
+                "prompt_tokens": int(row["prompt_tokens"] or 0),
+                "completion_tokens": int(row["completion_tokens"] or 0),
+                "cached_tokens": int(row["cached_tokens"] or 0),
+            }
+            for row in results
+        ]
+    except Exception as e:
+        log.error(f"Failed to get AI token usage for guild {guild_id}: {e}")
+        return []
+
+
 # Captcha Configuration Operations
 
 
@@ -831,6 +1054,7 @@ async def set_captcha_config(guild_id: int, config: CaptchaConfig) -> bool:
         success = await insert_or_update("captcha_config", ["guild_id"], data)
         if success:
             await set_cache(f"captcha_config:{guild_id}", config.__dict__)
+            await publish_config_invalidation("captcha_config", guild_id)
         return success
     except Exception as e:
         log.error(f"Failed to set captcha config for guild {guild_id}: {e}")
@@ -846,6 +1070,7 @@ async def update_captcha_config_field(guild_id: int, field: str, value: Any) ->
             guild_id,
         )
         await delete_cache(f"captcha_config:{guild_id}")
+        await publish_config_invalidation("captcha_config", guild_id, field)
         return True
     except Exception as e:
         log.error(f"Failed to update captcha config field {field} for guild {guild_id}: {e}")
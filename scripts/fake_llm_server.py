@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+OpenAI-compatible stand-in LLM server for load tests and offline replay.
+
+Serves ``POST /v1/chat/completions`` with moderation decisions in the JSON
+shape the bot expects. Single-message and batched prompts are both handled.
+Latency follows a configurable distribution, and a configurable share of
+requests fail with 500 or 429, so the pipeline's queueing, breakers and
+fallbacks can be exercised without a real provider. ``"stream": true``
+requests get server-sent event chunks spaced ``chunk_interval`` apart.
+
+Latency specs: ``fixed:0.2``, ``uniform:0.1,0.5``, ``lognormal:0.4,0.5``
+(median seconds, sigma) or ``exponential:0.3`` (mean seconds).
+
+Used by scripts/simulate_load.py and the tests. Run it on its own to serve
+scripts/replay_moderation.py --api-base http://127.0.0.1:8001/v1
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from aiohttp import web
+
+DEFAULT_TRIGGERS = ("free nitro", "scam", "nsfw")
+
+_BATCH_SECTION_RE = re.compile(r"### Message \d+ \(message_id: (\d+)\)")
+
+
+def parse_latency(spec: str, rng: random.Random) -> Callable[[], float]:
+    """Return a sampler for a latency spec such as ``lognormal:0.4,0.5``."""
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda: rng.lognormvariate(math.log(median), sigma)
+    if kind == "exponential":
+        return lambda: rng.expovariate(1 / values[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class FakeLLMServer:
+    """In-process aiohttp server imitating an OpenAI-compatible chat completions API.
+
+    Args:
+        latency: Latency distribution spec.
+        error_rate: Share of requests answered with HTTP 500.
+        rate_limit_rate: Share of requests answered with HTTP 429.
+        violation_rate: Share of messages randomly judged violations.
+        chunk_interval: Seconds between streamed chunks.
+        chunk_size: Characters per streamed chunk.
+        triggers: Phrases that always produce a violation.
+        seed: Seed for reproducible runs.
+    """
+
+    def __init__(
+        self,
+        latency: str = "lognormal:0.4,0.5",
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        violation_rate: float = 0.0,
+        chunk_interval: float = 0.0,
+        chunk_size: int = 8,
+        triggers: Sequence[str] = DEFAULT_TRIGGERS,
+        seed: Optional[int] = None,
+    ):
+        self._rng = random.Random(seed)
+        self.latency_spec = latency
+        self._sample_latency = parse_latency(latency, self._rng)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.violation_rate = violation_rate
+        self.chunk_interval = chunk_interval
+        self.chunk_size = max(1, chunk_size)
+        self.triggers = tuple(trigger.lower() for trigger in triggers)
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url: Optional[str] = None
+
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle_chat_completion)
+        app.router.add_post("/chat/completions", self.handle_chat_completion)
+        app.router.add_get("/v1/models", self.handle_models)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving and return the base URL (``port=0`` picks a free port)."""
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{bound_port}/v1"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _judge(self, text: str) -> Dict[str, Any]:
+        lowered = text.lower()
+        violation = any(trigger in lowered for trigger in self.triggers) or self._rng.random() < self.violation_rate
+        # Verdict first and reasoning last, as the streaming prompt asks for
+        return {
+            "violation": violation,
+            "rule_violated": "2" if violation else "None",
+            "action": "DELETE" if violation else "IGNORE",
+            "reasoning": "Simulated decision from the fake LLM server.",
+        }
+
+    def decide(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Build the decision payload for a single or batched moderation prompt."""
+        user_text = ""
+        for message in messages:
+            if message.get("role") == "user":
+                content = message.get("content")
+                user_text = content if isinstance(content, str) else json.dumps(content)
+
+        sections = _BATCH_SECTION_RE.split(user_text)
+        if len(sections) > 1:
+            # sections = [preamble, id1, body1, id2, body2, ...]
+            decisions = []
+            for message_id, body in zip(sections[1::2], sections[2::2]):
+                decisions.append({"message_id": message_id, **self._judge(body)})
+            return {"decisions": decisions}
+        return self._judge(user_text)
+
+    async def handle_models(self, request: web.Request) -> web.Response:
+        return web.json_response({"object": "list", "data": [{"id": "fake-moderation", "object": "model"}]})
+
+    async def handle_chat_completion(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(max(0.0, self._sample_latency()))
+            roll = self._rng.random()
+            if roll < self.error_rate:
+                self.errors += 1
+                return web.json_response({"error": {"message": "Simulated server error"}}, status=500)
+            if roll < self.error_rate + self.rate_limit_rate:
+                self.rate_limited += 1
+                return web.json_response(
+                    {"error": {"message": "Simulated rate limit"}}, status=429, headers={"Retry-After": "1"}
+                )
+
+            messages = body.get("messages", [])
+            content = json.dumps(self.decide(messages))
+            prompt_tokens = sum(len(json.dumps(message.get("content", ""))) for message in messages) // 4
+            completion_tokens = len(content) // 4
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            }
+            if body.get("stream"):
+                return await self._stream_completion(request, body, content, usage)
+            return web.json_response(
+                {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "fake-moderation"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": usage,
+                }
+            )
+        finally:
+            self.in_flight -= 1
+
+    async def _stream_completion(
+        self, request: web.Request, body: Dict[str, Any], content: str, usage: Dict[str, int]
+    ) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        async def send(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> None:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body.get("model", "fake-moderation"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+
+        await send({"role": "assistant", "content": ""})
+        for start in range(0, len(content), self.chunk_size):
+            if start and self.chunk_interval:
+                await asyncio.sleep(self.chunk_interval)
+            await send({"content": content[start : start + self.chunk_size]})
+        await send({}, finish_reason="stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            usage_chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body.get("model", "fake-moderation"),
+                "choices": [],
+                "usage": usage,
+            }
+            await response.write(f"data: {json.dumps(usage_chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve fake moderation decisions over the OpenAI chat API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", default="lognormal:0.4,0.5", help="fixed:S | uniform:A,B | lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with HTTP 429")
+    parser.add_argument("--violation-rate", type=float, default=0.0, help="Share of messages randomly flagged")
+    parser.add_argument("--chunk-interval", type=float, default=0.0, help="Seconds between streamed chunks")
+    parser.add_argument("--seed", type=int)
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    server = FakeLLMServer(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        violation_rate=args.violation_rate,
+        chunk_interval=args.chunk_interval,
+        seed=args.seed,
+    )
+    base_url = await server.start(args.host, args.port)
+    print(f"Fake LLM server listening on {base_url} (latency {args.latency}). Press Ctrl+C to stop.")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(f"Stats: {server.stats()}")
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Replay stored or corpus messages through the moderation pipeline and report
+throughput, latency percentiles, token usage and decision diffs.
+
+Examples:
+    # Against a local OpenAI-compatible stand-in server
+    python scripts/replay_moderation.py --jsonl corpus.jsonl --api-base http://127.0.0.1:8001/v1
+
+    # Shadow-evaluate a new model on a guild's logged decisions
+    python scripts/replay_moderation.py --guild-id 123 --limit 200 --model openrouter/google/gemini-2.5-flash
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay messages through the AI moderation pipeline.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--jsonl", help="JSONL corpus of messages to replay")
+    source.add_argument("--guild-id", type=int, help="Replay this guild's logged ai_decisions rows")
+    parser.add_argument("--limit", type=int, default=500, help="Rows to load with --guild-id")
+    parser.add_argument("--concurrency", type=int, default=8, help="Cases replayed at once")
+    parser.add_argument("--model", help="Model to evaluate (default: openai/replay-model with --api-base)")
+    parser.add_argument("--api-base", help="OpenAI-compatible base URL, e.g. a local stand-in server")
+    parser.add_argument("--rules-file", help="Rules text used for cases without their own rules")
+    parser.add_argument("--batching", action="store_true", help="Route cases through the micro-batcher")
+    parser.add_argument("--output", help="Write per-case results to this JSONL file")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    from dotenv import load_dotenv
+
+    load_dotenv(".env")
+    if args.api_base:
+        # The stand-in server ignores the key, but the client refuses to start without one.
+        os.environ.setdefault("SLIPSTREAM_OPENROUTER_KEY", "replay")
+
+    import litellm
+
+    from cogs.aimod_helpers.replay import DEFAULT_RULES, ReplayHarness, load_ai_decisions, load_jsonl, write_results
+    from cogs.core_ai_cog import CoreAICog
+    from database.connection import close_pool, initialize_database
+
+    if args.api_base:
+        litellm.api_base = args.api_base
+    model = args.model or ("openai/replay-model" if args.api_base else None)
+    if not model:
+        print("❌ Pass --model, or --api-base to use the stand-in server.")
+        sys.exit(1)
+
+    if args.jsonl:
+        cases = load_jsonl(args.jsonl)
+    else:
+        if not await initialize_database():
+            print("Failed to initialize database connection")
+            sys.exit(1)
+        try:
+            cases = await load_ai_decisions(args.guild_id, limit=args.limit)
+        finally:
+            await close_pool()
+    if not cases:
+        print("No cases to replay.")
+        return
+
+    rules = DEFAULT_RULES
+    if args.rules_file:
+        with open(args.rules_file, "r", encoding="utf-8") as f:
+            rules = f.read()
+
+    cog = CoreAICog(bot=None)
+    if cog.genai_client is None:
+        print("❌ LiteLLM client is not available; set SLIPSTREAM_OPENROUTER_KEY or --api-base.")
+        sys.exit(1)
+    harness = ReplayHarness(cog, model=model, concurrency=args.concurrency, default_rules=rules, batching=args.batching)
+    print(f"Replaying {len(cases)} cases against {model} with concurrency {args.concurrency}...")
+    report = await harness.run(cases)
+    if cog.batcher:
+        await cog.batcher.close()
+    print(report.format())
+    if args.output:
+        write_results(report, args.output)
+        print(f"Wrote per-case results to {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
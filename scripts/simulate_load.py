@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Load-test the bot without Discord or a real LLM provider.
+
+Starts the real MyBot with every cog loaded, never connects it to the gateway,
+and feeds synthetic gateway payloads (MESSAGE_CREATE, MESSAGE_UPDATE,
+GUILD_MEMBER_ADD) through discord.py's own parsers at a target rate. REST calls
+go to an in-memory stand-in, and AI moderation goes to the fake LLM server.
+The report covers achieved events/sec, moderation throughput, end-to-end
+latency from dispatch to finished analysis, moderation queue wait and event
+loop lag.
+
+Database and Redis are used when configured, exactly as in production.
+Without them the cogs take their failure paths, so run against a disposable
+database for realistic numbers. ENCRYPTION_KEY is read from the environment or
+.env; without one, a throwaway key is generated for the run.
+
+Example:
+    python scripts/simulate_load.py --rate 200 --duration 60 --llm-latency lognormal:0.4,0.5
+"""
+
+import argparse
+import asyncio
+import collections
+import itertools
+import os
+import random
+import sys
+import time
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(".env")
+# The fake LLM server ignores the key, but the client refuses to start without one.
+os.environ.setdefault("SLIPSTREAM_OPENROUTER_KEY", "loadtest")
+if "ENCRYPTION_KEY" not in os.environ:
+    # database.operations refuses to import without a key. A throwaway one is fine
+    # unless the run reads encrypted values (e.g. guild API keys) stored with the real key.
+    from cryptography.fernet import Fernet  # noqa: E402
+
+    os.environ["ENCRYPTION_KEY"] = Fernet.generate_key().decode()
+
+import discord  # noqa: E402
+import litellm  # noqa: E402
+
+import bot as bot_module  # noqa: E402
+from cogs.aimod_helpers.replay import DEFAULT_RULES, percentile  # noqa: E402
+from database.connection import close_pool, initialize_database  # noqa: E402
+from database.operations import prime_guild_config_snapshot  # noqa: E402
+from scripts.fake_llm_server import FakeLLMServer  # noqa: E402
+
+TIMESTAMP = "2024-01-01T00:00:00+00:00"
+SAMPLE_MESSAGES = [
+    "hey everyone, how's it going?",
+    "anyone want to play later tonight",
+    "lol that clip was hilarious",
+    "can someone help me with my code",
+    "good morning!",
+    "free nitro here, click the link",
+    "check out this scam site for free robux",
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Synthesize Discord events into the bot at a target rate.")
+    parser.add_argument("--rate", type=float, default=50, help="Target events per second")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to generate events for")
+    parser.add_argument("--guilds", type=int, default=5)
+    parser.add_argument("--channels", type=int, default=3, help="Channels per guild")
+    parser.add_argument("--members", type=int, default=200, help="Members per guild")
+    parser.add_argument("--edit-share", type=float, default=0.05, help="Share of events that are message edits")
+    parser.add_argument("--join-share", type=float, default=0.02, help="Share of events that are member joins")
+    parser.add_argument("--api-base", help="Use an already running OpenAI-compatible server instead of starting one")
+    parser.add_argument("--llm-latency", default="lognormal:0.4,0.5")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--llm-chunk-interval", type=float, default=0.0, help="Seconds between streamed chunks (AI_STREAMING_ENABLED)"
+    )
+    parser.add_argument("--rest-latency", type=float, default=0.05, help="Seconds per simulated Discord REST call")
+    parser.add_argument(
+        "--drain-timeout", type=float, default=60, help="Seconds to wait for queued work after generation"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+class FakeDiscordHTTP:
+    """Answers Discord REST calls in memory with a fixed latency and counts them."""
+
+    def __init__(self, simulator: "EventSimulator", latency: float):
+        self.simulator = simulator
+        self.latency = latency
+        self.calls: collections.Counter = collections.Counter()
+
+    async def request(self, route, *, files=None, form=None, **kwargs):
+        self.calls[f"{route.method} {route.path}"] += 1
+        await asyncio.sleep(self.latency)
+        if route.path == "/channels/{channel_id}/messages":
+            if route.method == "GET":
+                return []
+            payload = kwargs.get("json") or {}
+            return self.simulator.message_payload(
+                int(route.channel_id), self.simulator.bot_user, payload.get("content") or ""
+            )
+        if route.path == "/channels/{channel_id}/messages/{message_id}" and route.method == "GET":
+            return self.simulator.message_payload(int(route.channel_id), self.simulator.random_user(), "")
+        if route.path == "/users/@me/channels":
+            return {"id": str(self.simulator.next_id()), "type": 1, "recipients": [self.simulator.random_user()]}
+        return {}
+
+
+class EventSimulator:
+    """Builds synthetic guilds in the bot's connection state and emits gateway events into it."""
+
+    def __init__(self, bot, guilds: int, channels: int, members: int, seed: int):
+        self.bot = bot
+        self.state = bot._connection
+        self.rng = random.Random(seed)
+        self._ids = itertools.count(10**17)
+        self.guild_ids = []
+        self.channels = {}  # guild_id -> [channel_id]
+        self.users = {}  # guild_id -> [user payload]
+        self.recent_messages = collections.deque(maxlen=1000)
+        self.dispatched_at = {}  # message_id -> perf_counter
+        self.counts = collections.Counter()
+        self.bot_user = {
+            "id": str(self.next_id()),
+            "username": "openguard",
+            "discriminator": "0",
+            "avatar": None,
+            "bot": True,
+        }
+        self._guild_count, self._channel_count, self._member_count = guilds, channels, members
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def random_user(self, guild_id=None) -> dict:
+        guild_id = guild_id or self.rng.choice(self.guild_ids)
+        return self.rng.choice(self.users[guild_id])
+
+    def _user_payload(self) -> dict:
+        user_id = self.next_id()
+        return {"id": str(user_id), "username": f"user{user_id % 100000}", "discriminator": "0", "avatar": None}
+
+    def setup(self, model: str) -> None:
+        self.state.user = discord.ClientUser(state=self.state, data=self.bot_user)
+        for _ in range(self._guild_count):
+            guild_id = self.next_id()
+            channel_ids = [self.next_id() for _ in range(self._channel_count)]
+            users = [self._user_payload() for _ in range(self._member_count)]
+            self.state._add_guild_from_data(
+                {
+                    "id": str(guild_id),
+                    "name": f"Load Test {len(self.guild_ids) + 1}",
+                    "owner_id": users[0]["id"],
+                    "member_count": len(users),
+                    "roles": [{"id": str(guild_id), "name": "@everyone", "permissions": "0", "position": 0}],
+                    "channels": [
+                        {"id": str(channel_id), "type": 0, "name": f"chat-{index}", "position": index}
+                        for index, channel_id in enumerate(channel_ids)
+                    ],
+                    "members": [{"user": user, "roles": [], "joined_at": TIMESTAMP, "flags": 0} for user in users],
+                    "emojis": [],
+                    "stickers": [],
+                    "features": [],
+                    "preferred_locale": "en-US",
+                }
+            )
+            self.guild_ids.append(guild_id)
+            self.channels[guild_id] = channel_ids
+            self.users[guild_id] = users
+        self.model = model
+        self.prime_configs()
+
+    def prime_configs(self) -> None:
+        """Give every synthetic guild rules and the fake model (snapshots expire, so call periodically)."""
+        for guild_id in self.guild_ids:
+            prime_guild_config_snapshot(guild_id, {"AI_MODEL": self.model, "SERVER_RULES": DEFAULT_RULES})
+
+    def message_payload(self, channel_id: int, author: dict, content: str) -> dict:
+        guild_id = next(gid for gid, channel_ids in self.channels.items() if channel_id in channel_ids)
+        return {
+            "id": str(self.next_id()),
+            "channel_id": str(channel_id),
+            "guild_id": str(guild_id),
+            "author": author,
+            "member": {"roles": [], "joined_at": TIMESTAMP, "deaf": False, "mute": False, "flags": 0},
+            "content": content,
+            "timestamp": TIMESTAMP,
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": [],
+            "pinned": False,
+            "type": 0,
+        }
+
+    def emit_message(self) -> None:
+        guild_id = self.rng.choice(self.guild_ids)
+        channel_id = self.rng.choice(self.channels[guild_id])
+        data = self.message_payload(channel_id, self.random_user(guild_id), self.rng.choice(SAMPLE_MESSAGES))
+        self.dispatched_at[int(data["id"])] = time.perf_counter()
+        self.recent_messages.append(data)
+        self.state.parse_message_create(data)
+        self.counts["message"] += 1
+
+    def emit_edit(self) -> None:
+        if not self.recent_messages:
+            return self.emit_message()
+        data = dict(self.rng.choice(self.recent_messages))
+        data["content"] = data["content"] + " (edited)"
+        data["edited_timestamp"] = TIMESTAMP
+        self.state.parse_message_update(data)
+        self.counts["edit"] += 1
+
+    def emit_join(self) -> None:
+        guild_id = self.rng.choice(self.guild_ids)
+        user = self._user_payload()
+        self.users[guild_id].append(user)
+        self.state.parse_guild_member_add(
+            {
+                "user": user,
+                "roles": [],
+                "joined_at": TIMESTAMP,
+                "guild_id": str(guild_id),
+                "deaf": False,
+                "mute": False,
+                "flags": 0,
+            }
+        )
+        self.counts["join"] += 1
+
+    async def run(self, rate: float, duration: float, edit_share: float, join_share: float) -> float:
+        """Emit events at ``rate`` per second for ``duration`` seconds; return the actual elapsed time."""
+        interval = 1 / rate
+        start = time.perf_counter()
+        emitted = 0
+        while True:
+            elapsed = time.perf_counter() - start
+            if elapsed >= duration:
+                return elapsed
+            # Catch up on every event that is due, then yield to the bot.
+            due = int(elapsed / interval) + 1
+            while emitted < due:
+                roll = self.rng.random()
+                if roll < join_share:
+                    self.emit_join()
+                elif roll < join_share + edit_share:
+                    self.emit_edit()
+                else:
+                    self.emit_message()
+                emitted += 1
+            await asyncio.sleep(max(0.0, start + due * interval - time.perf_counter()))
+
+
+async def monitor_loop_lag(samples: list, interval: float = 0.05) -> None:
+    """Record how late the event loop wakes up, a direct measure of scheduling delay."""
+    while True:
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+
+async def reprime_configs(simulator: EventSimulator) -> None:
+    while True:
+        await asyncio.sleep(30)
+        simulator.prime_configs()
+
+
+def track_analysis(cog, simulator: EventSimulator, latencies: list) -> None:
+    """Record dispatch-to-decision latency for every message the AI cog finishes analyzing."""
+    analyze_message = cog.analyze_message
+
+    async def timed_analyze_message(message, *args, **kwargs):
+        try:
+            return await analyze_message(message, *args, **kwargs)
+        finally:
+            dispatched = simulator.dispatched_at.pop(message.id, None)
+            if dispatched is not None:
+                latencies.append(time.perf_counter() - dispatched)
+
+    cog.analyze_message = timed_analyze_message
+
+
+async def main():
+    args = parse_args()
+    bot = bot_module.bot
+
+    fake_llm = None
+    api_base = args.api_base
+    if not api_base:
+        fake_llm = FakeLLMServer(
+            latency=args.llm_latency,
+            error_rate=args.llm_error_rate,
+            chunk_interval=args.llm_chunk_interval,
+            seed=args.seed,
+        )
+        api_base = await fake_llm.start()
+    litellm.api_base = api_base
+
+    if not await initialize_database():
+        print("⚠️ Database unavailable; cogs will exercise their database failure paths.")
+
+    lag_samples, e2e_latencies = [], []
+    try:
+        async with bot:
+            simulator = EventSimulator(bot, args.guilds, args.channels, args.members, args.seed)
+            fake_http = FakeDiscordHTTP(simulator, args.rest_latency)
+            bot.http.request = fake_http.request
+            await bot_module.load_cogs()
+            simulator.setup(model="openai/fake-moderation")
+
+            core_ai = bot.get_cog("Core AI")
+            if core_ai is not None:
+                track_analysis(core_ai, simulator, e2e_latencies)
+
+            background = [
+                asyncio.create_task(monitor_loop_lag(lag_samples)),
+                asyncio.create_task(reprime_configs(simulator)),
+            ]
+            print(f"Generating {args.rate:.0f} events/s for {args.duration:.0f}s against {api_base}...")
+            elapsed = await simulator.run(args.rate, args.duration, args.edit_share, args.join_share)
+            generated = sum(simulator.counts.values())
+
+            drain_start = time.perf_counter()
+            queue = core_ai.moderation_queue if core_ai is not None else None
+            while queue is not None and time.perf_counter() - drain_start < args.drain_timeout:
+                if queue.stats()["depth"] == 0 and queue.active() == 0:
+                    break
+                await asyncio.sleep(0.1)
+            total_time = elapsed + time.perf_counter() - drain_start
+
+            for task in background:
+                task.cancel()
+
+            print("\n=== Load test results ===")
+            print(f"Events: {generated} in {elapsed:.1f}s -> {generated / elapsed:.1f}/s (target {args.rate:.0f}/s)")
+            print(f"  by type: {dict(simulator.counts)}")
+            if e2e_latencies:
+                print(
+                    f"Moderation: {len(e2e_latencies)} analyses in {total_time:.1f}s -> "
+                    f"{len(e2e_latencies) / total_time:.1f}/s"
+                )
+                print(
+                    "End-to-end (dispatch -> decision): "
+                    f"p50 {percentile(e2e_latencies, 50) * 1000:.0f} ms | "
+                    f"p95 {percentile(e2e_latencies, 95) * 1000:.0f} ms | "
+                    f"p99 {percentile(e2e_latencies, 99) * 1000:.0f} ms"
+                )
+            if queue is not None:
+                stats = queue.stats()
+                print(
+                    f"Moderation queue: avg wait {stats['avg_wait'] * 1000:.0f} ms | max wait "
+                    f"{stats['max_wait'] * 1000:.0f} ms | shed {stats['shed']} | left {stats['depth']}"
+                )
+            if lag_samples:
+                print(
+                    f"Event loop lag: p50 {percentile(lag_samples, 50) * 1000:.1f} ms | "
+                    f"p99 {percentile(lag_samples, 99) * 1000:.1f} ms | max {max(lag_samples) * 1000:.1f} ms"
+                )
+            if fake_llm is not None:
+                print(f"Fake LLM: {fake_llm.stats()}")
+            print(f"Discord REST calls: {sum(fake_http.calls.values())} {dict(fake_http.calls.most_common(5))}")
+    finally:
+        if fake_llm is not None:
+            await fake_llm.stop()
+        await close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Train the local pre-classifier from logged AI moderation decisions.
+
+Reads verdicts from the ai_decisions table, holds out 20% to report how many
+messages would skip the LLM at the configured threshold and how many real
+violations would be missed, then trains on everything and saves the model to
+AI_PRECLASSIFIER_PATH for the bot to load on startup.
+"""
+
+import asyncio
+import os
+import random
+import sys
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv(".env")
+
+from database.connection import close_pool, initialize_database  # noqa: E402
+from database.operations import get_ai_decisions_for_training  # noqa: E402
+from cogs.aimod_helpers.pre_classifier import DEFAULT_MODEL_PATH, HashedNGramClassifier, training_examples  # noqa: E402
+
+
+def report_holdout(texts, labels, threshold: float) -> None:
+    """Train on 80% and print skip and miss rates on the remaining 20%."""
+    pairs = list(zip(texts, labels))
+    random.Random(0).shuffle(pairs)
+    split = int(len(pairs) * 0.8)
+    train, holdout = pairs[:split], pairs[split:]
+    if not holdout:
+        return
+
+    classifier = HashedNGramClassifier().fit([t for t, _ in train], [label for _, label in train])
+    scores = [(classifier.predict_proba(text), label) for text, label in holdout]
+    skipped = [label for score, label in scores if score < threshold]
+    violations = sum(1 for _, label in holdout if label)
+    missed = sum(1 for label in skipped if label)
+
+    print(f"Holdout: {len(holdout)} messages, {violations} violations")
+    print(f"Would skip LLM: {len(skipped)} ({len(skipped) / len(holdout):.1%})")
+    if violations:
+        print(f"Violations missed: {missed} ({missed / violations:.1%} of violations)")
+
+
+async def train_preclassifier() -> bool:
+    """Train and save the pre-classifier."""
+    print("Loading AI decisions...")
+    success = await initialize_database()
+    if not success:
+        print("Failed to initialize database connection")
+        return False
+
+    try:
+        limit = int(os.getenv("AI_PRECLASSIFIER_TRAINING_LIMIT", "50000"))
+        texts, labels = training_examples(await get_ai_decisions_for_training(limit))
+    finally:
+        await close_pool()
+
+    if not texts or all(labels) or not any(labels):
+        print("❌ Need logged decisions with both violations and non-violations to train.")
+        return False
+
+    threshold = float(os.getenv("AI_PRECLASSIFIER_THRESHOLD", "0.05"))
+    print(f"Training on {len(texts)} decisions ({sum(labels)} violations)...")
+    report_holdout(texts, labels, threshold)
+
+    path = os.getenv("AI_PRECLASSIFIER_PATH", DEFAULT_MODEL_PATH)
+    HashedNGramClassifier().fit(texts, labels).save(path)
+    print(f"✅ Saved pre-classifier to {path}")
+    return True
+
+
+async def main():
+    """Run the training."""
+    success = await train_preclassifier()
+    if not success:
+        print("💥 Training failed!")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from cogs.aimod_helpers.batcher import MicroBatcher
+
+
+@pytest.mark.asyncio
+async def test_items_with_same_key_share_one_flush():
+    calls = []
+
+    async def flush(key, items):
+        calls.append((key, list(items)))
+        return [item * 10 for item in items]
+
+    batcher = MicroBatcher(flush, window=0.02, max_size=10)
+    results = await asyncio.gather(
+        batcher.submit("a", 1),
+        batcher.submit("a", 2),
+        batcher.submit("b", 3),
+    )
+
+    assert results == [10, 20, 30]
+    assert sorted(calls) == [("a", [1, 2]), ("b", [3])]
+    assert batcher.stats()["batches"] == 2
+
+
+@pytest.mark.asyncio
+async def test_full_batch_flushes_without_waiting_for_window():
+    async def flush(key, items):
+        return items
+
+    batcher = MicroBatcher(flush, window=10, max_size=2)
+    results = await asyncio.wait_for(asyncio.gather(batcher.submit("k", 1), batcher.submit("k", 2)), timeout=1)
+
+    assert results == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_flush_errors_propagate_to_every_caller():
+    async def flush(key, items):
+        raise RuntimeError("provider down")
+
+    batcher = MicroBatcher(flush, window=0.01, max_size=5)
+    results = await asyncio.gather(batcher.submit("k", 1), batcher.submit("k", 2), return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_missing_results_resolve_to_none():
+    async def flush(key, items):
+        return items[:1]
+
+    batcher = MicroBatcher(flush, window=0.01, max_size=5)
+    results = await asyncio.gather(batcher.submit("k", "x"), batcher.submit("k", "y"))
+
+    assert results == ["x", None]
@@ -0,0 +1,105 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from cogs import botdetect
+from cogs.botdetect import BotDetectCog
+from cogs.botdetect_helpers.detector import BotDetector, BotDetectorCache
+
+
+def member(member_id, role_ids=()):
+    return SimpleNamespace(id=member_id, bot=False, roles=[SimpleNamespace(id=role_id) for role_id in role_ids])
+
+
+def test_detector_matches_keywords_and_whitelists():
+    detector = BotDetector(
+        {
+            "enabled": True,
+            "keywords": ["free nitro", "Claim Now", "", "nitro", "free nitro"],
+            "whitelist_users": [1],
+            "whitelist_roles": ["7"],
+            "action": "kick",
+        }
+    )
+
+    assert detector.detect("Get FREE NITRO, claim now") == ["free nitro", "claim now", "nitro"]
+    assert detector.detect("hello there") == []
+    assert detector.detect("") == []
+    assert detector.is_whitelisted(member(1))
+    assert detector.is_whitelisted(member(2, [5, 7]))
+    assert not detector.is_whitelisted(member(2, [5]))
+    assert detector.action_config == {"action": "kick", "timeout_duration": None, "log_channel": None}
+
+
+def test_detector_drops_legacy_link_keywords():
+    stored = ["free nitro", "bit.ly", "tinyurl", "steamcommunity", "steampowered", "steamcommunlty", "discord-nitro"]
+
+    scanning = BotDetector({"enabled": True, "keywords": stored})
+    assert scanning.keywords == ("free nitro",)
+    assert scanning.detect("trade at https://steamcommunity.com/id/me or bit.ly/x") == []
+
+    # Without the link scanner the lookalikes are still worth matching as text
+    not_scanning = BotDetector({"enabled": True, "scan_links": False, "keywords": stored})
+    assert not_scanning.keywords == ("free nitro", "steamcommunlty", "discord-nitro")
+
+
+@pytest.mark.asyncio
+async def test_cache_shares_loads_and_rebuilds_after_invalidation():
+    loaded = asyncio.Event()
+
+    async def load(guild_id):
+        await loaded.wait()
+        return {"enabled": True, "keywords": ["scam"]}
+
+    loader = AsyncMock(side_effect=load)
+    cache = BotDetectorCache(loader)
+
+    pending = [asyncio.ensure_future(cache.get(1)) for _ in range(3)]
+    await asyncio.sleep(0)
+    loaded.set()
+    first, *rest = await asyncio.gather(*pending)
+    assert all(detector is first for detector in rest)
+    assert await cache.get(1) is first
+    assert loader.await_count == 1
+
+    cache.on_config_invalidation({"scope": "guild_config", "guild_id": 1, "key": "keywords"})
+    assert await cache.get(1) is first
+    cache.on_config_invalidation({"scope": "botdetect_config", "guild_id": 1, "key": "keywords"})
+    assert await cache.get(1) is not first
+    assert loader.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_missing_keys_fall_back_to_defaults_without_writes():
+    with (
+        patch.object(botdetect, "get_all_botdetect_config", AsyncMock(return_value={"enabled": True})),
+        patch.object(botdetect, "set_botdetect_config", AsyncMock()) as set_config,
+    ):
+        config = await botdetect.get_guild_botdetect_config(1)
+
+    assert config["enabled"] is True
+    assert config["keywords"] == botdetect.DEFAULT_SCAM_KEYWORDS
+    assert config["keywords"] is not botdetect.DEFAULT_SCAM_KEYWORDS
+    set_config.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_on_message_reads_config_once_per_guild():
+    config = {"enabled": True, "keywords": ["free nitro"], "action": "delete", "whitelist_users": [9]}
+    with patch.object(botdetect, "get_all_botdetect_config", AsyncMock(return_value=config)) as get_config:
+        cog = BotDetectCog(MagicMock())
+        cog._handle_bot_detection = AsyncMock()
+        try:
+            for author_id, content in [(2, "hi"), (2, "FREE NITRO here"), (9, "free nitro")]:
+                message = SimpleNamespace(author=member(author_id), guild=SimpleNamespace(id=1), content=content)
+                await cog.on_message(message)
+        finally:
+            cog.cog_unload()
+
+    assert get_config.await_count == 1
+    cog._handle_bot_detection.assert_awaited_once()
+    _, keywords, action_config = cog._handle_bot_detection.await_args.args
+    assert keywords == ["free nitro"]
+    assert action_config["action"] == "delete"
@@ -0,0 +1,247 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import litellm
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from cogs.aimod_helpers.decision_cache import DecisionCache
+from cogs.aimod_helpers.litellm_config import CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, LiteLLMClient
+from cogs.aimod_helpers.media_hash_index import MediaHashIndex
+from cogs.aimod_helpers.media_processor import MediaPart
+from cogs.aimod_helpers.stage_timer import StageTimings
+from cogs.core_ai_cog import NO_INFRACTIONS_TEXT, CoreAICog
+
+
+@pytest.fixture
+def cog():
+    with patch("cogs.core_ai_cog.get_litellm_client", side_effect=ValueError("no key")):
+        return CoreAICog(MagicMock())
+
+
+def make_message(delay):
+    message = MagicMock()
+    message.id = 10
+    message.guild.id = 1
+    message.reference.message_id = 9
+
+    async def fetch_message(message_id):
+        await asyncio.sleep(delay)
+        replied = MagicMock()
+        replied.author.display_name = "alice"
+        replied.content = "original"
+        return replied
+
+    async def history(limit, before):
+        await asyncio.sleep(delay)
+        for hist_id, name in ((8, "bob"), (7, "carol")):
+            hist = MagicMock()
+            hist.id = hist_id
+            hist.author.bot = False
+            hist.author.display_name = name
+            hist.content = f"hi from {name}"
+            yield hist
+
+    message.channel.fetch_message = fetch_message
+    message.channel.history = history
+    return message
+
+
+@pytest.mark.asyncio
+async def test_gather_context_runs_lookups_concurrently(cog):
+    delay = 0.05
+
+    async def slow_api_key(guild_id):
+        await asyncio.sleep(delay)
+        return None
+
+    timings = StageTimings()
+    start = time.perf_counter()
+    with patch("cogs.core_ai_cog.get_guild_api_key", new=slow_api_key):
+        api_key, auth_info, replied, history = await cog._gather_context(make_message(delay), timings)
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < delay * 2.5
+    assert set(timings.stages) == {"api_key", "reply", "history"}
+    assert replied == "Replied-to Message: alice: original"
+    assert history == "bob: hi from bob\ncarol: hi from carol"
+    assert api_key is None and auth_info is None
+
+
+@pytest.mark.asyncio
+async def test_resolve_api_credentials_for_copilot(cog):
+    key = MagicMock(api_provider="github_copilot", github_auth_info={"token": "t"}, api_key=None)
+    with patch("cogs.core_ai_cog.get_guild_api_key", new=AsyncMock(return_value=key)):
+        assert await cog._resolve_api_credentials(1) == (None, {"token": "t"})
+
+
+@pytest.mark.asyncio
+async def test_recent_history_served_from_buffer_after_seed(cog):
+    message = make_message(0)
+    message.reference = None
+    first = await cog._fetch_recent_history(message)
+
+    message.channel.history = MagicMock(side_effect=AssertionError("REST history should not be called"))
+    assert await cog._fetch_recent_history(message) == first == "bob: hi from bob\ncarol: hi from carol"
+
+
+class StreamingClient:
+    def __init__(self, text, gate):
+        self.text = text
+        self.gate = gate
+
+    async def stream_content(self, **kwargs):
+        midpoint = self.text.index('"reasoning"')
+        yield self.text[:midpoint]
+        await self.gate.wait()
+        yield self.text[midpoint:]
+
+
+@pytest.mark.asyncio
+async def test_streamed_verdict_reported_before_reasoning(cog):
+    gate = asyncio.Event()
+    text = '{"violation": true, "rule_violated": "2", "action": "DELETE", "reasoning": "spam"}'
+    cog.genai_client = StreamingClient(text, gate)
+    verdicts = []
+
+    async def on_verdict(verdict):
+        verdicts.append(verdict)
+        gate.set()
+
+    timings = StageTimings()
+    decision = await cog._request_decision_streaming("rules", "user", "model", None, None, on_verdict, timings)
+
+    assert verdicts == [{"violation": True, "rule_violated": "2", "action": "DELETE"}]
+    assert decision["reasoning"] == "spam"
+    assert "llm_verdict" in timings.stages
+
+
+@pytest.mark.asyncio
+async def test_streamed_call_records_health_and_usage_after_early_verdict(cog):
+    previous = litellm.aclient_session
+    client = LiteLLMClient(api_key="test-key")
+    litellm.aclient_session = previous
+    cog.genai_client = client
+    model_name = client.map_model_name("model")
+    health = client.health(model_name)
+    health.state = CIRCUIT_HALF_OPEN
+
+    text = '{"violation": false, "rule_violated": "None", "action": "IGNORE", "reasoning": "fine"}'
+
+    def chunk(content=None, usage=None):
+        choices = [SimpleNamespace(delta=SimpleNamespace(content=content))] if content is not None else []
+        return SimpleNamespace(choices=choices, usage=usage)
+
+    async def fake_stream():
+        yield chunk(text)
+        yield chunk("\n```")
+        yield chunk(usage=SimpleNamespace(prompt_tokens=12, completion_tokens=30, total_tokens=42))
+
+    with patch.object(client, "_acompletion", new=AsyncMock(side_effect=lambda *args: fake_stream())):
+        decision = await cog._request_decision_streaming("rules", "user", "model", None, None, guild_id=7)
+
+    assert decision["action"] == "IGNORE"
+    assert health.state == CIRCUIT_CLOSED
+    assert health.snapshot()["requests"] == 1
+    totals = cog.token_usage.guild_totals(7)
+    assert totals["requests"] == 1 and totals["prompt_tokens"] == 12 and totals["completion_tokens"] == 30
+
+
+@pytest.mark.asyncio
+async def test_streamed_call_without_usage_is_counted_with_estimate(cog):
+    gate = asyncio.Event()
+    gate.set()
+    text = '{"violation": false, "rule_violated": "None", "action": "IGNORE", "reasoning": "fine"}'
+    cog.genai_client = StreamingClient(text, gate)
+
+    decision = await cog._request_decision_streaming("rules", "user", "model", None, None, guild_id=7)
+
+    assert decision["action"] == "IGNORE"
+    totals = cog.token_usage.guild_totals(7)
+    assert totals["requests"] == 1
+    assert totals["prompt_tokens"] > 0 and totals["completion_tokens"] == -(-len(text) // 4)
+
+
+def test_user_content_adds_image_parts_for_vision_models(cog):
+    parts = [("image/jpeg", b"jpeg", "image", "a.png"), (None, None, "video", "big.mp4")]
+    content = cog._user_content("prompt", parts, "openrouter/google/gemini-2.5-flash")
+    assert content[0] == {"type": "text", "text": "prompt"}
+    assert [part["image_url"]["url"] for part in content[1:]] == ["data:image/jpeg;base64,anBlZw=="]
+    assert cog._user_content("prompt", parts, "openai/text-only-model") == "prompt"
+
+
+@pytest.mark.asyncio
+async def test_known_media_reuses_verdict_across_guilds(cog):
+    cog.media_hash_index = MediaHashIndex(maxsize=10, ttl=60, threshold=6, use_redis=False, share=True)
+    verdict = {"violation": True, "rule_violated": "5", "action": "BAN", "reasoning": "Scam image"}
+    await cog.media_hash_index.add(0xABCDEF, 1, verdict)
+    parts = [MediaPart("image/jpeg", b"jpeg", "image", "a.png", 0xABCDEF ^ 0b11)]
+
+    message = MagicMock()
+    message.guild.id = 1
+    same_guild = await cog._known_media_decision(message, parts)
+    # Bans are not replayed from a hash match alone
+    assert same_guild["action"] == "DELETE" and same_guild["rule_violated"] == "5"
+    assert "Hamming distance 2" in same_guild["reasoning"]
+
+    message.guild.id = 2
+    message.channel.nsfw = False
+    other_guild = await cog._known_media_decision(message, parts)
+    assert other_guild["action"] == "DELETE" and other_guild["rule_violated"] == "Known flagged media"
+    message.channel.nsfw = True
+    assert await cog._known_media_decision(message, parts) is None
+
+
+@pytest.mark.asyncio
+async def test_cached_decision_not_replayed_for_author_with_history(cog):
+    cog.decision_cache = DecisionCache(maxsize=10, ttl=60, use_redis=False, min_length=1)
+    cog.streaming_enabled = False
+    cog._resolve_rules_text = MagicMock(return_value="rules")
+    cog._gather_context = AsyncMock(return_value=(None, None, "", "No recent messages."))
+    cog._build_user_prompt = MagicMock(return_value="prompt")
+    decisions = [
+        {"violation": True, "rule_violated": "4", "action": "WARN", "reasoning": "first offence"},
+        {"violation": True, "rule_violated": "4", "action": "BAN", "reasoning": "repeat offender"},
+        {"violation": True, "rule_violated": "4", "action": "WARN", "reasoning": "first offence"},
+    ]
+    cog._request_decision = AsyncMock(side_effect=decisions)
+
+    def author_message(message_id):
+        message = MagicMock()
+        message.id = message_id
+        message.guild.id = 1
+        message.reference = None
+        message.channel.nsfw = False
+        message.author.guild_permissions.administrator = False
+        message.author.guild_permissions.manage_messages = False
+        return message
+
+    history = "- 2024-01-01: Rule 4 -> TIMEOUT_LONG"
+    with patch("cogs.core_ai_cog.get_guild_config_snapshot", new=AsyncMock(return_value={})):
+        clean = await cog.query_vertex_ai(author_message(1), "buy cheap followers", NO_INFRACTIONS_TEXT)
+        repeat = await cog.query_vertex_ai(author_message(2), "buy cheap followers", history)
+        clean_again = await cog.query_vertex_ai(author_message(3), "buy cheap followers", NO_INFRACTIONS_TEXT)
+        nsfw_message = author_message(4)
+        nsfw_message.channel.nsfw = True
+        await cog.query_vertex_ai(nsfw_message, "buy cheap followers", NO_INFRACTIONS_TEXT)
+
+    assert clean["action"] == "WARN"
+    # The author with a history gets a fresh verdict and never reuses or overwrites the cached one
+    assert repeat["action"] == "BAN"
+    assert clean_again["action"] == "WARN"
+    # Clean author reused the cached verdict; the NSFW channel needed a fresh call
+    assert cog._request_decision.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_pipeline_stats_are_owner_only(cog):
+    ctx = MagicMock()
+    ctx.author.id = -1
+    ctx.reply = AsyncMock()
+    cog.moderation_queue = MagicMock()
+
+    await cog.ai_pipeline.callback(cog, ctx)
+
+    cog.moderation_queue.stats.assert_not_called()
+    assert "bot owners" in ctx.reply.await_args.args[0]
@@ -0,0 +1,56 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from cogs.aimod_helpers.decision_cache import DecisionCache, make_cache_key, normalize_content
+
+DECISION = {"reasoning": "spam", "violation": True, "rule_violated": "4", "action": "DELETE"}
+
+
+def test_normalization_ignores_case_whitespace_and_zero_width():
+    assert normalize_content("  FREE\u200b  Nitro\nhere ") == "free nitro here"
+    assert make_cache_key("Free nitro here", "rules", "m") == make_cache_key("free  NITRO here", "rules", "m")
+    assert make_cache_key("free nitro here", "rules", "m") != make_cache_key("free nitro here", "other", "m")
+    assert make_cache_key("free nitro here", "rules", "m") != make_cache_key("free nitro here", "rules", "n")
+
+
+@pytest.mark.asyncio
+async def test_local_hit_returns_copy_and_counts():
+    cache = DecisionCache(maxsize=10, ttl=60, use_redis=False, min_length=1)
+    assert await cache.get("free nitro", "rules", "model") is None
+    await cache.set("free nitro", "rules", "model", DECISION)
+
+    hit = await cache.get("FREE   nitro", "rules", "model")
+    hit["action"] = "BAN"
+
+    assert (await cache.get("free nitro", "rules", "model"))["action"] == "DELETE"
+    stats = cache.stats()
+    assert stats["local_hits"] == 2
+    assert stats["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_tier_fills_local_cache():
+    cache = DecisionCache(maxsize=10, ttl=60, use_redis=True, min_length=1)
+    with patch("cogs.aimod_helpers.decision_cache.get_cache", new=AsyncMock(return_value=DECISION)) as get_mock:
+        assert await cache.get("copypasta", "rules", "model") == DECISION
+        assert await cache.get("copypasta", "rules", "model") == DECISION
+
+    get_mock.assert_awaited_once()
+    assert cache.stats()["redis_hits"] == 1
+    assert cache.stats()["local_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_short_messages_are_not_cached():
+    cache = DecisionCache(maxsize=10, ttl=60, use_redis=False, min_length=8)
+    await cache.set("lol", "rules", "model", DECISION)
+    assert await cache.get("lol", "rules", "model") is None
+    assert cache.stats()["stores"] == 0
+
+
+@pytest.mark.asyncio
+async def test_context_is_part_of_the_key():
+    cache = DecisionCache(maxsize=10, ttl=60, use_redis=False, min_length=1)
+    await cache.set("free nitro", "rules", "model", DECISION, context="Member|nsfw=0|reply=0")
+    assert await cache.get("free nitro", "rules", "model", context="Member|nsfw=1|reply=0") is None
+    assert await cache.get("free nitro", "rules", "model", context="Member|nsfw=0|reply=0") == DECISION
@@ -0,0 +1,40 @@
+import json
+
+from cogs.aimod_helpers.decision_stream import StreamingDecisionParser
+
+
+def feed_in_chunks(parser, text, size=3):
+    for start in range(0, len(text), size):
+        parser.feed(text[start : start + size])
+
+
+def test_verdict_available_before_reasoning():
+    text = '```json\n{"violation": true, "rule_violated": "5A", "action": "BAN", "reasoning": "Long expla'
+    parser = StreamingDecisionParser()
+    feed_in_chunks(parser, text)
+    assert parser.verdict == {"violation": True, "rule_violated": "5A", "action": "BAN"}
+    assert not parser.complete
+    assert parser.decision() is None
+
+
+def test_complete_decision_with_nested_values_and_escapes():
+    decision = {
+        "violation": False,
+        "reasoning": 'He said "action": "BAN" {jokingly}',
+        "extra": {"action": "KICK", "list": [1, 2]},
+        "rule_violated": "None",
+        "action": "IGNORE",
+    }
+    parser = StreamingDecisionParser()
+    feed_in_chunks(parser, "Sure! " + json.dumps(decision) + "\n```")
+    assert parser.complete
+    assert parser.verdict == {"violation": False, "rule_violated": "None", "action": "IGNORE"}
+    assert parser.decision() == decision
+
+
+def test_no_verdict_until_all_fields_known():
+    parser = StreamingDecisionParser()
+    parser.feed('{"violation": true, "action": "WARN"')
+    assert parser.verdict is None
+    parser.feed(', "rule_violated": "1"}')
+    assert parser.verdict == {"violation": True, "rule_violated": "1", "action": "WARN"}
@@ -0,0 +1,73 @@
+import json
+import random
+
+import aiohttp
+import pytest
+
+from scripts.fake_llm_server import FakeLLMServer, parse_latency
+
+
+def test_parse_latency():
+    rng = random.Random(1)
+    assert parse_latency("fixed:0.2", rng)() == 0.2
+    assert 0.1 <= parse_latency("uniform:0.1,0.5", rng)() <= 0.5
+    assert parse_latency("lognormal:0.4,0.5", rng)() > 0
+    with pytest.raises(ValueError):
+        parse_latency("gaussian:1", rng)
+
+
+def test_decide_batched_prompt():
+    server = FakeLLMServer(seed=1)
+    prompt = "Rules...\n### Message 1 (message_id: 11)\nhello there\n### Message 2 (message_id: 22)\nfree nitro here\n"
+    decisions = server.decide([{"role": "system", "content": "sys"}, {"role": "user", "content": prompt}])
+    assert [(d["message_id"], d["violation"]) for d in decisions["decisions"]] == [("11", False), ("22", True)]
+
+
+@pytest.mark.asyncio
+async def test_chat_completion_round_trip():
+    server = FakeLLMServer(latency="fixed:0", seed=1)
+    base_url = await server.start()
+    try:
+        async with aiohttp.ClientSession() as session:
+            payload = {"model": "fake", "messages": [{"role": "user", "content": "this is a scam"}]}
+            async with session.post(f"{base_url}/chat/completions", json=payload) as response:
+                assert response.status == 200
+                body = await response.json()
+        decision = json.loads(body["choices"][0]["message"]["content"])
+        assert decision["violation"] is True
+        assert body["usage"]["total_tokens"] > 0
+        assert server.stats()["requests"] == 1
+    finally:
+        await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_injected_errors():
+    server = FakeLLMServer(latency="fixed:0", error_rate=1.0, seed=1)
+    base_url = await server.start()
+    try:
+        async with aiohttp.ClientSession() as session:
+            payload = {"model": "fake", "messages": [{"role": "user", "content": "hi"}]}
+            async with session.post(f"{base_url}/chat/completions", json=payload) as response:
+                assert response.status == 500
+        assert server.stats()["errors"] == 1
+    finally:
+        await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_streamed_completion():
+    server = FakeLLMServer(latency="fixed:0", chunk_size=5, seed=1)
+    base_url = await server.start()
+    try:
+        async with aiohttp.ClientSession() as session:
+            payload = {"model": "fake", "stream": True, "messages": [{"role": "user", "content": "free nitro"}]}
+            async with session.post(f"{base_url}/chat/completions", json=payload) as response:
+                events = [line.decode().strip() for line in (await response.read()).splitlines() if line.strip()]
+        assert events[-1] == "data: [DONE]"
+        chunks = [json.loads(event[len("data: ") :]) for event in events[:-1]]
+        content = "".join(chunk["choices"][0]["delta"].get("content", "") for chunk in chunks)
+        assert json.loads(content)["violation"] is True
+        assert content.index('"action"') < content.index('"reasoning"')
+    finally:
+        await server.stop()
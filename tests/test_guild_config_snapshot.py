@@ -0,0 +1,157 @@
+import asyncio
+import json
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from database import cache, operations
+
+
+@pytest.fixture(autouse=True)
+def clear_snapshots():
+    operations.invalidate_guild_config_snapshot()
+    yield
+    operations.invalidate_guild_config_snapshot()
+
+
+@pytest.mark.asyncio
+async def test_snapshot_loads_all_keys_in_one_query():
+    rows = [
+        {"key": "ENABLED", "value": "true"},
+        {"key": "AI_EXCLUDED_CHANNELS", "value": "[1, 2]"},
+        {"key": "AI_MODEL", "value": '"openai/gpt-4o"'},
+    ]
+    query_mock = AsyncMock(return_value=rows)
+    with patch("database.operations.execute_query", new=query_mock):
+        snapshot = await operations.get_guild_config_snapshot(123)
+        again = await operations.get_guild_config_snapshot(123)
+
+    assert snapshot is again
+    query_mock.assert_awaited_once()
+    assert snapshot.get("ENABLED") is True
+    assert snapshot.get("AI_EXCLUDED_CHANNELS") == [1, 2]
+    assert snapshot.get("AI_MODEL") == "openai/gpt-4o"
+    assert snapshot.get("MISSING", "fallback") == "fallback"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_cold_lookups_share_one_query():
+    async def slow_query(*args, **kwargs):
+        await asyncio.sleep(0.01)
+        return [{"key": "ENABLED", "value": "false"}]
+
+    query_mock = AsyncMock(side_effect=slow_query)
+    with patch("database.operations.execute_query", new=query_mock):
+        results = await asyncio.gather(*(operations.get_guild_config_snapshot(5) for _ in range(10)))
+
+    query_mock.assert_awaited_once()
+    assert all(result is results[0] for result in results)
+
+
+@pytest.mark.asyncio
+async def test_failed_load_is_not_cached():
+    query_mock = AsyncMock(side_effect=[RuntimeError("db down"), [{"key": "ENABLED", "value": "false"}]])
+    with patch("database.operations.execute_query", new=query_mock):
+        first = await operations.get_guild_config_snapshot(7)
+        second = await operations.get_guild_config_snapshot(7)
+
+    assert first.get("ENABLED", True) is True
+    assert second.get("ENABLED", True) is False
+    assert query_mock.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_get_guild_config_served_from_warm_snapshot_without_io():
+    with patch("database.operations.execute_query", new=AsyncMock(return_value=[{"key": "RULES", "value": "[1]"}])):
+        await operations.get_guild_config_snapshot(9)
+
+    cache_mock = AsyncMock(return_value=None)
+    with patch("database.operations.get_cache", new=cache_mock), patch(
+        "database.operations.execute_query", new=AsyncMock()
+    ) as query_mock:
+        value = await operations.get_guild_config(9, "RULES")
+        value.append(2)
+        assert await operations.get_guild_config(9, "RULES") == [1]
+        assert await operations.get_guild_config(9, "OTHER", "default") == "default"
+
+    cache_mock.assert_not_awaited()
+    query_mock.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_set_guild_config_evicts_snapshot():
+    with patch("database.operations.execute_query", new=AsyncMock(return_value=[])):
+        await operations.get_guild_config_snapshot(11)
+
+    with patch("database.operations.insert_or_update", new=AsyncMock(return_value=True)), patch(
+        "database.operations.set_cache", new=AsyncMock()
+    ), patch("database.operations.publish_config_invalidation", new=AsyncMock()) as publish_mock:
+        assert await operations.set_guild_config(11, "ENABLED", False)
+    publish_mock.assert_awaited_once_with("guild_config", 11, "ENABLED")
+
+    query_mock = AsyncMock(return_value=[{"key": "ENABLED", "value": "false"}])
+    with patch("database.operations.execute_query", new=query_mock):
+        snapshot = await operations.get_guild_config_snapshot(11)
+
+    query_mock.assert_awaited_once()
+    assert snapshot.get("ENABLED") is False
+
+
+@pytest.mark.asyncio
+async def test_remote_invalidation_evicts_snapshot():
+    with patch("database.operations.execute_query", new=AsyncMock(return_value=[])):
+        await operations.get_guild_config_snapshot(13)
+
+    cache.dispatch_invalidation({"scope": "guild_config", "guild_id": 13, "key": "ENABLED"})
+
+    assert 13 not in operations._guild_config_snapshots
+
+
+@pytest.mark.asyncio
+async def test_invalidation_listener_dispatches_remote_messages_only():
+    remote = json.dumps({"scope": "guild_config", "guild_id": 1, "key": "AI_MODEL", "origin": "other"})
+    local = json.dumps({"scope": "guild_config", "guild_id": 2, "key": "AI_MODEL", "origin": cache._PROCESS_ID})
+    messages = [
+        {"type": "message", "data": remote.encode()},
+        {"type": "message", "data": local.encode()},
+        {"type": "message", "data": b"not json"},
+    ]
+
+    async def get_message(ignore_subscribe_messages, timeout):
+        if messages:
+            return messages.pop(0)
+        raise asyncio.CancelledError
+
+    pubsub = AsyncMock()
+    pubsub.get_message.side_effect = get_message
+    redis_mock = MagicMock()
+    redis_mock.pubsub.return_value = pubsub
+    handler = MagicMock()
+    cache.register_invalidation_handler(handler)
+    try:
+        with patch("database.cache.get_redis", new=AsyncMock(return_value=redis_mock)):
+            with pytest.raises(asyncio.CancelledError):
+                await cache.config_invalidation_listener()
+    finally:
+        cache.unregister_invalidation_handler(handler)
+
+    pubsub.subscribe.assert_awaited_once_with(cache.CONFIG_INVALIDATION_CHANNEL)
+    handler.assert_called_once()
+    assert handler.call_args.args[0]["guild_id"] == 1
+
+
+@pytest.mark.asyncio
+async def test_publish_config_invalidation_dispatches_locally_and_publishes():
+    redis_mock = AsyncMock()
+    handler = MagicMock()
+    cache.register_invalidation_handler(handler)
+    try:
+        with patch("database.cache.get_redis", new=AsyncMock(return_value=redis_mock)):
+            await cache.publish_config_invalidation("botdetect_config", 42, "keywords")
+    finally:
+        cache.unregister_invalidation_handler(handler)
+
+    handler.assert_called_once()
+    channel, body = redis_mock.publish.await_args.args
+    assert channel == cache.CONFIG_INVALIDATION_CHANNEL
+    assert json.loads(body)["scope"] == "botdetect_config"
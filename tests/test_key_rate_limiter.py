@@ -0,0 +1,80 @@
+import asyncio
+
+import litellm
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from cogs.aimod_helpers.key_rate_limiter import KeyRateLimiter, KeyRateLimitExceeded, TokenBucket
+from cogs.aimod_helpers.litellm_config import FALLBACK_MODEL, LiteLLMClient
+
+
+def test_token_bucket_refills_and_blocks():
+    now = [0.0]
+    bucket = TokenBucket(rate=1.0, capacity=2, clock=lambda: now[0])
+
+    assert bucket.try_take() == 0 and bucket.try_take() == 0
+    assert bucket.try_take() == pytest.approx(1.0)
+    now[0] = 1.0
+    assert bucket.try_take() == 0
+
+    bucket.block(5)
+    now[0] = 3.0
+    assert bucket.try_take() == pytest.approx(3.0)
+
+
+@pytest.mark.asyncio
+async def test_limiter_caps_concurrency_and_sheds_when_wait_too_long():
+    limiter = KeyRateLimiter(max_wait=0.05, max_queue=10, use_redis=False)
+    limiter.provider_limits["test"] = {"rpm": 6000, "concurrency": 1}
+
+    async with limiter.limit("test", "secret"):
+        with pytest.raises(KeyRateLimitExceeded):
+            async with limiter.limit("test", "secret"):
+                pass
+        # Another key has its own budget.
+        async with limiter.limit("test", "other-secret"):
+            pass
+
+    stats = limiter.stats()
+    assert stats["keys"] == 2 and stats["shed"] == 1 and stats["admitted"] == 2
+
+
+@pytest.mark.asyncio
+async def test_requests_that_are_not_sent_return_their_token():
+    limiter = KeyRateLimiter(max_wait=0.05, max_queue=10, use_redis=True)
+    limiter.provider_limits["test"] = {"rpm": 6, "concurrency": 1}
+    key_id, state = limiter._state("test", "secret")
+
+    # The shared Redis budget is spent once, then frees up
+    with patch.object(limiter, "_redis_wait", AsyncMock(side_effect=[0.01, 0.0, 0.0])):
+        async with limiter.limit("test", "secret"):
+            assert state.bucket.tokens == pytest.approx(1, abs=0.01)
+            with pytest.raises(KeyRateLimitExceeded):
+                async with limiter.limit("test", "secret"):
+                    pass
+            # The request shed on the concurrency limit gave its token back
+            assert state.bucket.tokens == pytest.approx(1, abs=0.01)
+
+
+@pytest.mark.asyncio
+async def test_guild_key_rate_limit_does_not_spill_onto_shared_key():
+    previous = litellm.aclient_session
+    client = LiteLLMClient(api_key="shared-key")
+    calls = []
+
+    async def fake_acompletion(**kwargs):
+        calls.append((kwargs["model"], kwargs["api_key"]))
+        raise litellm.RateLimitError("slow down", llm_provider="openai", model=kwargs["model"])
+
+    try:
+        with patch("cogs.aimod_helpers.litellm_config.acompletion", new=fake_acompletion):
+            with pytest.raises(litellm.RateLimitError):
+                await client.generate_content(model="openai/gpt-4o", messages=[], api_key="guild-key")
+            await asyncio.sleep(0)
+    finally:
+        litellm.aclient_session = previous
+
+    assert calls == [("openai/gpt-4o", "guild-key")]
+    assert (FALLBACK_MODEL, "shared-key") not in calls
+    assert client.key_limiter.stats()["provider_throttles"] == 1
+    assert client.health("openai/gpt-4o").snapshot()["requests"] == 0
@@ -0,0 +1,75 @@
+import random
+import re
+
+from cogs.aimod_helpers import keyword_matcher
+from cogs.aimod_helpers.keyword_matcher import KeywordRuleMatcher, get_guild_matcher, invalidate_guild_matcher
+
+
+def reference_match(content, rules):
+    for rule in rules:
+        for kw in rule.get("keywords", []):
+            if kw.lower() in content.lower():
+                return rule
+        for pattern in rule.get("regex", []):
+            try:
+                if re.search(pattern, content, re.IGNORECASE):
+                    return rule
+            except re.error:
+                continue
+    return None
+
+
+def test_first_rule_in_order_wins():
+    rules = [
+        {"name": "scam", "keywords": ["free nitro"]},
+        {"name": "links", "regex": [r"https?://\S+"]},
+        {"name": "nitro", "keywords": ["nitro"]},
+    ]
+    matcher = KeywordRuleMatcher(rules)
+
+    assert matcher.match("Get FREE NITRO at https://x.y")["name"] == "scam"
+    assert matcher.match("nitro at https://x.y")["name"] == "links"
+    assert matcher.match("just nitro")["name"] == "nitro"
+    assert matcher.match("hello there") is None
+
+
+def test_invalid_and_grouped_patterns():
+    rules = [
+        {"name": "bad", "regex": ["(unclosed"]},
+        {"name": "repeat", "regex": [r"(\w)\1\1"]},
+        {"name": "word", "regex": ["spam"]},
+    ]
+    matcher = KeywordRuleMatcher(rules)
+
+    assert matcher.match("aaa") is rules[1]
+    assert matcher.match("SPAM") is rules[2]
+    assert matcher.match("(unclosed") is None
+
+
+def test_matches_reference_implementation_on_random_inputs():
+    rng = random.Random(1234)
+    alphabet = "abcab xyz"
+    for _ in range(200):
+        rules = []
+        for _ in range(rng.randint(0, 6)):
+            rule = {
+                "keywords": ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(0, 3))]
+            }
+            if rng.random() < 0.5:
+                rule["regex"] = [rng.choice(["ab+c", "x.z", "^a", "c$", "[xyz]{3}", "(a|b)\\1"])]
+            rules.append(rule)
+        matcher = KeywordRuleMatcher(rules)
+        for _ in range(10):
+            text = "".join(rng.choice(alphabet + "ABC") for _ in range(rng.randint(0, 20)))
+            assert matcher.match(text) is reference_match(text, rules)
+
+
+def test_guild_matcher_is_reused_until_invalidated():
+    invalidate_guild_matcher()
+    rules = [{"keywords": ["spam"]}]
+    first = get_guild_matcher(1, rules)
+    assert get_guild_matcher(1, rules) is first
+
+    keyword_matcher._on_config_invalidation({"scope": "guild_config", "guild_id": 1, "key": "AI_KEYWORD_RULES"})
+    new_rules = [{"keywords": ["eggs"]}]
+    assert get_guild_matcher(1, new_rules).match("eggs") is new_rules[0]
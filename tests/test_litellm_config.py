@@ -0,0 +1,178 @@
+import asyncio
+
+import litellm
+import pytest
+from unittest.mock import patch
+
+from cogs.aimod_helpers.litellm_config import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    COPILOT_EXTRA_HEADERS,
+    DEFAULT_GENERATION_CONFIG,
+    FALLBACK_MODEL,
+    LiteLLMClient,
+    ModelHealth,
+)
+
+
+@pytest.fixture
+def client():
+    previous = litellm.aclient_session
+    client = LiteLLMClient(api_key="test-key")
+    yield client
+    litellm.aclient_session = previous
+
+
+def test_client_installs_shared_http_session(client):
+    assert litellm.aclient_session is client.http_client
+
+
+@pytest.mark.asyncio
+async def test_generate_content_tracks_pool_usage_and_leaves_defaults_untouched(client):
+    client.max_connections = 2
+    release = asyncio.Event()
+    seen_headers = []
+
+    async def fake_acompletion(**kwargs):
+        seen_headers.append(kwargs["extra_headers"])
+        kwargs["extra_headers"]["x-mutated"] = "1"
+        await release.wait()
+        return None
+
+    with patch("cogs.aimod_helpers.litellm_config.acompletion", new=fake_acompletion):
+        tasks = [
+            asyncio.create_task(client.generate_content(model="m", messages=[], temperature=0.5)) for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        assert client.pool_stats()["in_flight"] == 3
+        release.set()
+        await asyncio.gather(*tasks)
+
+    stats = client.pool_stats()
+    assert stats["in_flight"] == 0
+    assert stats["peak_in_flight"] == 3
+    assert stats["saturated_requests"] == 1
+    assert "x-mutated" not in COPILOT_EXTRA_HEADERS
+    assert DEFAULT_GENERATION_CONFIG["temperature"] == 0.2
+    assert len(seen_headers) == 3
+
+
+def test_model_health_opens_probes_and_closes():
+    now = [0.0]
+    health = ModelHealth("m", window=60, min_requests=3, error_rate=0.5, cooldown=10, clock=lambda: now[0])
+
+    for _ in range(3):
+        assert health.try_acquire()
+        health.record_failure(1.0)
+    assert health.state == CIRCUIT_OPEN
+    assert not health.try_acquire()
+
+    now[0] = 11.0
+    assert health.try_acquire()
+    assert health.state == CIRCUIT_HALF_OPEN
+    assert not health.try_acquire()  # only one probe at a time
+    health.record_success(0.2)
+    assert health.state == CIRCUIT_CLOSED
+    assert health.error_rate() == 0.0
+    assert health.p95() == 0.2
+
+
+@pytest.mark.asyncio
+async def test_open_primary_routes_straight_to_fallback(client):
+    calls = []
+
+    async def fake_acompletion(**kwargs):
+        calls.append(kwargs["model"])
+        if kwargs["model"] == "primary":
+            raise litellm.ServiceUnavailableError("down", llm_provider="openrouter", model="primary")
+        return None
+
+    client.model_health["primary"] = ModelHealth("primary", min_requests=2, error_rate=0.5, cooldown=60)
+    with patch("cogs.aimod_helpers.litellm_config.acompletion", new=fake_acompletion):
+        for _ in range(4):
+            await client.generate_content(model="primary", messages=[])
+
+    assert calls == ["primary", FALLBACK_MODEL, "primary", FALLBACK_MODEL, FALLBACK_MODEL, FALLBACK_MODEL]
+    assert client.health("primary").state == CIRCUIT_OPEN
+
+
+@pytest.mark.asyncio
+async def test_client_errors_do_not_trip_breaker(client):
+    async def fake_acompletion(**kwargs):
+        raise litellm.AuthenticationError("bad key", llm_provider="openrouter", model=kwargs["model"])
+
+    with patch("cogs.aimod_helpers.litellm_config.acompletion", new=fake_acompletion):
+        for _ in range(6):
+            with pytest.raises(litellm.AuthenticationError):
+                await client.generate_content(model="primary", messages=[])
+
+    assert client.health("primary").state == CIRCUIT_CLOSED
+    assert client.health("primary").snapshot()["requests"] == 0
+
+
+@pytest.mark.asyncio
+async def test_hedged_request_wins_and_cancels_slow_original(client):
+    client.hedge_enabled = True
+    cancelled = []
+
+    async def fake_acompletion(**kwargs):
+        if not cancelled and client.hedges_sent == 0:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(kwargs["model"])
+                raise
+        return "fast"
+
+    with (
+        patch("cogs.aimod_helpers.litellm_config.acompletion", new=fake_acompletion),
+        patch.object(client, "hedge_delay", return_value=0.01),
+    ):
+        response = await client.generate_content(model="primary", messages=[])
+        await asyncio.sleep(0)  # let the loser observe its cancellation
+
+    assert response._response == "fast"
+    assert cancelled == ["primary"]
+    stats = client.hedge_stats()
+    assert stats["hedges_sent"] == 1 and stats["hedge_wins"] == 1
+    assert client.pool_stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_fast_response_is_not_hedged(client):
+    client.hedge_enabled = True
+
+    async def fake_acompletion(**kwargs):
+        return "ok"
+
+    with patch("cogs.aimod_helpers.litellm_config.acompletion", new=fake_acompletion):
+        await client.generate_content(model="primary", messages=[])
+
+    assert client.hedge_stats()["eligible"] == 1
+    assert client.hedge_stats()["hedges_sent"] == 0
+
+
+@pytest.mark.asyncio
+async def test_fallback_hedge_uses_shared_credentials_only(client):
+    client.hedge_enabled = True
+    calls = []
+
+    async def fake_acompletion(**kwargs):
+        calls.append((kwargs["model"], kwargs["api_key"], kwargs["auth"]))
+        if kwargs["model"] == "primary":
+            await asyncio.sleep(10)
+        return "hedged"
+
+    guild_auth = {"access_token": "guild-token"}
+    with (
+        patch("cogs.aimod_helpers.litellm_config.acompletion", new=fake_acompletion),
+        patch("cogs.aimod_helpers.litellm_config.HEDGE_TARGET", "fallback"),
+        patch.object(client, "hedge_delay", return_value=0.01),
+    ):
+        response = await client.generate_content(
+            model="primary", messages=[], api_key="guild-key", auth_info=guild_auth
+        )
+
+    assert response._response == "hedged"
+    assert calls == [("primary", "guild-key", guild_auth), (FALLBACK_MODEL, "test-key", None)]
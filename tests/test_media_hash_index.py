@@ -0,0 +1,137 @@
+import io
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from PIL import Image, ImageDraw
+
+from cogs.aimod_helpers.media_hash_index import MediaHashIndex, hamming_distance
+from cogs.aimod_helpers.media_processor import dhash, prepare_image
+
+VERDICT = {"violation": True, "rule_violated": "5", "action": "DELETE", "reasoning": "Scam image"}
+
+
+def _index(**kwargs):
+    return MediaHashIndex(**{"maxsize": 100, "ttl": 60, "threshold": 6, "use_redis": False, **kwargs})
+
+
+def _picture(size=(400, 300)) -> Image.Image:
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((40, 40, 200, 160), fill="red")
+    draw.ellipse((220, 100, 380, 280), fill="blue")
+    return image
+
+
+@pytest.mark.asyncio
+async def test_lookup_within_threshold():
+    index = _index()
+    await index.add(0xFFFF0000FFFF0000, 1, VERDICT)
+    match = await index.lookup([0x123, 0xFFFF0000FFFF0007])
+    assert match.matched_hash == 0xFFFF0000FFFF0000
+    assert match.distance == 3
+    assert match.verdict == VERDICT and match.guild_id == 1
+    # Eight bits flipped, one per band, is past any allowed threshold
+    assert await index.lookup([0xFFFF0000FFFF0000 ^ 0x0101010101010101]) is None
+    assert index.stats()["local_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_threshold_is_capped_and_lru_evicts():
+    assert _index(threshold=20).threshold == 7
+    index = _index(maxsize=2)
+    for media_hash in (0xFFFF, 0xFFFF << 48, (1 << 32) - 1):
+        await index.add(media_hash, 1, VERDICT)
+    assert len(index) == 2
+    assert await index.lookup([0xFFFF]) is None
+    assert (await index.lookup([(1 << 32) - 1])).distance == 0
+
+
+@pytest.mark.asyncio
+async def test_uniform_frames_are_neither_stored_nor_matched():
+    blank = dhash(Image.new("RGB", (320, 240), "black"))
+    assert blank == 0 and dhash(Image.new("RGB", (320, 240), "white")) == 0
+    index = _index()
+    await index.add(blank, 1, VERDICT)
+    await index.add((1 << 64) - 1, 1, VERDICT)
+    assert len(index) == 0
+
+    await index.add(dhash(_picture()), 1, VERDICT)
+    assert await index.lookup([blank, blank ^ 0b1]) is None
+    # Blank frames don't count towards the frames that need to match
+    assert await index.lookup([blank, blank, dhash(_picture())]) is not None
+
+
+@pytest.mark.asyncio
+async def test_most_frames_must_match():
+    flagged = [0xFFFF0000FFFF0000, 0x00FF00FF00FF00FF]
+    index = _index()
+    for media_hash in flagged:
+        await index.add(media_hash, 1, VERDICT)
+    unrelated = [0x0F0F0F0F0F0F0F0F, 0x3333333333333333, 0x5555555555555555]
+
+    assert await index.lookup([flagged[0], *unrelated[:2]]) is None
+    assert await index.lookup([flagged[0], flagged[1] ^ 0b1, unrelated[0]]) is not None
+    assert await index.lookup(flagged[:1] + unrelated[:1]) is None
+
+
+def test_dhash_survives_resize_and_recompression():
+    original = _picture()
+    out = io.BytesIO()
+    original.resize((200, 150)).save(out, "JPEG", quality=40)
+    [(_jpeg, repost_hash)] = prepare_image(out.getvalue(), 1024, 4, 85)
+    assert hamming_distance(dhash(original), repost_hash) <= 6
+    assert hamming_distance(dhash(original), dhash(original.transpose(Image.Transpose.FLIP_LEFT_RIGHT))) > 6
+
+
+class FakePipeline:
+    def __init__(self, store):
+        self.store = store
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    async def execute(self):
+        results = []
+        for name, args, kwargs in self.commands:
+            if name == "sadd":
+                self.store.setdefault(args[0], set()).add(args[1].encode())
+            elif name == "set":
+                self.store[args[0]] = args[1]
+            elif name == "smembers":
+                results.append(self.store.get(args[0], set()))
+                continue
+            elif name == "get":
+                results.append(self.store.get(args[0]))
+                continue
+            results.append(True)
+        return results
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self.store)
+
+
+@pytest.mark.asyncio
+async def test_redis_tier_is_shared_between_processes():
+    redis = FakeRedis()
+    flagged = [0xFFFF0000FFFF0000, 0x00FF00FF00FF00FF]
+    with patch("cogs.aimod_helpers.media_hash_index.get_redis", AsyncMock(return_value=redis)):
+        for media_hash in flagged:
+            await _index(use_redis=True).add(media_hash, 1, VERDICT)
+        other = _index(use_redis=True)
+        assert await other.lookup([flagged[0], 0x0F0F0F0F0F0F0F0F, 0x3333333333333333]) is None
+        match = await other.lookup([flagged[0] ^ 0b1, flagged[1], 0x3333333333333333])
+
+    assert match.distance == 0 and match.verdict == VERDICT
+    assert other.stats()["redis_hits"] == 1
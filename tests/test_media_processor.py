@@ -0,0 +1,98 @@
+import io
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from PIL import Image
+from types import SimpleNamespace
+
+from cogs.aimod_helpers.media_processor import MediaProcessor, prepare_image
+from cogs.aimod_helpers.stage_timer import StageTimings
+
+
+def png_bytes(size=(2000, 1000)):
+    out = io.BytesIO()
+    Image.new("RGB", size, "red").save(out, "PNG")
+    return out.getvalue()
+
+
+def gif_bytes(frames=10):
+    out = io.BytesIO()
+    images = [Image.new("RGB", (300, 300), (i * 20, 0, 0)) for i in range(frames)]
+    images[0].save(out, "GIF", save_all=True, append_images=images[1:])
+    return out.getvalue()
+
+
+def test_prepare_image_downscales_to_jpeg():
+    ((jpeg, media_hash),) = prepare_image(png_bytes(), max_dimension=512, max_frames=4, quality=85)
+    assert 0 <= media_hash < 1 << 64
+    with Image.open(io.BytesIO(jpeg)) as image:
+        assert image.format == "JPEG"
+        assert image.size == (512, 256)
+
+
+def test_prepare_image_samples_animation_frames():
+    frames = prepare_image(gif_bytes(10), max_dimension=128, max_frames=3, quality=85)
+    assert len(frames) == 3
+    with Image.open(io.BytesIO(frames[0][0])) as image:
+        assert max(image.size) == 128
+
+
+@pytest.mark.asyncio
+async def test_oversized_attachment_is_not_downloaded():
+    processor = MediaProcessor(max_bytes=1000)
+    attachment = SimpleNamespace(filename="clip.mp4", size=5000, url="http://invalid.test/clip.mp4")
+    (part,) = await processor.process_attachment(attachment)
+    assert part.data is None and part.kind == "video"
+    assert processor.stats()["skipped_too_large"] == 1
+
+
+@pytest_asyncio.fixture
+async def media_server():
+    payloads = {"/big.png": png_bytes(), "/anim.gif": gif_bytes(6)}
+
+    async def handler(request):
+        # Chunked responses carry no Content-Length, so only the streaming cap applies
+        response = web.StreamResponse()
+        await response.prepare(request)
+        await response.write(payloads[request.path])
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/{name}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}", payloads
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_download_and_decode_in_process_pool(media_server):
+    base_url, payloads = media_server
+    processor = MediaProcessor(max_dimension=256, max_frames=2, workers=1)
+    timings = StageTimings()
+    try:
+        attachment = SimpleNamespace(filename="anim.gif", size=0, url=f"{base_url}/anim.gif")
+        parts = await processor.process_attachment(attachment, timings)
+    finally:
+        await processor.close()
+    assert [part.filename for part in parts] == ["anim.gif (frame 1 of 2)", "anim.gif (frame 2 of 2)"]
+    assert all(part.mime_type == "image/jpeg" and part.data for part in parts)
+    assert {"media_download", "media_decode"} <= set(timings.stages)
+
+
+@pytest.mark.asyncio
+async def test_streaming_download_stops_at_byte_cap(media_server):
+    base_url, payloads = media_server
+    processor = MediaProcessor(max_bytes=len(payloads["/big.png"]) - 1)
+    try:
+        attachment = SimpleNamespace(filename="big.png", size=0, url=f"{base_url}/big.png")
+        (part,) = await processor.process_attachment(attachment)
+    finally:
+        await processor.close()
+    assert part.data is None
+    assert processor.stats()["skipped_too_large"] == 1
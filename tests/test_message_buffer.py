@@ -0,0 +1,54 @@
+from unittest.mock import MagicMock
+
+from cogs.aimod_helpers.message_buffer import RecentMessageBuffer
+
+
+def make_message(message_id, channel_id=1, content="hello", bot=False, name="user"):
+    message = MagicMock()
+    message.id = message_id
+    message.channel.id = channel_id
+    message.content = content
+    message.author.bot = bot
+    message.author.display_name = name
+    return message
+
+
+def test_recent_returns_newest_first_and_misses_when_short():
+    buffer = RecentMessageBuffer(per_channel=5, max_channels=10)
+    for message_id in (1, 2, 3):
+        buffer.record(make_message(message_id, content=f"m{message_id}"))
+
+    assert buffer.recent(1, before_id=4, limit=4) is None
+    assert [entry.content for entry in buffer.recent(1, before_id=4, limit=2)] == ["m3", "m2"]
+    assert buffer.stats()["hits"] == 1 and buffer.stats()["misses"] == 1
+
+
+def test_complete_seed_allows_short_history():
+    buffer = RecentMessageBuffer(per_channel=5, max_channels=10)
+    buffer.seed(1, [make_message(2), make_message(1)], complete=True)
+
+    assert [entry.id for entry in buffer.recent(1, before_id=3, limit=4)] == [2, 1]
+
+
+def test_ring_and_channel_capacity_are_bounded():
+    buffer = RecentMessageBuffer(per_channel=3, max_channels=2)
+    for message_id in range(1, 10):
+        buffer.record(make_message(message_id, channel_id=1))
+    buffer.record(make_message(10, channel_id=2))
+    buffer.record(make_message(11, channel_id=3))
+
+    stats = buffer.stats()
+    assert stats["channels"] == 2
+    assert buffer.get(1, 9) is None
+    assert [entry.id for entry in buffer.recent(2, before_id=99, limit=1)] == [10]
+
+
+def test_out_of_order_edit_and_delete():
+    buffer = RecentMessageBuffer(per_channel=5, max_channels=10)
+    buffer.record(make_message(2))
+    buffer.record(make_message(1, content="late"))
+    buffer.update(make_message(2, content="edited"))
+    buffer.remove(1, 1)
+
+    assert buffer.get(1, 1) is None
+    assert buffer.get(1, 2).content == "edited"
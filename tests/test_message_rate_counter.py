@@ -0,0 +1,34 @@
+from cogs.messagerate_helpers.rate_counter import MessageRateCounter
+
+
+def test_counts_are_exact_over_sliding_windows():
+    counter = MessageRateCounter(span=120)
+    for second in range(100):
+        counter.record(1, count=2, now=1000 + second)
+
+    assert counter.count(1, 60, now=1099) == 120
+    assert counter.count(1, 10, now=1099) == 20
+    # The window slides with the clock even when no new messages arrive
+    assert counter.count(1, 60, now=1129) == 60
+    assert counter.per_minute(1, 30, now=1099) == 120
+    # More than the old 100-message cap
+    assert counter.count(1, 120, now=1099) == 200
+
+
+def test_gaps_longer_than_span_clear_the_ring():
+    counter = MessageRateCounter(span=60)
+    counter.record(1, count=50, now=10)
+    counter.record(1, now=200)
+
+    assert counter.count(1, 60, now=200) == 1
+    assert counter.count(2, 60, now=200) == 0
+
+
+def test_idle_channels_are_evicted():
+    counter = MessageRateCounter(span=60)
+    counter.record(1, now=0)
+    counter.record(2, now=50)
+
+    assert counter.evict_idle(now=70) == 1
+    assert list(counter) == [2]
+    assert counter.stats() == {"backend": "memory", "channels": 1, "recorded": 2, "evicted": 1}
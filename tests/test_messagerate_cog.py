@@ -0,0 +1,97 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from discord.ext import tasks
+
+from cogs.messagerate import MessageRateCog
+from cogs.messagerate_helpers.channel_index import AutoRateIndex
+from cogs.messagerate_helpers.slowmode_controller import SlowmodeCurve
+
+
+@pytest.mark.asyncio
+async def test_index_reloads_only_stale_guilds():
+    index = AutoRateIndex()
+    loader = AsyncMock(side_effect=lambda guild_id: [guild_id * 10])
+
+    assert await index.refresh([1, 2], loader) == 2
+    assert index.guild_of(10) == 1 and index.guild_of(20) == 2
+    assert await index.refresh([1, 2], loader) == 0
+
+    index.on_config_invalidation({"scope": "guild_config", "guild_id": 2, "key": "AI_MODEL"})
+    index.on_config_invalidation({"scope": "guild_config", "guild_id": 2, "key": "AUTO_RATE_CHANNELS"})
+    assert await index.refresh([1], loader) == 0
+    assert index.guild_of(20) is None
+    assert loader.await_count == 2
+
+
+def make_channel(channel_id, slowmode=0):
+    channel = MagicMock()
+    channel.id = channel_id
+    channel.slowmode_delay = slowmode
+    channel.edit = AsyncMock()
+    return channel
+
+
+@pytest.fixture
+def cog():
+    bot = MagicMock()
+    with patch.object(tasks.Loop, "start"):
+        cog = MessageRateCog(bot)
+    yield cog
+    cog.cog_unload()
+
+
+@pytest.mark.asyncio
+async def test_monitor_visits_only_watched_enabled_channels(cog):
+    channels = {1: make_channel(1), 2: make_channel(2), 3: make_channel(3)}
+    guild = MagicMock(id=100)
+    cog.bot.guilds = [guild]
+    cog.bot.get_channel.side_effect = channels.get
+    config = {"AUTO_RATE_ENABLED": True, "AUTO_RATE_CHANNELS": [1, 2]}
+
+    with patch("cogs.messagerate.get_guild_config", AsyncMock(side_effect=lambda g, k, d=None: config.get(k, d))):
+        for _ in range(12):
+            cog.message_counter.record(1)
+        await cog.rate_monitor.coro(cog)
+        # Both enabled channels are checked once after the config load; only the busy one stays watched
+        assert cog.last_tick_visits == 2
+        channels[1].edit.assert_awaited_once_with(slowmode_delay=cog.HIGH_RATE_SLOWMODE)
+        assert cog.watched_channels == {1}
+
+        await cog.rate_monitor.coro(cog)
+        assert cog.last_tick_visits == 1
+
+    stats = cog.get_monitor_stats()
+    assert stats["ticks"] == 2 and stats["config_loads"] == 1 and stats["enabled_channels"] == 2
+
+
+def test_guild_floor_applies_hysteresis(cog):
+    cog.guild_curves[100] = SlowmodeCurve.parse("60:2,200:10")
+    for channel_id in range(1, 11):
+        cog.message_counter.record(channel_id, count=25, guild_id=100)
+
+    # 250 messages across ten quiet channels still puts the whole guild on the top level
+    assert cog.get_guild_floor(100) == 10
+    with patch.object(cog.message_counter, "guild_per_minute", return_value=170):
+        # Still within 25% of the 200 msg/min level
+        assert cog.get_guild_floor(100) == 10
+    with patch.object(cog.message_counter, "guild_per_minute", return_value=120):
+        assert cog.get_guild_floor(100) == 2
+    assert cog.get_guild_floor(200) == 0
+
+
+@pytest.mark.asyncio
+async def test_invalid_guild_curve_disables_the_floor(cog):
+    cog.guild_curves[100] = SlowmodeCurve.parse("60:2,200:10")
+    cog.guild_floors[100] = 10
+    config = {
+        "AUTO_RATE_ENABLED": True,
+        "AUTO_RATE_CHANNELS": [1],
+        "AUTO_RATE_GUILD_CURVE": {"levels": [[200, 10], [60, 2]], "hysteresis": 0.25, "dwell": 120},
+    }
+
+    with patch("cogs.messagerate.get_guild_config", AsyncMock(side_effect=lambda g, k, d=None: config.get(k, d))):
+        assert await cog.load_enabled_channels(100) == [1]
+
+    assert 100 not in cog.guild_curves and 100 not in cog.guild_floors
+    assert cog.get_guild_floor(100) == 0
@@ -0,0 +1,174 @@
+import asyncio
+
+import pytest
+
+from cogs.aimod_helpers.batcher import MicroBatcher
+from cogs.aimod_helpers.moderation_queue import (
+    DEFERRED,
+    QUEUED,
+    SHED,
+    SHED_DEFER,
+    SHED_KEYWORD_ONLY,
+    SHED_SKIP,
+    ModerationJob,
+    ModerationQueue,
+)
+
+
+def make_job(guild_id, order, gate=None, keyword_match=False):
+    async def run():
+        order.append(guild_id)
+        if gate is not None:
+            await gate.wait()
+
+    return ModerationJob(guild_id=guild_id, run=run, keyword_match=keyword_match)
+
+
+async def drain(queue):
+    for _ in range(100):
+        if queue.depth() == 0 and queue.active() == 0:
+            return
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_round_robin_across_guilds():
+    queue = ModerationQueue(workers=1, guild_concurrency=1, guild_max_pending=10)
+    order = []
+    for _ in range(3):
+        await queue.submit(make_job(1, order))
+    await queue.submit(make_job(2, order))
+    await queue.submit(make_job(3, order))
+
+    queue.start()
+    await drain(queue)
+    await queue.stop()
+
+    assert order[:3] == [1, 2, 3]
+    assert queue.stats()["processed"] == 5
+
+
+@pytest.mark.asyncio
+async def test_guild_concurrency_cap_leaves_workers_for_other_guilds():
+    queue = ModerationQueue(workers=4, guild_concurrency=1, guild_max_pending=10)
+    gate = asyncio.Event()
+    order = []
+    queue.start()
+    for _ in range(3):
+        await queue.submit(make_job(1, order, gate))
+    await queue.submit(make_job(2, order, gate))
+    await asyncio.sleep(0.05)
+
+    assert queue.active(1) == 1
+    assert queue.active(2) == 1
+    assert queue.depth(1) == 2
+
+    gate.set()
+    await drain(queue)
+    await queue.stop()
+    assert sorted(order) == [1, 1, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_skip_policy_sheds_over_budget_guild():
+    queue = ModerationQueue(workers=1, guild_max_pending=2, shed_policy=SHED_SKIP)
+    order = []
+    results = [await queue.submit(make_job(1, order)) for _ in range(3)]
+    await queue.stop()
+
+    assert results == [QUEUED, QUEUED, SHED]
+    assert queue.stats()["shed"][SHED_SKIP] == 1
+
+
+@pytest.mark.asyncio
+async def test_keyword_only_policy_admits_keyword_matches():
+    queue = ModerationQueue(workers=1, guild_max_pending=1, shed_policy=SHED_KEYWORD_ONLY)
+    order = []
+    assert await queue.submit(make_job(1, order)) == QUEUED
+    assert await queue.submit(make_job(1, order)) == SHED
+    assert await queue.submit(make_job(1, order, keyword_match=True)) == QUEUED
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_defer_policy_retries_later():
+    queue = ModerationQueue(workers=1, guild_max_pending=1, shed_policy=SHED_DEFER, defer_seconds=0.01)
+    gate = asyncio.Event()
+    order = []
+    queue.start()
+    await queue.submit(make_job(1, order, gate))
+    await asyncio.sleep(0.01)
+    await queue.submit(make_job(1, order, gate))
+    assert await queue.submit(make_job(1, order, gate)) == DEFERRED
+
+    gate.set()
+    await asyncio.sleep(0.1)
+    await drain(queue)
+    await queue.stop()
+
+    assert order == [1, 1, 1]
+    assert queue.stats()["deferred"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_batching_guild_does_not_hold_workers_from_other_guilds():
+    queue = ModerationQueue(workers=2, guild_concurrency=2, guild_max_pending=10, guild_max_parked=4)
+    flushed = []
+
+    async def flush(key, items):
+        flushed.append(list(items))
+        return items
+
+    batcher = MicroBatcher(flush, window=60, max_size=4)
+    order = []
+
+    def batched_job(item):
+        async def run():
+            async with queue.parked():
+                order.append(await batcher.submit(1, item))
+
+        return ModerationJob(guild_id=1, run=run)
+
+    for item in range(3):
+        await queue.submit(batched_job(item))
+    await asyncio.sleep(0.01)
+    # Guild 1's batch is still filling, but both workers are free for guild 2
+    assert queue.parked_count(1) == 3 and queue.active(1) == 0
+    await queue.submit(make_job(2, order))
+    await queue.submit(make_job(2, order))
+    await asyncio.sleep(0.01)
+    assert order == [2, 2]
+
+    await queue.submit(batched_job(3))
+    await drain(queue)
+    await asyncio.sleep(0.01)
+    assert flushed == [[0, 1, 2, 3]]
+    assert sorted(order[2:]) == [0, 1, 2, 3]
+    assert queue.parked_count() == 0 and queue.stats()["processed"] == 6
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_parking_is_capped_per_guild():
+    queue = ModerationQueue(workers=2, guild_concurrency=1, guild_max_pending=10, guild_max_parked=1)
+    gate = asyncio.Event()
+    parked = []
+
+    def job():
+        async def run():
+            async with queue.parked() as is_parked:
+                parked.append(is_parked)
+                await gate.wait()
+
+        return ModerationJob(guild_id=1, run=run)
+
+    for _ in range(3):
+        await queue.submit(job())
+    await asyncio.sleep(0.01)
+    # The second job keeps its slot, so the third waits for it
+    assert parked == [True, False] and queue.depth(1) == 1
+
+    gate.set()
+    await drain(queue)
+    assert parked == [True, False, True]
+    await queue.stop()
@@ -0,0 +1,77 @@
+import pytest
+
+from cogs.aimod_helpers.pre_classifier import (
+    HashedNGramClassifier,
+    PreClassifierStage,
+    hashed_features,
+    training_examples,
+)
+
+BENIGN = ["good morning everyone", "anyone up for a game tonight", "thanks for the help", "lol that is funny"]
+SPAM = ["free nitro click here", "claim your free nitro gift now", "free steam gift click link", "nitro giveaway click"]
+
+
+def test_hashed_features_are_normalized_and_stable():
+    indices, values = hashed_features("Hello   WORLD")
+    again, _ = hashed_features("hello world")
+    assert sorted(indices) == sorted(again)
+    assert pytest.approx(float((values**2).sum())) == 1.0
+
+
+def test_classifier_learns_and_round_trips(tmp_path):
+    classifier = HashedNGramClassifier(n_features=2**12).fit(BENIGN + SPAM, [False] * 4 + [True] * 4, epochs=20)
+    assert classifier.predict_proba("free nitro click") > 0.5 > classifier.predict_proba("good game everyone")
+
+    path = tmp_path / "model.npz"
+    classifier.save(str(path))
+    loaded = HashedNGramClassifier.load(str(path))
+    assert loaded.predict_proba("free nitro click") == pytest.approx(classifier.predict_proba("free nitro click"))
+
+
+class FixedScore:
+    def __init__(self, score):
+        self.score = score
+
+    def predict_proba(self, text):
+        return self.score
+
+
+def test_stage_skips_samples_and_measures_disagreement():
+    stage = PreClassifierStage(FixedScore(0.01), threshold=0.05, sample_rate=0.0)
+    assert stage.evaluate("hi") == (True, 0.01)
+
+    stage.sample_rate = 1.0
+    skip, score = stage.evaluate("hi")
+    assert not skip and score == 0.01
+    stage.record_sample({"violation": True})
+
+    assert PreClassifierStage(FixedScore(0.9), threshold=0.05).evaluate("spam") == (False, None)
+    stats = stage.stats()
+    assert stats["skipped"] == 1 and stats["sampled"] == 1
+    assert stats["skip_rate"] == 0.5 and stats["disagreement_rate"] == 1.0
+
+
+def test_disabled_stage_never_skips_and_training_rows_are_filtered():
+    assert PreClassifierStage(None).evaluate("anything") == (False, None)
+    rows = [
+        {"message_content_snippet": "spam", "decision": {"violation": True}},
+        {"message_content_snippet": "oops", "decision": {"error": "Failed to get valid AI decision"}},
+        {"message_content_snippet": "", "decision": {"violation": False}},
+    ]
+    assert training_examples(rows) == (["spam"], [True])
+
+
+class RecordingScore(FixedScore):
+    def predict_proba(self, text):
+        self.text = text
+        return self.score
+
+
+def test_training_and_scoring_see_the_same_prefix():
+    message = "free nitro " * 20
+    snippet = message[:100] + "..."
+    texts, _ = training_examples([{"message_content_snippet": snippet, "decision": {"violation": True}}])
+
+    classifier = RecordingScore(0.9)
+    PreClassifierStage(classifier).evaluate(message)
+    assert texts == [classifier.text] == [message[:100]]
@@ -0,0 +1,19 @@
+from cogs.aimod_helpers.prompt_cache import format_system_prompt, system_message
+from cogs.aimod_helpers.system_prompt import BATCH_PROMPT_SUFFIX
+
+
+def test_system_prompt_is_memoized_per_rules_text():
+    first = format_system_prompt("1. Be nice")
+    assert format_system_prompt("1. Be nice") is first
+    assert "1. Be nice" in first
+    assert format_system_prompt("1. Be nice", BATCH_PROMPT_SUFFIX).endswith(BATCH_PROMPT_SUFFIX)
+
+
+def test_cache_control_only_for_anthropic_models():
+    plain = system_message("github_copilot/gpt-4.1", "rules")
+    assert plain == {"role": "system", "content": format_system_prompt("rules")}
+
+    marked = system_message("openrouter/anthropic/claude-sonnet-4", "rules")
+    (block,) = marked["content"]
+    assert block["text"] == format_system_prompt("rules")
+    assert block["cache_control"] == {"type": "ephemeral"}
@@ -0,0 +1,119 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from cogs.messagerate_helpers.rate_counter import MessageRateCounter
+from cogs.messagerate_helpers.redis_counter import RedisRateCounter
+from cogs.messagerate_helpers.slowmode_controller import EwmaSlowmodeController, SlowmodeCurve
+
+
+class FakePipeline:
+    def __init__(self, store):
+        self.store = store
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def incrby(self, key, amount):
+        self.commands.append(("incrby", key, amount))
+
+    def expire(self, key, seconds):
+        self.commands.append(("expire", key, seconds))
+
+    def mget(self, keys):
+        self.commands.append(("mget", keys))
+
+    async def execute(self):
+        results = []
+        for command, *args in self.commands:
+            if command == "incrby":
+                self.store[args[0]] = self.store.get(args[0], 0) + args[1]
+                results.append(self.store[args[0]])
+            elif command == "expire":
+                results.append(True)
+            else:
+                results.append([str(self.store[key]).encode() if key in self.store else None for key in args[0]])
+        return results
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self.store)
+
+
+@pytest.mark.asyncio
+async def test_counts_are_shared_across_processes():
+    redis = FakeRedis()
+    first, second = RedisRateCounter(span=60, bucket=5), RedisRateCounter(span=60, bucket=5)
+    for offset in range(10):
+        first.record(1, now=1000 + offset, guild_id=9)
+        second.record(1, count=2, now=1000 + offset, guild_id=9)
+    second.record(2, now=1005, guild_id=9)
+
+    with patch("cogs.messagerate_helpers.redis_counter.get_redis", AsyncMock(return_value=redis)):
+        assert await first.sync([1], [9], now=1010)
+        assert await second.sync([1], [9], now=1010)
+        assert await first.sync([1], [9], now=1010)
+
+    assert first.count(1, 60, now=1010) == 30
+    assert first.guild_count(9, 60, now=1010) == 31
+    # Unsynced local messages count straight away
+    first.record(1, now=1011)
+    assert first.count(1, 60, now=1011) == 31
+    assert first.stats()["syncs"] == 2
+
+
+@pytest.mark.asyncio
+async def test_falls_back_to_local_counts_without_redis():
+    counter = RedisRateCounter(span=60, bucket=5)
+    counter.record(1, count=4, now=1000)
+
+    with patch("cogs.messagerate_helpers.redis_counter.get_redis", AsyncMock(return_value=None)):
+        assert not await counter.sync([1], now=1000)
+
+    assert counter.per_minute(1, 60, now=1000) == 4
+    assert counter.evict_idle(now=1100) == 1
+    assert counter.stats()["pending_buckets"] == 0
+
+
+def test_partial_bucket_rates_match_in_memory_counter():
+    redis_counter = RedisRateCounter(span=120, bucket=5)
+    memory_counter = MessageRateCounter(span=120, clock=lambda: 0)
+    redis_controller, memory_controller = EwmaSlowmodeController(), EwmaSlowmodeController()
+    curve = SlowmodeCurve()
+
+    # A steady 60 msg/min channel, evaluated every 5 seconds off the bucket boundaries
+    for second in range(1000, 1300):
+        redis_counter.record(1, now=second)
+        memory_counter.record(1, now=second)
+        if second % 5 == 2:
+            redis_controller.target_slowmode(1, redis_counter, curve, 0, now=second + 0.5)
+            memory_controller.target_slowmode(1, memory_counter, curve, 0, now=second + 0.5)
+
+    assert redis_counter.per_minute(1, 5, now=1299.5) == pytest.approx(60, rel=0.1)
+    assert memory_controller.estimate(1) == pytest.approx(60, rel=0.1)
+    assert redis_controller.estimate(1) == pytest.approx(60, rel=0.1)
+
+
+@pytest.mark.asyncio
+async def test_unshared_channels_stay_local():
+    redis = FakeRedis()
+    counter = RedisRateCounter(span=60, bucket=5)
+    counter.record(1, now=1000, guild_id=9)
+    counter.record(2, count=3, now=1000, guild_id=9, share=False)
+
+    with patch("cogs.messagerate_helpers.redis_counter.get_redis", AsyncMock(return_value=redis)):
+        assert await counter.sync([1], [9], now=1001)
+
+    assert set(redis.store) == {"msgrate:c:1:200", "msgrate:g:9:200"}
+    assert redis.store["msgrate:g:9:200"] == 4
+    assert counter.count(2, 60, now=1001) == 3
+    assert counter.evict_idle(now=1100) == 2
+    assert counter.stats()["local_buckets"] == 0
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from cogs.aimod_helpers.replay import ReplayCase, ReplayHarness, load_jsonl
+from cogs.core_ai_cog import CoreAICog
+
+
+class FakeClient:
+    def __init__(self):
+        self.models = []
+
+    async def generate_content(self, model, messages, **kwargs):
+        return self.respond(model, messages)
+
+    def respond(self, model, messages):
+        self.models.append(model)
+        content = messages[-1]["content"]
+        violation = "nitro" in content
+        decision = {
+            "reasoning": "test",
+            "violation": violation,
+            "rule_violated": "2" if violation else "None",
+            "action": "DELETE" if violation else "IGNORE",
+        }
+        return SimpleNamespace(text=json.dumps(decision), usage={"prompt_tokens": 10, "completion_tokens": 5})
+
+    async def stream_content(self, model, messages, on_usage=None, **kwargs):
+        response = self.respond(model, messages)
+        for start in range(0, len(response.text), 16):
+            yield response.text[start : start + 16]
+        if on_usage is not None:
+            on_usage(response.usage)
+
+
+@pytest.fixture
+def cog():
+    with patch("cogs.core_ai_cog.get_litellm_client", side_effect=ValueError("no key")):
+        cog = CoreAICog(MagicMock())
+    cog.genai_client = FakeClient()
+    return cog
+
+
+def test_load_jsonl(tmp_path):
+    path = tmp_path / "corpus.jsonl"
+    path.write_text('{"id": "a", "content": "hi", "expected": {"violation": false}}\n\n{"content": "yo"}\n')
+    cases = load_jsonl(str(path))
+    assert [case.case_id for case in cases] == ["a", "3"]
+    assert cases[0].expected == {"violation": False}
+
+
+@pytest.mark.asyncio
+async def test_replay_reports_latency_tokens_and_diffs(cog):
+    cases = [
+        ReplayCase("1", "free nitro here", guild_id=5, expected={"violation": True, "action": "DELETE"}),
+        ReplayCase("2", "hello there friends", guild_id=5, expected={"violation": True, "action": "BAN"}),
+        ReplayCase("3", "nitro nitro", guild_id=6, keyword_rules=[{"keywords": ["nitro"]}]),
+    ]
+    harness = ReplayHarness(cog, model="openai/replay-model", concurrency=2)
+    report = await harness.run(cases)
+    summary = report.summary()
+
+    assert cog.genai_client.models == ["openai/replay-model"] * 3
+    assert summary["cases"] == 3 and summary["errors"] == 0
+    assert summary["llm_calls"] == 3
+    assert summary["prompt_tokens"] == 30 and summary["completion_tokens"] == 15
+    assert summary["keyword_matches"] == 1
+    assert summary["compared"] == 2 and summary["diffs"] == 1
+    assert report.results[1].diff() == {"violation": (True, False), "action": ("BAN", "IGNORE")}
+    assert "Agreement: 50.0%" in report.format()
+
+
+@pytest.mark.asyncio
+async def test_replay_counts_streamed_calls(cog):
+    cog.streaming_enabled = True
+    cases = [
+        ReplayCase("1", "free nitro here", guild_id=5, expected={"violation": True, "action": "DELETE"}),
+        ReplayCase("2", "hello there friends", guild_id=5),
+    ]
+    report = await ReplayHarness(cog, model="openai/replay-model").run(cases)
+    summary = report.summary()
+
+    assert summary["errors"] == 0 and summary["diffs"] == 0
+    assert summary["llm_calls"] == 2
+    assert summary["prompt_tokens"] == 20 and summary["completion_tokens"] == 10
+    assert report.results[0].decision["action"] == "DELETE"
@@ -0,0 +1,92 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from cogs.messagerate_helpers.rate_counter import MessageRateCounter
+from cogs.messagerate_helpers.slowmode_controller import (
+    CoalescedSlowmodeEditor,
+    EwmaSlowmodeController,
+    SlowmodeController,
+    SlowmodeCurve,
+    ThresholdController,
+)
+
+CURVE = SlowmodeCurve(levels=((3, 2), (10, 5)), hysteresis=0.25, dwell=120)
+
+
+def run(controller, counter, rates, start=0, current=0, step=30):
+    """Feed ``rates`` (msg/min for each ``step`` seconds) and return the slowmode chosen after each step."""
+    chosen = []
+    now = start
+    for rate in rates:
+        per_second = rate / 60
+        for second in range(step):
+            # Spread the messages evenly over the step
+            due = int((second + 1) * per_second) - int(second * per_second)
+            if due:
+                counter.record(1, count=due, now=now + second)
+        now += step
+        current = controller.target_slowmode(1, counter, CURVE, current, now=now - 1)
+        chosen.append(current)
+    return chosen
+
+
+def test_ewma_holds_steady_near_a_threshold_where_thresholds_flap():
+    rates = [11, 9, 11, 9, 11, 9, 11, 9]
+    flapping = run(ThresholdController(), MessageRateCounter(), rates, step=60)
+    steady = run(EwmaSlowmodeController(), MessageRateCounter(), rates, step=60)
+
+    assert flapping == [5, 2] * 4
+    assert steady == [5] * 8
+
+
+def test_ewma_escalates_on_surge_and_steps_down_after_dwell():
+    controller = EwmaSlowmodeController()
+    counter = MessageRateCounter()
+    chosen = run(controller, counter, [1, 1, 60], step=10)
+    assert chosen[-1] == 5
+
+    quiet = run(controller, counter, [0] * 12, start=30, current=5, step=10)
+    # Held for the dwell time, then released
+    assert quiet[:8] == [5] * 8
+    assert quiet[-1] == 0
+
+
+def test_curve_parse_and_config_round_trip():
+    curve = SlowmodeCurve.parse("3:2,10:5,30:10")
+    assert curve.level_for(2) == 0 and curve.level_for(10) == 5 and curve.level_for(45) == 10
+    assert SlowmodeCurve.from_config(curve.to_config(), CURVE) == curve
+    assert SlowmodeCurve.from_config({"levels": [[5, 1], [2, 3]]}, CURVE) == CURVE
+    assert SlowmodeCurve.from_config({"levels": [[5, 1], [2, 3]]}, None) is None
+    assert SlowmodeCurve.from_config(curve.to_config(), None) == curve
+    with pytest.raises(ValueError):
+        SlowmodeCurve.parse("10:5,3:2")
+    with pytest.raises(ValueError):
+        SlowmodeCurve.parse("fast")
+
+
+@pytest.mark.asyncio
+async def test_editor_coalesces_targets_while_an_edit_is_in_flight():
+    release = asyncio.Event()
+    applied = []
+
+    async def edit(channel, slowmode):
+        applied.append(slowmode)
+        await release.wait()
+
+    editor = CoalescedSlowmodeEditor(edit)
+    channel = SimpleNamespace(id=1)
+    first = asyncio.create_task(editor.apply(channel, 2))
+    await asyncio.sleep(0)
+    assert [await editor.apply(channel, slowmode) for slowmode in (5, 10, 5)] == [False, False, False]
+    release.set()
+
+    assert await first is True
+    assert applied == [2, 5]
+    assert editor.stats() == {"edits": 2, "coalesced": 3, "in_flight": 0}
+
+
+def test_controllers_must_implement_target_slowmode():
+    with pytest.raises(TypeError):
+        SlowmodeController()
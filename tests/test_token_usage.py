@@ -0,0 +1,53 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from cogs.aimod_helpers.token_usage import TokenUsageRecorder, estimate_usage
+
+
+@pytest.mark.asyncio
+async def test_flush_rolls_up_usage_per_guild_and_model():
+    recorder = TokenUsageRecorder()
+    recorder.record(1, "model-a", {"prompt_tokens": 100, "completion_tokens": 10, "cached_tokens": 80})
+    recorder.record(1, "model-a", {"prompt_tokens": 50, "completion_tokens": 5})
+    recorder.record(2, "model-b", None)
+
+    add = AsyncMock(return_value=True)
+    with patch("cogs.aimod_helpers.token_usage.add_token_usage", new=add):
+        assert await recorder.flush()
+        assert await recorder.flush()  # nothing left to write
+
+    add.assert_awaited_once()
+    rows = {(row["guild_id"], row["model"]): row for row in add.await_args.args[0]}
+    assert rows[(1, "model-a")]["requests"] == 2
+    assert rows[(1, "model-a")]["prompt_tokens"] == 150
+    assert rows[(1, "model-a")]["cached_tokens"] == 80
+    assert rows[(2, "model-b")]["requests"] == 1
+    assert recorder.guild_totals(1)["completion_tokens"] == 15
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_rows_for_retry():
+    recorder = TokenUsageRecorder()
+    recorder.record(1, "model-a", {"prompt_tokens": 100, "completion_tokens": 10})
+
+    with patch("cogs.aimod_helpers.token_usage.add_token_usage", new=AsyncMock(return_value=False)):
+        assert not await recorder.flush()
+    recorder.record(1, "model-a", {"prompt_tokens": 1, "completion_tokens": 1})
+
+    add = AsyncMock(return_value=True)
+    with patch("cogs.aimod_helpers.token_usage.add_token_usage", new=add):
+        await recorder.flush()
+    (row,) = add.await_args.args[0]
+    assert row["requests"] == 2 and row["prompt_tokens"] == 101
+    assert recorder.stats()["failed_flushes"] == 1
+
+
+def test_estimate_usage_counts_text_parts_only():
+    messages = [
+        {"role": "system", "content": [{"type": "text", "text": "a" * 40}]},
+        {
+            "role": "user",
+            "content": [{"type": "text", "text": "b" * 9}, {"type": "image_url", "image_url": {"url": "x" * 999}}],
+        },
+    ]
+    assert estimate_usage(messages, "c" * 10) == {"prompt_tokens": 13, "completion_tokens": 3}
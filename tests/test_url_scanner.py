@@ -0,0 +1,131 @@
+import os
+import time
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from cogs import botdetect
+from cogs.botdetect import BotDetectCog
+from cogs.botdetect_helpers.detector import BotDetector
+from cogs.botdetect_helpers.url_scanner import (
+    DEFAULT_BLOCKLIST_PATH,
+    DomainBlocklist,
+    UrlScanner,
+    iter_urls,
+    normalize_host,
+    registrable_domain,
+)
+
+
+@pytest.fixture
+def blocklist_file(tmp_path):
+    path = tmp_path / "domains.txt"
+    path.write_text("# comment\nsteamcommunlty.com\nBIT.LY.  # shortener\n\nevil.co.uk\n")
+    return path
+
+
+def test_hosts_are_normalized():
+    assert normalize_host("https://discord.com@Login.SteamCommunlty.com.:443/id?x=1") == "login.steamcommunlty.com"
+    assert normalize_host("bit.ly/abc") == "bit.ly"
+    assert normalize_host("www.Example.com#frag") == "www.example.com"
+    assert normalize_host("https://bücher.de/") == "xn--bcher-kva.de"
+    assert normalize_host("https:///path") is None
+
+
+def test_registrable_domain():
+    assert registrable_domain("a.b.example.com") == "example.com"
+    assert registrable_domain("login.evil.co.uk") == "evil.co.uk"
+    assert registrable_domain("co.uk") == "co.uk"
+    assert registrable_domain("10.0.0.1") == "10.0.0.1"
+
+
+def test_tokenizer_finds_links_in_one_pass():
+    content = "see [this](https://a.example/x) and bit.ly/y, <https://b.example> but not e.g. user@mail.example"
+    assert list(iter_urls(content)) == ["https://a.example/x", "bit.ly/y", "https://b.example"]
+    assert list(iter_urls("no links here")) == []
+
+
+def test_blocklist_matches_domains_and_subdomains(blocklist_file):
+    blocklist = DomainBlocklist(str(blocklist_file))
+
+    assert len(blocklist) == 3
+    assert blocklist.match("steamcommunlty.com") == "steamcommunlty.com"
+    assert blocklist.match("login.steamcommunlty.com") == "steamcommunlty.com"
+    assert blocklist.match("bit.ly") == "bit.ly"
+    assert blocklist.match("steamcommunity.com") is None
+    assert blocklist.match("notevil.co.uk") is None
+    assert len(DomainBlocklist(str(blocklist_file) + ".missing")) == 0
+
+
+def test_scanner_reports_blocked_hosts_and_caches_verdicts(blocklist_file):
+    scanner = UrlScanner(DomainBlocklist(str(blocklist_file)))
+
+    content = "Free nitro https://discord.com@login.steamcommunlty.com/gift and https://login.steamcommunlty.com/x"
+    blocked = scanner.scan(content)
+    assert [(verdict.host, verdict.domain, verdict.blocked_by) for verdict in blocked] == [
+        ("login.steamcommunlty.com", "steamcommunlty.com", "steamcommunlty.com")
+    ]
+    assert scanner.scan("https://store.steampowered.com/app/1") == []
+    assert scanner.scan(content)
+    assert scanner.stats()["cache_hits"] == 1
+
+
+def test_scanner_picks_up_blocklist_edits(blocklist_file):
+    blocklist = DomainBlocklist(str(blocklist_file), reload_interval=0)
+    scanner = UrlScanner(blocklist)
+    assert scanner.scan("https://new-scam.example/") == []
+
+    blocklist_file.write_text("new-scam.example\n")
+    later = time.time() + 5
+    os.utime(blocklist_file, (later, later))
+
+    assert [verdict.host for verdict in scanner.scan("https://new-scam.example/")] == ["new-scam.example"]
+
+
+@pytest.mark.asyncio
+async def test_on_message_flags_blocked_links(blocklist_file):
+    config = {"enabled": True, "keywords": [], "action": "delete"}
+    with (
+        patch.object(botdetect, "get_all_botdetect_config", AsyncMock(return_value=config)),
+        patch.object(botdetect.UrlScanner, "from_env", lambda: UrlScanner(DomainBlocklist(str(blocklist_file)))),
+    ):
+        cog = BotDetectCog(MagicMock())
+        cog._handle_bot_detection = AsyncMock()
+        try:
+            message = SimpleNamespace(
+                author=SimpleNamespace(id=2, bot=False, roles=[]),
+                guild=SimpleNamespace(id=1),
+                content="claim at bit.ly/abc",
+            )
+            await cog.on_message(message)
+        finally:
+            cog.cog_unload()
+
+    _, keywords, _ = cog._handle_bot_detection.await_args.args
+    assert keywords == ["bit.ly (blocked link)"]
+
+
+def test_name_entries_match_any_suffix(tmp_path):
+    path = tmp_path / "domains.txt"
+    path.write_text("discord-nitro.*\nbad.example\n")
+    blocklist = DomainBlocklist(str(path))
+
+    assert blocklist.match("discord-nitro.gift") == "discord-nitro.*"
+    assert blocklist.match("claim.discord-nitro.co.uk") == "discord-nitro.*"
+    assert blocklist.match("discord-nitro.example.com") is None
+    assert blocklist.match("nitro.com") is None
+
+
+def test_default_config_catches_lookalikes_but_not_steam():
+    scanner = UrlScanner(DomainBlocklist(DEFAULT_BLOCKLIST_PATH))
+    detector = BotDetector(botdetect.default_botdetect_config())
+
+    for link in ("https://steamcommunlty.net/tradeoffer", "https://discord-nitro.gift/claim"):
+        assert scanner.scan(link), link
+    for link in (
+        "https://steamcommunity.com/id/someone",
+        "https://store.steampowered.com/app/730",
+        "https://bit.ly/club-rules",
+    ):
+        assert scanner.scan(link) == [] and detector.detect(link) == [], link